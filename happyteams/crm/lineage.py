@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""Project lineage queries.
+
+``Project.predecessor`` links follow-on contracts into chains.  Each query
+here walks a chain with a single recursive common table expression, so the
+cost does not grow with the number of hops.  ``Project.root`` additionally
+caches the first project of each chain.
+
+``MAX_DEPTH`` bounds the walk in case a cycle was written around
+``Project.clean``.
+"""
+from __future__ import unicode_literals
+
+from django.db import connection
+
+from .models import Project
+
+MAX_DEPTH = 1000
+
+# stay under SQLite's limit on query parameters
+CHUNK_SIZE = 500
+
+ANCESTORS = """
+WITH RECURSIVE lineage (id, depth) AS (
+    SELECT predecessor_id, 1 FROM {table}
+    WHERE id = %s AND predecessor_id IS NOT NULL
+    UNION ALL
+    SELECT project.predecessor_id, lineage.depth + 1
+    FROM {table} project JOIN lineage ON project.id = lineage.id
+    WHERE project.predecessor_id IS NOT NULL AND lineage.depth < %s
+)
+SELECT {table}.* FROM {table} JOIN lineage ON {table}.id = lineage.id
+ORDER BY lineage.depth DESC
+"""
+
+SUCCESSORS = """
+WITH RECURSIVE lineage (id, depth) AS (
+    SELECT id, 1 FROM {table} WHERE predecessor_id = %s
+    UNION ALL
+    SELECT project.id, lineage.depth + 1
+    FROM {table} project JOIN lineage ON project.predecessor_id = lineage.id
+    WHERE lineage.depth < %s
+)
+SELECT {table}.* FROM {table} JOIN lineage ON {table}.id = lineage.id
+ORDER BY lineage.depth, {table}.id
+"""
+
+LINEAGES = """
+WITH RECURSIVE up (origin, id, predecessor_id, depth) AS (
+    SELECT id, id, predecessor_id, 0 FROM {table} WHERE id IN ({ids})
+    UNION ALL
+    SELECT up.origin, project.id, project.predecessor_id, up.depth + 1
+    FROM {table} project JOIN up ON project.id = up.predecessor_id
+    WHERE up.depth < %s
+),
+down (origin, id, depth) AS (
+    SELECT origin, id, 0 FROM up WHERE predecessor_id IS NULL
+    UNION ALL
+    SELECT down.origin, project.id, down.depth + 1
+    FROM {table} project JOIN down ON project.predecessor_id = down.id
+    WHERE down.depth < %s
+)
+SELECT origin, id FROM down ORDER BY origin, depth, id
+"""
+
+
+def _sql(query, **kwargs):
+    return query.format(table=Project._meta.db_table, **kwargs)
+
+
+def ancestors(project):
+    """Projects ``project`` follows on from, from the root down."""
+    return list(Project.objects.raw(
+        _sql(ANCESTORS), [getattr(project, 'pk', project), MAX_DEPTH]))
+
+
+def successors(project):
+    """Every follow-on of ``project``, nearest first."""
+    return list(Project.objects.raw(
+        _sql(SUCCESSORS), [getattr(project, 'pk', project), MAX_DEPTH]))
+
+
+def lineages(projects):
+    """Return ``{project_id: [project_id, ...]}`` giving the whole chain
+    (root first) each of ``projects`` belongs to, with one query per
+    ``CHUNK_SIZE`` projects.
+    """
+    ids = [getattr(project, 'pk', project) for project in projects]
+    found = dict((pk, []) for pk in ids)
+    with connection.cursor() as cursor:
+        for i in range(0, len(ids), CHUNK_SIZE):
+            chunk = ids[i:i + CHUNK_SIZE]
+            cursor.execute(
+                _sql(LINEAGES, ids=', '.join(['%s'] * len(chunk))),
+                chunk + [MAX_DEPTH, MAX_DEPTH])
+            for origin, pk in cursor.fetchall():
+                found[origin].append(pk)
+    return found
+
+
+def lineage_roots(projects):
+    """Return ``{project_id: root_id}`` for each of ``projects``."""
+    return dict((pk, chain[0]) for pk, chain in lineages(projects).items()
+                if chain)
+
+
+def refresh_roots():
+    """Recompute the cached ``root`` of every project."""
+    projects = list(Project.objects.values_list('pk', 'root_id'))
+    roots = lineage_roots(pk for pk, _ in projects)
+    by_root = {}
+    for pk, cached in projects:
+        if roots.get(pk, pk) != cached:
+            by_root.setdefault(roots.get(pk, pk), []).append(pk)
+    for root, pks in by_root.items():
+        Project.objects.filter(pk__in=pks).update(root=root)
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 21:58
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_roots(apps, schema_editor):
+    Project = apps.get_model('crm', 'Project')
+    predecessors = dict(Project.objects.values_list('pk', 'predecessor_id'))
+    roots = {}
+
+    def root(pk):
+        if pk not in roots:
+            predecessor = predecessors[pk]
+            roots[pk] = root(predecessor) if predecessor else pk
+        return roots[pk]
+
+    for pk in predecessors:
+        Project.objects.filter(pk=pk).update(root=root(pk))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0002_project_skills'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='root',
+            field=models.ForeignKey(blank=True, editable=False, help_text="The first project in this project's chain of follow-ons.", null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lineage_members', to='crm.Project'),
+        ),
+        migrations.RunPython(populate_roots, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+
+from resources.models import Skill
 
 import datetime
 
@@ -31,11 +34,78 @@ class Project(models.Model):
         help_text='What is the project\'s anticipated (or actual) start date?')
     end = models.DateField(
         help_text='What is the project\'s anticipated (or actual) end date?')
+    skills = models.ManyToManyField(Skill, blank=True,
+        help_text='Which skills will the team use on this project?')
+    root = models.ForeignKey('self', null=True, blank=True, editable=False,
+        on_delete=models.SET_NULL, related_name='lineage_members',
+        help_text='The first project in this project\'s chain of follow-ons.')
+
+    def clean(self):
+        if self.pk is None or self.predecessor_id is None:
+            return
+        from .lineage import ancestors
+
+        # a cycle needs the predecessor to already be in this lineage
+        if (self.predecessor_id == self.pk or (
+                self.predecessor.root_id in (None, self.root_id) and
+                self.pk in [p.pk for p in ancestors(self.predecessor_id)])):
+            raise ValidationError(
+                'A project cannot follow on from itself or one of its '
+                'follow-ons.')
+
+    def save(self, *args, **kwargs):
+        from .lineage import lineage_roots, successors
+
+        self.clean()
+        old_root = self.root_id
+        if self.predecessor_id is not None:
+            self.root_id = (self.predecessor.root_id or
+                            lineage_roots([self.predecessor_id]).get(
+                                self.predecessor_id))
+        else:
+            self.root_id = self.pk
+        if self.pk is not None and self.root_id == old_root:
+            return super(Project, self).save(*args, **kwargs)
+
+        with transaction.atomic():
+            created = self.pk is None
+            super(Project, self).save(*args, **kwargs)
+            if self.root_id is None:
+                self.root_id = self.pk
+                super(Project, self).save(update_fields=['root'])
+            elif not created:
+                # re-linked; move every follow-on to the new lineage
+                Project.objects.filter(
+                    pk__in=[p.pk for p in successors(self)]).update(
+                        root=self.root_id)
+
+    def ancestors(self):
+        """Projects this one follows on from, from the root down."""
+        from .lineage import ancestors
+
+        return ancestors(self)
+
+    def successors(self):
+        """Every follow-on of this project, nearest first."""
+        from .lineage import successors
+
+        return successors(self)
+
+    def lineage_root(self):
+        """The first project of this project's chain of follow-ons."""
+        if self.root_id is not None:
+            return self.root
+        return (self.ancestors() or [self])[0]
 
     def team_enjoyment(self, month=datetime.date.today()):
         # based on the team member assignments, what is the overall team's
         # level of enjoyment with the project?
-        return 1.0
+        from planning.enjoyment import score_enjoyment
+        from planning.metriccache import cached
+
+        return cached('project', self.pk, 'team_enjoyment', month, lambda:
+            score_enjoyment(month, projects=[self.pk]).project(
+                self.pk, month))
 
 
 class BudgetIncrement(models.Model):
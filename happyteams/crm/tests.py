@@ -1,6 +1,69 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from django.core.exceptions import ValidationError
 from django.test import TestCase
 
-# Create your tests here.
+from .lineage import lineage_roots, lineages, refresh_roots
+from .models import Project, Sponsor
+
+import datetime
+
+
+class ProjectLineageTests(TestCase):
+
+    def setUp(self):
+        self.sponsor = Sponsor.objects.create(name='Acme')
+        self.base = self.project('Base')
+        self.option = self.project('Option', self.base)
+        self.renewal = self.project('Renewal', self.option)
+        self.spinoff = self.project('Spinoff', self.option)
+        self.other = self.project('Other')
+
+    def project(self, name, predecessor=None):
+        return Project.objects.create(
+            name=name, sponsor=self.sponsor, predecessor=predecessor,
+            status='active', start=datetime.date(2017, 1, 1),
+            end=datetime.date(2017, 12, 31))
+
+    def test_single_query_walks(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.renewal.ancestors(),
+                             [self.base, self.option])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.base.successors(),
+                             [self.option, self.renewal, self.spinoff])
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                lineages([self.spinoff, self.other.pk]),
+                {self.spinoff.pk: [self.base.pk, self.option.pk,
+                                   self.renewal.pk, self.spinoff.pk],
+                 self.other.pk: [self.other.pk]})
+
+    def test_cached_root_follows_relinking(self):
+        self.assertEqual(self.renewal.root, self.base)
+        self.assertEqual(self.other.lineage_root(), self.other)
+
+        self.option.predecessor = self.other
+        self.option.save()
+        self.assertEqual(
+            list(Project.objects.filter(root=self.other).order_by('pk')),
+            [self.option, self.renewal, self.spinoff, self.other])
+        self.assertEqual(Project.objects.get(pk=self.base.pk).root,
+                         self.base)
+
+        Project.objects.update(root=None)
+        self.assertEqual(
+            Project.objects.get(pk=self.spinoff.pk).lineage_root(),
+            self.other)
+        refresh_roots()
+        self.assertEqual(lineage_roots(Project.objects.all()), dict(
+            Project.objects.values_list('pk', 'root_id')))
+
+    def test_cycles_are_rejected(self):
+        self.base.predecessor = self.renewal
+        with self.assertRaises(ValidationError):
+            self.base.save()
+        self.base.predecessor = self.base
+        with self.assertRaises(ValidationError):
+            self.base.save()
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""Query count and timing instrumentation.
+
+``profile`` (a context manager and decorator) and
+``InstrumentationMiddleware`` record, for a block of code or a request, the
+number of queries run, the time spent in SQL, the slowest statements and the
+time left over for Python.  Every profile is logged as one JSON line on the
+``happyteams.instrumentation`` logger and added to per-name totals served by
+the ``stats`` view.
+
+Views declare how many queries they may run with ``query_budget``.  Going
+over budget logs a warning, and raises ``QueryBudgetExceeded`` when
+``INSTRUMENTATION['ENFORCE_BUDGETS']`` is set (as ``happyteams.runner``
+does for ``manage.py test``) so the test that made the request fails.
+
+Requests that do not resolve to a view are all totalled under
+``UNRESOLVED``, so stray URLs cannot grow the totals without bound.
+
+Configured through the ``INSTRUMENTATION`` setting::
+
+    INSTRUMENTATION = {
+        'ENABLED': False,  # install the middleware; logs every query
+        'SLOWEST': 5,  # statements kept per profile
+        'ENFORCE_BUDGETS': False,
+    }
+"""
+from __future__ import unicode_literals
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import JsonResponse
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'SLOWEST': 5,
+    'ENFORCE_BUDGETS': False,
+}
+
+UNRESOLVED = '<unresolved>'
+
+_lock = threading.Lock()
+_totals = {}
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def get_option(name):
+    return getattr(settings, 'INSTRUMENTATION', {}).get(name, DEFAULTS[name])
+
+
+class profile(object):
+    """Record the queries and time spent in a block::
+
+        with profile('coverage') as result:
+            coverage_matrix(...)
+        result.queries
+
+    or as a decorator, ``@profile('coverage')``.  Profiles may be nested.
+    """
+
+    def __init__(self, name, log=True):
+        self.name = name
+        self.log = log
+
+    def __call__(self, function):
+        @wraps(function)
+        def profiled(*args, **kwargs):
+            # a fresh profile per call so recursion and threads are safe
+            with profile(self.name, self.log):
+                return function(*args, **kwargs)
+        return profiled
+
+    def __enter__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.slowest = []
+        self._marks = []
+        for connection in connections.all():
+            # the connection's own query log is capped; swap in an
+            # unbounded one unless an outer profile already has
+            swapped = not getattr(connection, '_profiling', 0)
+            if swapped:
+                connection._saved_log = (connection.queries_log,
+                                         connection.force_debug_cursor)
+                connection.queries_log = deque()
+                connection.force_debug_cursor = True
+            connection._profiling = getattr(connection, '_profiling', 0) + 1
+            self._marks.append((connection, len(connection.queries_log)))
+        self._started = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.time() - self._started
+        statements = []
+        for connection, mark in self._marks:
+            statements.extend(list(connection.queries_log)[mark:])
+            connection._profiling -= 1
+            if not connection._profiling:
+                log, connection.force_debug_cursor = connection._saved_log
+                log.extend(connection.queries_log)
+                connection.queries_log = log
+        self.queries = len(statements)
+        self.sql_seconds = sum(float(query['time']) for query in statements)
+        self.python_seconds = max(0.0, self.seconds - self.sql_seconds)
+        self.slowest = [
+            {'sql': query['sql'], 'seconds': float(query['time'])}
+            for query in sorted(statements, key=lambda q: -float(q['time']))
+            [:get_option('SLOWEST')]]
+        if self.log:
+            record(self)
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'queries': self.queries,
+            'seconds': round(self.seconds, 6),
+            'sql_seconds': round(self.sql_seconds, 6),
+            'python_seconds': round(self.python_seconds, 6),
+            'slowest': self.slowest,
+        }
+
+
+def record(result):
+    """Log a finished profile and add it to the totals for its name."""
+    data = result.as_dict()
+    logger.info(json.dumps(data), extra={'profile': data})
+    with _lock:
+        totals = _totals.setdefault(result.name, {
+            'count': 0, 'queries': 0, 'seconds': 0.0, 'sql_seconds': 0.0,
+            'max_queries': 0, 'max_seconds': 0.0})
+        totals['count'] += 1
+        totals['queries'] += result.queries
+        totals['seconds'] += result.seconds
+        totals['sql_seconds'] += result.sql_seconds
+        totals['max_queries'] = max(totals['max_queries'], result.queries)
+        totals['max_seconds'] = max(totals['max_seconds'], result.seconds)
+
+
+def totals():
+    """Return the per-name totals recorded by this process."""
+    with _lock:
+        found = dict((name, dict(values)) for name, values in _totals.items())
+    for values in found.values():
+        values['mean_queries'] = float(values['queries']) / values['count']
+        values['mean_seconds'] = values['seconds'] / values['count']
+    return found
+
+
+def reset():
+    with _lock:
+        _totals.clear()
+
+
+def query_budget(queries):
+    """Declare the most queries a view may run per request."""
+    def decorator(view):
+        view.query_budget = queries
+        return view
+    return decorator
+
+
+class InstrumentationMiddleware(object):
+    """Profile every request under the name of the view that served it."""
+
+    def __init__(self, get_response):
+        if not get_option('ENABLED'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with profile(UNRESOLVED) as result:
+            response = self.get_response(request)
+            match = getattr(request, 'resolver_match', None)
+            if match is not None:
+                result.name = match.view_name
+        response['Server-Timing'] = 'sql;dur=%.1f, python;dur=%.1f' % (
+            result.sql_seconds * 1000, result.python_seconds * 1000)
+
+        budget = getattr(request, '_query_budget', None)
+        if budget is not None and result.queries > budget:
+            message = '%s ran %d queries, over its budget of %d.' % (
+                result.name, result.queries, budget)
+            logger.warning(message, extra={'profile': result.as_dict()})
+            if get_option('ENFORCE_BUDGETS'):
+                raise QueryBudgetExceeded(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = getattr(view_func, 'query_budget', None)
+
+
+@staff_member_required
+@query_budget(2)
+def stats(request):
+    """Serve this process's totals to staff."""
+    return JsonResponse(totals())
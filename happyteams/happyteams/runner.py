@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """Runs the tests with instrumentation on and query budgets enforced,
+    so a view that runs more queries than it declares fails its test.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super(TestRunner, self).setup_test_environment(**kwargs)
+        options = dict(getattr(settings, 'INSTRUMENTATION', {}))
+        options.update(ENABLED=True, ENFORCE_BUDGETS=True)
+        self._instrumentation = override_settings(INSTRUMENTATION=options)
+        self._instrumentation.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._instrumentation.disable()
+        super(TestRunner, self).teardown_test_environment(**kwargs)
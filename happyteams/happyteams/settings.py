@@ -44,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'happyteams.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,6 +86,45 @@ DATABASES = {
 }
 
 
+# Query and timing instrumentation (see happyteams.instrumentation).  It
+# turns on SQL logging for every request, so it is off unless enabled here;
+# the test runner enables it and fails requests that exceed query budgets
+
+INSTRUMENTATION = {
+    'ENABLED': False,
+    'SLOWEST': 5,
+    'ENFORCE_BUDGETS': False,
+}
+
+TEST_RUNNER = 'happyteams.runner.TestRunner'
+
+
+# Caches
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'metrics': {
+        'BACKEND': 'planning.metriccache.LRUMemoryCache',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+# Caches holding computed coverage and enjoyment values and their versions
+# (see planning.metriccache); with several worker processes VERSIONS should
+# name a cache they share
+
+METRIC_CACHE = {
+    'VALUES': 'metrics',
+    'VERSIONS': 'metrics',
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 
@@ -122,3 +162,64 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/1.11/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Working calendar used to convert hours into a share of a month
+# See planning/workcalendar.py for the available options
+
+WORKING_CALENDAR = {
+    'HOURS_PER_DAY': 8,
+    'WEEKEND': (5, 6),
+    'HOLIDAYS': (),
+    'HORIZON_YEARS': (2, 5),
+    'UNITS': {},
+}
+
+
+# Win probability of a project in each status, used by demand forecasts,
+# defaults to planning.forecast.DEFAULT_PROBABILITIES; set only the
+# statuses to override, e.g.
+#
+# PIPELINE_PROBABILITIES = {'pending': 0.8}
+
+# Monthly allocation above which a resource is flagged as over allocated
+
+OVERALLOCATION_THRESHOLD = 1.0
+
+# Path of the memory-mapped planning snapshot shared by worker processes
+# (see planning.snapshot); writes queue its rebuild for run_worker.  None
+# disables it
+
+PLANNING_SNAPSHOT = None
+
+# Background jobs (see planning.jobs and manage.py run_worker); with
+# DEFER_ROLLUPS commitment edits queue coalesced metric refreshes instead of
+# recomputing them in the request
+
+JOBS = {
+    'PROCESSES': 2,
+    'POLL_SECONDS': 2.0,
+    'COALESCE_SECONDS': 10,
+    'DEFER_ROLLUPS': False,
+    'STALE_SECONDS': 300,
+    'MAX_ATTEMPTS': 3,
+}
+
+# Plan history (see planning.history) stores a full checkpoint once the
+# changes recorded since the last one reach this fraction of the rows
+
+PLAN_CHECKPOINT_RATIO = 0.5
+
+# Search sponsors, projects and skills with the SQLite FTS5 index (see
+# planning.search); off, or without FTS5, searches use icontains instead
+
+SEARCH_FTS = True
+
+# Enjoyment alerts (see planning.alerts and manage.py scan_enjoyment) flag
+# resources below THRESHOLD for MONTHS consecutive months of the HORIZON
+
+ENJOYMENT_ALERTS = {
+    'THRESHOLD': 2.0,
+    'MONTHS': 2,
+    'HORIZON': 6,
+}
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+
+from django.conf.urls import url
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+
+from . import instrumentation
+from .instrumentation import QueryBudgetExceeded, profile, query_budget
+from .urls import urlpatterns
+
+
+@query_budget(1)
+def user_count(request):
+    count = User.objects.count()
+    if 'each' in request.GET:
+        for user in User.objects.all():
+            User.objects.filter(pk=user.pk).exists()
+    return HttpResponse(str(count))
+
+
+urlpatterns = urlpatterns + [
+    url(r'^users/$', user_count, name='user-count'),
+]
+
+
+@override_settings(ROOT_URLCONF='happyteams.tests')
+class InstrumentationTests(TestCase):
+
+    def setUp(self):
+        instrumentation.reset()
+        User.objects.create(username='alice')
+        User.objects.create(username='bob')
+
+    def test_profile_counts_nested_blocks(self):
+        @profile('count')
+        def count():
+            return User.objects.count()
+
+        with self.assertNumQueries(3):
+            with profile('outer', log=False) as outer:
+                with profile('inner', log=False) as inner:
+                    list(User.objects.all())
+                count()
+                count()
+        self.assertEqual((outer.queries, inner.queries), (3, 1))
+        self.assertEqual(len(outer.slowest), 3)
+        self.assertGreaterEqual(outer.seconds, outer.sql_seconds)
+        self.assertEqual(instrumentation.totals()['count']['count'], 2)
+        self.assertNotIn('outer', instrumentation.totals())
+
+    def test_requests_are_logged_and_totalled(self):
+        with self.assertLogs('happyteams.instrumentation', 'INFO') as logs:
+            response = self.client.get('/users/')
+        self.assertIn('Server-Timing', response)
+        logged = json.loads(logs.records[0].getMessage())
+        self.assertEqual((logged['name'], logged['queries']),
+                         ('user-count', 1))
+
+        with self.assertLogs('happyteams.instrumentation', 'INFO'):
+            self.client.get('/nowhere/')
+            self.client.get('/nor/here/')
+        self.assertEqual(
+            instrumentation.totals()[instrumentation.UNRESOLVED]['count'], 2)
+
+        # local addresses are not enough, e.g. behind a reverse proxy
+        self.assertEqual(
+            self.client.get('/_stats/', REMOTE_ADDR='127.0.0.1').status_code,
+            302)
+        self.client.force_login(
+            User.objects.create(username='ops', is_staff=True))
+        stats = self.client.get('/_stats/').json()
+        self.assertEqual(stats['user-count']['count'], 1)
+        self.assertNotIn('/nowhere/', stats)
+
+    @override_settings(INSTRUMENTATION={'ENABLED': True,
+                                        'ENFORCE_BUDGETS': True})
+    def test_budgets_fail_tests(self):
+        with self.assertRaises(QueryBudgetExceeded), \
+                self.assertLogs('happyteams.instrumentation', 'WARNING'):
+            self.client.get('/users/?each')
+        with override_settings(INSTRUMENTATION={'ENABLED': True,
+                                                'ENFORCE_BUDGETS': False}):
+            with self.assertLogs('happyteams.instrumentation', 'WARNING'):
+                self.assertEqual(
+                    self.client.get('/users/?each').status_code, 200)
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""Alerts for people whose work is below the enjoyment threshold.
+
+``scan`` scores every resource's commitment-weighted enjoyment for each
+month of the horizon in one set-based pass (``score_enjoyment``: the
+ratings, the project skills and the overlapping commitments, three queries)
+and flags those below ``THRESHOLD`` for at least ``MONTHS`` consecutive
+months as ``EnjoymentAlert`` rows.
+
+Re-runs are incremental.  SQLite triggers add a resource to
+``StaleEnjoyment`` whenever their commitments or ratings change, a skill
+is added to or removed from a project they work on, or an enjoyment level's
+value changes; a scan with the same parameters and horizon as the last one
+only re-scores those resources.  Anything else (a new month, different
+parameters, another database) scans everyone.
+
+``report`` groups the alerts by the manager of each resource's unit (the
+nearest unit up the tree that has one).
+
+Configured through the ``ENJOYMENT_ALERTS`` setting::
+
+    ENJOYMENT_ALERTS = {
+        'THRESHOLD': 2.0,
+        'MONTHS': 2,  # consecutive months below the threshold
+        'HORIZON': 6,  # months scanned, starting with the current one
+    }
+"""
+from __future__ import unicode_literals
+
+import datetime
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, connections, transaction
+
+from resources.models import OrganizationalUnit, Resource
+
+from .coverage import add_months, month_floor, month_range
+from .enjoyment import score_enjoyment
+from .models import EnjoymentAlert, EnjoymentScan, StaleEnjoyment
+
+DEFAULTS = {
+    'THRESHOLD': 2.0,
+    'MONTHS': 2,
+    'HORIZON': 6,
+}
+
+CHUNK_SIZE = 500
+
+STALE = 'INSERT OR IGNORE INTO planning_staleenjoyment (resource_id) '
+# (table, event, statements run for each row)
+TRIGGERS = (
+    ('planning_commitment', 'INSERT', STALE + 'VALUES (NEW.resource_id);'),
+    ('planning_commitment', 'UPDATE', STALE + 'VALUES (OLD.resource_id); ' +
+     STALE + 'VALUES (NEW.resource_id);'),
+    ('planning_commitment', 'DELETE', STALE + 'VALUES (OLD.resource_id);'),
+    ('resources_resourceskill', 'INSERT',
+     STALE + 'VALUES (NEW.resource_id);'),
+    ('resources_resourceskill', 'UPDATE', STALE + 'VALUES '
+     '(OLD.resource_id); ' + STALE + 'VALUES (NEW.resource_id);'),
+    ('resources_resourceskill', 'DELETE',
+     STALE + 'VALUES (OLD.resource_id);'),
+    ('crm_project_skills', 'INSERT', STALE + 'SELECT resource_id FROM '
+     'planning_commitment WHERE project_id = NEW.project_id;'),
+    ('crm_project_skills', 'DELETE', STALE + 'SELECT resource_id FROM '
+     'planning_commitment WHERE project_id = OLD.project_id;'),
+    ('resources_skillenjoyment', 'UPDATE', STALE + 'SELECT resource_id FROM '
+     'resources_resourceskill WHERE enjoyment_id = NEW.id;'),
+)
+
+
+def get_option(name):
+    return getattr(settings, 'ENJOYMENT_ALERTS', {}).get(
+        name, DEFAULTS[name])
+
+
+def install(using='default'):
+    """Create the triggers that mark resources stale."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    existing = connection.introspection.table_names()
+    with connection.cursor() as cursor:
+        for table, event, statements in TRIGGERS:
+            if table in existing:
+                cursor.execute(
+                    'CREATE TRIGGER IF NOT EXISTS planning_staleenjoyment_'
+                    '%s_%s AFTER %s ON %s BEGIN %s END' % (
+                        table, event.lower(), event, table, statements))
+
+
+def _longest_run(values, threshold):
+    # (offset, length) of the longest run of scores below threshold
+    best = run = (0, 0)
+    for offset, value in enumerate(values):
+        if value is not None and value < threshold:
+            run = (run[0] if run[1] else offset, run[1] + 1)
+            best = max(best, run, key=lambda r: r[1])
+        else:
+            run = (0, 0)
+    return best
+
+
+def _alerts(resource_ids, months, threshold, length):
+    scores = score_enjoyment(months[0], months[-1], resources=resource_ids)
+    alerts = []
+    for resource_id in scores.resources:
+        values = [scores.resource(resource_id, month) for month in months]
+        offset, run = _longest_run(values, threshold)
+        if run >= length:
+            below = values[offset:offset + run]
+            alerts.append(EnjoymentAlert(
+                resource_id=resource_id, start=months[offset], months=run,
+                lowest=min(below), average=sum(below) / run))
+    return alerts
+
+
+def scan(full=False, threshold=None, months=None, horizon=None, today=None):
+    """Flag resources below ``threshold`` for ``months`` consecutive months
+    within ``horizon`` months from ``today``'s month, re-scoring only stale
+    resources unless ``full``.  Returns the ``EnjoymentScan`` recorded.
+    """
+    threshold = get_option('THRESHOLD') if threshold is None else threshold
+    length = get_option('MONTHS') if months is None else months
+    horizon = get_option('HORIZON') if horizon is None else horizon
+    start = month_floor(today or datetime.date.today())
+    months = month_range(start, add_months(start, horizon - 1))
+
+    last = EnjoymentScan.objects.order_by('-pk').first()
+    full = full or connection.vendor != 'sqlite' or last is None or (
+        (last.start, last.horizon, last.months, last.threshold) !=
+        (start, horizon, length, threshold))
+    with transaction.atomic():
+        if full:
+            StaleEnjoyment.objects.all().delete()
+            EnjoymentAlert.objects.all().delete()
+            EnjoymentAlert.objects.bulk_create(
+                _alerts(None, months, threshold, length))
+            count = Resource.objects.count()
+        else:
+            stale = list(StaleEnjoyment.objects.values_list(
+                'resource_id', flat=True))
+            for i in range(0, len(stale), CHUNK_SIZE):
+                chunk = stale[i:i + CHUNK_SIZE]
+                StaleEnjoyment.objects.filter(resource_id__in=chunk).delete()
+                EnjoymentAlert.objects.filter(resource__in=chunk).delete()
+                EnjoymentAlert.objects.bulk_create(
+                    _alerts(chunk, months, threshold, length))
+            count = len(stale)
+        return EnjoymentScan.objects.create(
+            start=start, horizon=horizon, months=length, threshold=threshold,
+            full=full, resources=count)
+
+
+def _managers(unit_ids):
+    # the nearest manager up the tree for each unit
+    units = dict(
+        (pk, (path, primary or secondary)) for pk, path, primary, secondary
+        in OrganizationalUnit.objects.values_list(
+            'pk', 'path', 'primary_manager_id', 'secondary_manager_id'))
+    managers = {}
+    for unit_id in unit_ids:
+        ancestors = [int(pk) for pk in units[unit_id][0].split('/') if pk]
+        managers[unit_id] = next((units[pk][1] for pk in reversed(ancestors)
+                                  if units[pk][1]), None)
+    return managers
+
+
+def report():
+    """Return the alerts of the last scan grouped by manager, as
+    JSON-serializable data.
+    """
+    last = EnjoymentScan.objects.order_by('-pk').first()
+    alerts = list(EnjoymentAlert.objects.select_related(
+        'resource__user', 'resource__unit').order_by(
+            'resource__user__username'))
+    managers = _managers(set(alert.resource.unit_id for alert in alerts))
+    usernames = dict(User.objects.filter(
+        pk__in=set(managers.values())).values_list('pk', 'username'))
+
+    groups = OrderedDict()
+    for alert in alerts:
+        manager = managers[alert.resource.unit_id]
+        groups.setdefault(manager, []).append({
+            'resource': alert.resource_id,
+            'username': alert.resource.user.username,
+            'unit': alert.resource.unit.abbreviation,
+            'start': alert.start.isoformat(),
+            'months': alert.months,
+            'lowest': alert.lowest,
+            'average': alert.average,
+        })
+    return {
+        'scan': last and {
+            'finished': last.finished.isoformat(),
+            'start': last.start.isoformat(),
+            'horizon': last.horizon,
+            'months': last.months,
+            'threshold': last.threshold,
+        },
+        'managers': [{
+            'manager': manager,
+            'username': usernames.get(manager),
+            'alerts': found,
+        } for manager, found in sorted(
+            groups.items(), key=lambda item: usernames.get(item[0]) or '')],
+    }
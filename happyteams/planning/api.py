@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""Read-only JSON API for dashboards.
+
+Each ``Endpoint`` lists a model's ``Field``s.  ``?fields=`` picks which are
+returned (``id`` always is), and only the columns, joins
+(``select_related``) and prefetches those fields declare are loaded.  Pages
+are keyset paginated on the primary key: ``?after=<id>`` continues where
+the previous page's ``next`` left off, so deep pages cost the same as the
+first.
+
+``api/enjoyment-alerts/`` serves the last ``planning.alerts`` scan grouped
+by manager.
+
+Responses carry an ETag made from the request and the ``planning.changes``
+counters of the tables the endpoint reads.  A poll whose ``If-None-Match``
+still matches gets a 304 after that single counter query, without running
+the endpoint's own queries.
+"""
+from __future__ import unicode_literals
+
+import hashlib
+import json
+from collections import OrderedDict
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db.models import Prefetch
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.utils import six
+from django.views.decorators.http import condition, require_safe
+
+from crm.models import Project, Sponsor
+from happyteams.instrumentation import query_budget
+from resources.models import (OrganizationalUnit, Resource, ResourceSkill,
+                              Skill, SkillEnjoyment, SkillLevel)
+
+from . import alerts, changes
+from .models import (Commitment, EnjoymentAlert, EnjoymentScan, ProjectMonth,
+                     ResourceMonth)
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+
+def _path(path):
+    def value(obj):
+        for name in path.split('.'):
+            obj = getattr(obj, name)
+            if obj is None:
+                break
+        return obj
+    return value
+
+
+class Field(object):
+    """An output field: ``value`` is an attribute path or a function of the
+    object; ``columns``, ``related`` and ``prefetch`` are what it needs
+    loaded.
+    """
+
+    def __init__(self, value, columns=(), related=(), prefetch=()):
+        self.value = (_path(value) if isinstance(value, six.string_types)
+                      else value)
+        self.columns = columns
+        self.related = related
+        self.prefetch = prefetch
+
+
+def column(name):
+    return Field(name, columns=(name,))
+
+
+def _skill_ratings(resource):
+    return [{
+        'skill': rating.skill_id,
+        'level': rating.skill_level.rank if rating.skill_level else None,
+        'enjoyment': rating.enjoyment.value if rating.enjoyment else None,
+    } for rating in resource.resourceskill_set.all()]
+
+
+class Endpoint(object):
+    """A model exposed at ``api/<name>/``.  ``filters`` maps query
+    parameters to lookups and ``tables`` lists every model read.
+    """
+
+    def __init__(self, name, model, fields, default, filters=None,
+                 tables=()):
+        self.name = name
+        self.model = model
+        self.fields = OrderedDict(
+            [('id', Field('pk'))] + list(fields))
+        self.default = ('id',) + tuple(default)
+        self.filters = filters or {}
+        self.tables = sorted(set(
+            table._meta.db_table for table in (model,) + tuple(tables)))
+
+    def queries(self):
+        """The most queries a page can take."""
+        return 1 + len(set(getattr(lookup, 'prefetch_to', lookup)
+                           for field in self.fields.values()
+                           for lookup in field.prefetch))
+
+    def page(self, names, lookups, after, limit):
+        fields = [self.fields[name] for name in names]
+        queryset = self.model.objects.filter(**lookups).order_by('pk')
+        if after is not None:
+            queryset = queryset.filter(pk__gt=after)
+        related = set(name for field in fields for name in field.related)
+        if related:
+            queryset = queryset.select_related(*sorted(related))
+        prefetch, seen = [], set()
+        for field in fields:
+            for lookup in field.prefetch:
+                key = getattr(lookup, 'prefetch_to', lookup)
+                if key not in seen:
+                    seen.add(key)
+                    prefetch.append(lookup)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        queryset = queryset.only('pk', *sorted(set(
+            name for field in fields for name in field.columns)))
+
+        rows = list(queryset[:limit + 1])
+        results = [OrderedDict((name, field.value(obj)) for name, field
+                               in zip(names, fields)) for obj in rows[:limit]]
+        return results, len(rows) > limit
+
+
+ENDPOINTS = OrderedDict((endpoint.name, endpoint) for endpoint in (
+    Endpoint('resources', Resource, (
+        ('username', Field('user.username', columns=('user__username',),
+                           related=('user',))),
+        ('unit', column('unit_id')),
+        ('unit_name', Field('unit.name', columns=('unit__name',),
+                            related=('unit',))),
+        ('hourly_rate', column('hourly_rate')),
+        ('skills', Field(_skill_ratings, prefetch=(Prefetch(
+            'resourceskill_set', queryset=ResourceSkill.objects
+            .select_related('skill_level', 'enjoyment')),))),
+    ), default=('username', 'unit'), filters={'unit': 'unit'},
+        tables=(User, OrganizationalUnit, ResourceSkill, SkillLevel,
+                SkillEnjoyment)),
+    Endpoint('projects', Project, (
+        ('name', column('name')),
+        ('description', column('description')),
+        ('status', column('status')),
+        ('start', column('start')),
+        ('end', column('end')),
+        ('sponsor', column('sponsor_id')),
+        ('sponsor_name', Field('sponsor.name', columns=('sponsor__name',),
+                               related=('sponsor',))),
+        ('predecessor', column('predecessor_id')),
+        ('root', column('root_id')),
+        ('skills', Field(
+            lambda project: [skill.pk for skill in project.skills.all()],
+            prefetch=(Prefetch('skills', queryset=Skill.objects.only('pk')),
+                      ))),
+    ), default=('name', 'status', 'start', 'end'),
+        filters={'status': 'status', 'sponsor': 'sponsor'},
+        tables=(Sponsor, Project.skills.through)),
+    Endpoint('commitments', Commitment, (
+        ('resource', column('resource_id')),
+        ('project', column('project_id')),
+        ('start', column('start')),
+        ('end', column('end')),
+        ('percentage', column('percentage')),
+        ('hours', column('hours')),
+    ), default=('resource', 'project', 'start', 'end', 'percentage',
+                'hours'),
+        filters={'resource': 'resource', 'project': 'project',
+                 'ends_after': 'end__gte', 'starts_before': 'start__lte'}),
+    Endpoint('resource-months', ResourceMonth, (
+        ('resource', column('resource_id')),
+        ('month', column('month')),
+        ('coverage', column('coverage')),
+        ('hours', column('hours')),
+        ('enjoyment', column('enjoyment')),
+    ), default=('resource', 'month', 'coverage', 'enjoyment'),
+        filters={'resource': 'resource', 'from': 'month__gte',
+                 'to': 'month__lte'}),
+    Endpoint('project-months', ProjectMonth, (
+        ('project', column('project_id')),
+        ('month', column('month')),
+        ('coverage', column('coverage')),
+        ('hours', column('hours')),
+        ('team_enjoyment', column('team_enjoyment')),
+    ), default=('project', 'month', 'coverage', 'team_enjoyment'),
+        filters={'project': 'project', 'from': 'month__gte',
+                 'to': 'month__lte'}),
+))
+
+
+def _etag(name, tables):
+    def etag(request):
+        versions = changes.versions(tables)
+        if versions is None:
+            return None
+        return hashlib.sha1(json.dumps(
+            [name, sorted(request.GET.lists()),
+             sorted(versions.items())]).encode('utf-8')).hexdigest()
+    return etag
+
+
+def endpoint_view(endpoint):
+    """Return the view serving ``endpoint``."""
+
+    @staff_member_required
+    @query_budget(3 + endpoint.queries())
+    @require_safe
+    @condition(etag_func=_etag(endpoint.name, endpoint.tables))
+    def view(request):
+        names = request.GET.get('fields')
+        names = (['id'] + [name for name in names.split(',')
+                           if name and name != 'id']
+                 if names else list(endpoint.default))
+        unknown = [name for name in names if name not in endpoint.fields]
+        if unknown:
+            return HttpResponseBadRequest(
+                'Unknown fields: %s.' % ', '.join(unknown))
+        lookups = dict((lookup, request.GET[parameter]) for parameter, lookup
+                       in endpoint.filters.items() if parameter in request.GET)
+        try:
+            limit = min(MAX_LIMIT, max(1, int(
+                request.GET.get('limit', DEFAULT_LIMIT))))
+            after = request.GET.get('after')
+            after = int(after) if after else None
+            results, more = endpoint.page(names, lookups, after, limit)
+        except (ValueError, ValidationError):
+            return HttpResponseBadRequest('Invalid filter or page values.')
+
+        following = None
+        if more:
+            parameters = request.GET.copy()
+            parameters['after'] = results[-1]['id']
+            following = '%s?%s' % (request.path, parameters.urlencode())
+        return JsonResponse({'results': results, 'next': following})
+
+    view.__name__ = str('api_%s' % endpoint.name.replace('-', '_'))
+    return view
+
+
+ALERT_TABLES = sorted(model._meta.db_table for model in (
+    EnjoymentAlert, EnjoymentScan, Resource, OrganizationalUnit, User))
+
+
+@staff_member_required
+@query_budget(7)
+@require_safe
+@condition(etag_func=_etag('enjoyment-alerts', ALERT_TABLES))
+def enjoyment_alerts(request):
+    """The alerts of the last enjoyment scan, grouped by manager."""
+    return JsonResponse(alerts.report())
+
+
+@staff_member_required
+@query_budget(2)
+@require_safe
+def index(request):
+    """Describe the endpoints, their fields and filters."""
+    return JsonResponse({'endpoints': OrderedDict(
+        (name, {
+            'fields': list(endpoint.fields),
+            'default': list(endpoint.default),
+            'filters': sorted(endpoint.filters),
+        }) for name, endpoint in ENDPOINTS.items())})
@@ -2,7 +2,18 @@
 from __future__ import unicode_literals
 
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def install_change_counters(sender, using='default', **kwargs):
+    from . import alerts, changes
+    changes.install(using)
+    alerts.install(using)
 
 
 class PlanningConfig(AppConfig):
     name = 'planning'
+
+    def ready(self):
+        from . import signals  # noqa
+        post_migrate.connect(install_change_counters, sender=self)
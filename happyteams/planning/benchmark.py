@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""Timings of the main planning operations at several sizes.
+
+For each scale a ``SyntheticOrg`` is generated inside a transaction that is
+rolled back afterwards, so benchmarking leaves the database as it was.  Each
+operation records its wall time and the number of queries it ran, and the
+results are plain JSON-serializable data so runs can be compared.
+"""
+from __future__ import unicode_literals
+
+import csv
+import datetime
+import io
+import os
+import platform
+import tempfile
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import django
+from django.db import connection, transaction
+from django.utils import six
+
+from resources import skillindex
+from resources.models import Resource
+
+from . import metriccache, rollups
+from .conflicts import scan
+from .coverage import add_months, coverage_matrix
+from .enjoyment import score_enjoyment
+from .importer import COLUMNS, CommitmentImport
+from .models import Commitment
+from .reports import org_rollup
+from .synthetic import SyntheticOrg
+
+SCALES = (1000, 10000, 100000)
+START = datetime.date(2017, 1, 1)
+MONTHS = 12
+
+
+@contextmanager
+def _measure(results, name):
+    # the connection's own query log is capped, so count with an unbounded one
+    log, debug = connection.queries_log, connection.force_debug_cursor
+    connection.queries_log, connection.force_debug_cursor = deque(), True
+    started = time.time()
+    try:
+        yield
+    finally:
+        results[name] = {
+            'seconds': round(time.time() - started, 4),
+            'queries': len(connection.queries_log),
+        }
+        connection.queries_log, connection.force_debug_cursor = log, debug
+
+
+def _write_import(org, path, rows):
+    if six.PY2:
+        handle = open(path, 'wb')
+    else:
+        handle = io.open(path, 'w', newline='', encoding='utf-8')
+    with handle:
+        writer = csv.writer(handle)
+        writer.writerow(COLUMNS)
+        for i in range(rows):
+            resource_id = org.resource_ids[i % len(org.resource_ids)]
+            project_id = org.project_ids[i % len(org.project_ids)]
+            commitment = org.commitment(resource_id, project_id)
+            writer.writerow([
+                org.projects[project_id][0], org.usernames[resource_id],
+                commitment.start.isoformat(), commitment.end.isoformat(),
+                commitment.percentage or '', commitment.hours or ''])
+
+
+def benchmark_scale(resources, seed=0, import_rows=1000):
+    """Return ``{operation: {'seconds': ..., 'queries': ...}}`` for an
+    organization of ``resources`` people.
+    """
+    results = {}
+    end = add_months(START, MONTHS - 1)
+    months = [add_months(START, i) for i in range(MONTHS)]
+    handle, path = tempfile.mkstemp(suffix='.csv')
+    os.close(handle)
+    try:
+        with transaction.atomic():
+            with _measure(results, 'generate'):
+                org = SyntheticOrg(resources=resources, start=START,
+                                   seed=seed).generate(refresh=False)
+            with _measure(results, 'rollups'):
+                rollups.rebuild()
+            with _measure(results, 'coverage_matrix'):
+                coverage_matrix(None, START, end)
+            sample = list(Resource.objects.order_by('pk').values_list(
+                'pk', flat=True)[:100])
+            with _measure(results, 'coverage_per_resource'):
+                for resource in Resource.objects.filter(pk__in=sample):
+                    resource.coverage(START)
+            with _measure(results, 'enjoyment'):
+                score_enjoyment(START, end)
+            with _measure(results, 'overlap'):
+                for month in months:
+                    Commitment.objects.active_in(month).count()
+            with _measure(results, 'org_rollup'):
+                org_rollup(None, START, end)
+            with _measure(results, 'conflicts'):
+                scan(start=START, end=end)
+            _write_import(org, path, import_rows)
+            with _measure(results, 'import'):
+                CommitmentImport(path).run()
+            transaction.set_rollback(True)
+    finally:
+        os.remove(path)
+        skillindex.invalidate()
+        metriccache.invalidate('resource', None)
+    return results
+
+
+def run_benchmark(scales=SCALES, seed=0, import_rows=1000):
+    """Benchmark every scale and return the results with enough context
+    (versions, database) to compare them with another run.
+    """
+    return {
+        'started': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'seed': seed,
+        'scales': dict(
+            (str(resources), benchmark_scale(resources, seed, import_rows))
+            for resources in scales),
+    }
+
+
+def compare(current, previous):
+    """Yield ``(scale, operation, seconds, ratio)`` where ratio is this
+    run's time over the previous run's (``None`` when not comparable).
+    """
+    for scale, operations in sorted(current['scales'].items(),
+                                    key=lambda item: int(item[0])):
+        before = previous.get('scales', {}).get(scale, {})
+        for name, result in sorted(operations.items()):
+            seconds = before.get(name, {}).get('seconds')
+            yield (scale, name, result['seconds'],
+                   result['seconds'] / seconds if seconds else None)
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""Funding burn and runway projections.
+
+Every commitment in the portfolio is read once and turned into monthly cost
+(committed hours x hourly rate) accumulated into one ``array('d')`` per
+project.  Rates come from the resource, falling back to the nearest unit up
+the tree with a rate.  Each project's monthly cost is then drawn down from
+its ``BudgetIncrement`` amounts, earliest expiring first, to find the month
+funding runs out and any funding that expires before it is spent.
+"""
+from __future__ import unicode_literals
+
+from array import array
+
+from django.db.models import Max, Min
+
+from crm.models import BudgetIncrement
+from resources.models import OrganizationalUnit
+
+from .coverage import (commitment_rows, month_end, month_range,
+                       split_commitment)
+from .models import Commitment
+
+
+def unit_rates():
+    """Return ``{unit_id: rate}`` with rates inherited down the tree."""
+    units = list(OrganizationalUnit.objects.values_list(
+        'pk', 'path', 'hourly_rate'))
+    own = dict((pk, rate) for pk, _, rate in units if rate is not None)
+    rates = {}
+    for pk, path, _ in units:
+        for ancestor in reversed(path.split('/')[:-1]):
+            if int(ancestor) in own:
+                rates[pk] = float(own[int(ancestor)])
+                break
+    return rates
+
+
+class ProjectBurn(object):
+    """Monthly cost and funding draw-down for a single project."""
+
+    def __init__(self, project_id, months):
+        self.project_id = project_id
+        self.months = months
+        self.cost = array('d', [0.0]) * len(months)
+        self.increments = []
+        self.funded = 0.0
+        self.exhausted = None
+        self.shortfall = 0.0
+        self.expired = []
+
+    def cumulative(self):
+        total, running = 0.0, array('d')
+        for cost in self.cost:
+            total += cost
+            running.append(total)
+        return running
+
+    def draw_down(self):
+        """Spend each month's cost from the increments available that month,
+        soonest to expire first.
+        """
+        balances = sorted(
+            ([end, start, float(amount), pk]
+             for pk, start, end, amount in self.increments),
+            key=lambda balance: (balance[0], balance[1]))
+        self.funded = sum(balance[2] for balance in balances)
+        for month, cost in zip(self.months, self.cost):
+            last_day = month_end(month)
+            for balance in balances:
+                if cost <= 0:
+                    break
+                end, start, amount, _ = balance
+                if start <= last_day and end >= month and amount > 0:
+                    spent = min(cost, amount)
+                    balance[2] -= spent
+                    cost -= spent
+            if cost > 1e-9:
+                self.shortfall += cost
+                if self.exhausted is None:
+                    self.exhausted = month
+            for end, _, amount, pk in balances:
+                if amount > 1e-9 and month <= end <= last_day:
+                    self.expired.append((pk, end, amount))
+        return self
+
+    def report(self):
+        return {
+            'project': self.project_id,
+            'cost': list(self.cost),
+            'cumulative': list(self.cumulative()),
+            'funded': self.funded,
+            'exhausted': self.exhausted and self.exhausted.isoformat(),
+            'shortfall': self.shortfall,
+            'expired': [{'increment': pk, 'end': end.isoformat(),
+                         'amount': amount}
+                        for pk, end, amount in self.expired],
+        }
+
+
+def portfolio_burn(projects=None, start=None, end=None):
+    """Project cost and funding for ``projects`` (default: every project).
+
+    ``start`` and ``end`` default to the span of the projects' commitments
+    and budget increments.  Returns ``{project_id: ProjectBurn}``.
+    """
+    if projects is not None:
+        projects = [getattr(project, 'pk', project) for project in projects]
+    commitments = Commitment.objects.all()
+    increments = BudgetIncrement.objects.all()
+    if projects is not None:
+        commitments = commitments.filter(project_id__in=projects)
+        increments = increments.filter(project_id__in=projects)
+    if start is None or end is None:
+        spans = [commitments.aggregate(start=Min('start'), end=Max('end')),
+                 increments.aggregate(start=Min('start'), end=Max('end'))]
+        starts = [span['start'] for span in spans if span['start']]
+        ends = [span['end'] for span in spans if span['end']]
+        if not starts:
+            return {}
+        start = start or min(starts)
+        end = end or max(ends)
+
+    months = month_range(start, end)
+    burns = dict((pk, ProjectBurn(pk, months)) for pk in projects or ())
+    rates = unit_rates()
+
+    rows = commitment_rows(
+        commitments.overlapping(months[0], month_end(months[-1])),
+        'project_id', 'resource__hourly_rate', 'resource__unit_id')
+    for project_id, rate, unit_id, start, end, percentage, hours, \
+            working_calendar in rows:
+        if project_id not in burns:
+            burns[project_id] = ProjectBurn(project_id, months)
+        rate = float(rate) if rate is not None else rates.get(unit_id, 0.0)
+        if not rate:
+            continue
+        cost = burns[project_id].cost
+        for offset, fraction in split_commitment(
+                start, end, percentage, hours, months[0], len(months),
+                working_calendar):
+            cost[offset] += (fraction * rate *
+                             working_calendar.capacity(months[offset]))
+
+    for row in increments.values_list(
+            'project_id', 'pk', 'start', 'end', 'amount').iterator():
+        if row[0] not in burns:
+            burns[row[0]] = ProjectBurn(row[0], months)
+        burns[row[0]].increments.append(row[1:])
+
+    for burn in burns.values():
+        burn.draw_down()
+    return burns
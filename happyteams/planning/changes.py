@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Per-table change counters.
+
+Each table in ``tracked_tables`` has a ``ChangeCounter`` row whose version
+SQLite triggers increment on every insert, update and delete, whether the
+write comes from ``save``, ``bulk_create``, ``QuerySet.update``, raw SQL or
+another process.  Reading the versions of the tables behind a response is
+one small query, which makes them a cheap validator for HTTP caching.
+
+The triggers are (re)installed after every ``migrate``, since SQLite drops
+a table's triggers when a migration rebuilds the table.  On other databases
+there are no counters and ``versions`` returns ``None``.
+"""
+from __future__ import unicode_literals
+
+from django.db import connections
+
+from .models import ChangeCounter
+
+OPERATIONS = ('INSERT', 'UPDATE', 'DELETE')
+
+
+def tracked_tables():
+    from django.contrib.auth.models import User
+    from crm.models import Project, Sponsor
+    from resources.models import (OrganizationalUnit, Resource,
+                                  ResourceSkill, Skill, SkillEnjoyment,
+                                  SkillLevel)
+    from .models import (Commitment, EnjoymentAlert, EnjoymentScan,
+                         ProjectMonth, ResourceMonth)
+
+    return sorted(model._meta.db_table for model in (
+        User, Sponsor, Project, Project.skills.through, OrganizationalUnit,
+        Resource, ResourceSkill, Skill, SkillLevel, SkillEnjoyment,
+        Commitment, ResourceMonth, ProjectMonth, EnjoymentAlert,
+        EnjoymentScan))
+
+
+def install(using='default'):
+    """Create the counters and triggers that are missing."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    counters = ChangeCounter._meta.db_table
+    existing = connection.introspection.table_names()
+    with connection.cursor() as cursor:
+        for table in tracked_tables():
+            if table not in existing:
+                continue
+            cursor.execute(
+                'INSERT OR IGNORE INTO %s (name, version) VALUES (%%s, 0)'
+                % counters, [table])
+            for operation in OPERATIONS:
+                cursor.execute(
+                    "CREATE TRIGGER IF NOT EXISTS %s_%s_%s AFTER %s ON %s "
+                    "BEGIN UPDATE %s SET version = version + 1 "
+                    "WHERE name = '%s'; END" % (
+                        counters, table, operation.lower(), operation,
+                        table, counters, table))
+
+
+def versions(tables, using='default'):
+    """Return ``{table: version}``, or ``None`` if any table is not
+    counted.
+    """
+    found = dict(ChangeCounter.objects.using(using).filter(
+        name__in=tables).values_list('name', 'version'))
+    if len(found) != len(set(tables)):
+        return None
+    return found
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""Over-allocation detection.
+
+A commitment covers the same fraction of every whole month it spans (hours
+are spread evenly over working days), so only its first and last months
+need prorating.  Each commitment therefore becomes at most four events: a
+rate that starts after its first month and stops at its last, plus the two
+prorated end months.  Sweeping a resource's events in month order gives
+their total allocation for every month without visiting each commitment
+month by month.
+"""
+from __future__ import unicode_literals
+
+import logging
+from collections import namedtuple
+from itertools import groupby
+
+from django.conf import settings
+
+from .coverage import commitment_rows, month_end, month_floor
+from .models import Commitment
+
+import datetime
+
+logger = logging.getLogger(__name__)
+
+Conflict = namedtuple('Conflict', ('resource_id', 'month', 'total'))
+
+
+def _ordinal(day):
+    return day.year * 12 + day.month - 1
+
+
+def _month(ordinal):
+    return datetime.date(ordinal // 12, ordinal % 12 + 1, 1)
+
+
+def get_threshold():
+    return getattr(settings, 'OVERALLOCATION_THRESHOLD', 1.0)
+
+
+def _partial(month, start, end, daily, percentage, working_calendar):
+    covered = working_calendar.working_days(month, start, end)
+    if percentage is not None:
+        available = working_calendar.working_days(month)
+    else:
+        available = working_calendar.capacity(month)
+    return daily * covered / available if available else 0.0
+
+
+def _allocations(rows, first, last):
+    # sweep one resource's commitments; yields (month ordinal, total)
+    points, steps = {}, {}
+    for start, end, percentage, hours, working_calendar in rows:
+        if percentage is not None:
+            daily = rate = float(percentage) / 100.0
+        elif hours is not None:
+            working_days = working_calendar.working_days_between(start, end)
+            if not working_days:
+                continue
+            daily = float(hours) / working_days
+            rate = daily / working_calendar.hours_per_day
+        else:
+            continue
+        a, b = _ordinal(start), _ordinal(end)
+        for ordinal in set((a, b)):
+            if first <= ordinal <= last:
+                points[ordinal] = points.get(ordinal, 0.0) + _partial(
+                    _month(ordinal), start, end, daily, percentage,
+                    working_calendar)
+        if b - a > 1:
+            begin, stop = max(a + 1, first), min(b, last + 1)
+            if begin < stop:
+                steps[begin] = steps.get(begin, 0.0) + rate
+                steps[stop] = steps.get(stop, 0.0) - rate
+
+    running = 0.0
+    keys = sorted(set(points) | set(steps))
+    for i, ordinal in enumerate(keys):
+        running += steps.get(ordinal, 0.0)
+        yield ordinal, running + points.get(ordinal, 0.0)
+        # months up to the next event carry the running rate alone
+        following = keys[i + 1] if i + 1 < len(keys) else ordinal + 1
+        if running > 1e-9:
+            for between in range(ordinal + 1, following):
+                yield between, running
+
+
+def scan(resources=None, start=None, end=None, threshold=None):
+    """Return a ``Conflict`` for every resource and month whose committed
+    total exceeds ``threshold`` (default ``OVERALLOCATION_THRESHOLD``).
+
+    ``resources`` may be a queryset, an iterable of resources or primary
+    keys, or ``None`` for everyone; ``start`` and ``end`` optionally limit
+    the months checked.
+    """
+    threshold = get_threshold() if threshold is None else threshold
+    commitments = Commitment.objects.all()
+    if start is not None or end is not None:
+        commitments = commitments.overlapping(
+            month_floor(start or datetime.date.min),
+            month_end(end or datetime.date.max))
+    if resources is not None:
+        commitments = commitments.filter(resource__in=[
+            getattr(resource, 'pk', resource) for resource in resources])
+    first = _ordinal(start) if start else 0
+    last = _ordinal(end) if end else _ordinal(datetime.date.max)
+
+    conflicts = []
+    rows = commitment_rows(commitments.order_by('resource_id'), 'resource_id')
+    for resource_id, group in groupby(rows, key=lambda row: row[0]):
+        for ordinal, total in _allocations(
+                (row[1:] for row in group), first, last):
+            if total > threshold + 1e-9:
+                conflicts.append(
+                    Conflict(resource_id, _month(ordinal), total))
+    return conflicts
+
+
+def check_commitment(commitment, threshold=None):
+    """Re-check only the resource and months a commitment covers.  The
+    conflicts are logged as warnings and returned (and left on the saved
+    commitment by ``planning.signals``) for callers to act on.
+    """
+    conflicts = scan([commitment.resource_id], commitment.start,
+                     commitment.end, threshold)
+    for conflict in conflicts:
+        logger.warning(
+            'Resource %s is allocated at %d%% in %s.', conflict.resource_id,
+            round(conflict.total * 100), conflict.month.strftime('%B %Y'))
+    return conflicts
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""Batch coverage calculations.
+
+Coverage is the fraction of a resource's month that is committed to
+projects, where 1.0 means the resource is fully covered.  Rather than asking
+each resource for its coverage one month at a time, ``coverage_matrix`` pulls
+every overlapping commitment in a single query and spreads it across a
+resource x month matrix.
+"""
+from __future__ import unicode_literals
+
+import calendar
+import datetime
+from array import array
+
+from django.db.models.query import QuerySet
+
+from .models import Commitment
+from .workcalendar import get_calendar, unit_calendars
+
+
+def month_floor(day):
+    """Return the first day of the month containing ``day``."""
+    return day.replace(day=1)
+
+
+def month_end(month):
+    """Return the last day of the month containing ``month``."""
+    return month.replace(day=calendar.monthrange(month.year, month.month)[1])
+
+
+def add_months(month, count):
+    """Return the first day of the month ``count`` months from ``month``."""
+    ordinal = month.year * 12 + month.month - 1 + count
+    return datetime.date(ordinal // 12, ordinal % 12 + 1, 1)
+
+
+def months_between(first, last):
+    """Return the number of whole months from ``first`` to ``last``."""
+    return (last.year - first.year) * 12 + last.month - first.month
+
+
+def month_range(start, end):
+    """Return the first day of every month from ``start`` through ``end``."""
+    first = month_floor(start)
+    return [add_months(first, i)
+            for i in range(months_between(first, end) + 1)]
+
+
+def split_commitment(start, end, percentage, hours, first_month, count,
+                     working_calendar=None):
+    """Spread a commitment across the months it covers.
+
+    Yields ``(offset, fraction)`` pairs where ``offset`` is the number of
+    months after ``first_month`` and ``fraction`` is the share of that month
+    the commitment covers.  Percentages apply to each month and are prorated
+    by the working days covered in partial months; hours are a total for the
+    commitment, split across months in proportion to the working days
+    covered and divided by each month's working hours.
+    """
+    working_calendar = working_calendar or get_calendar()
+    if percentage is not None:
+        rate = float(percentage) / 100.0
+    elif hours is not None:
+        working_days = working_calendar.working_days_between(start, end)
+        if not working_days:
+            return
+        rate = float(hours) / working_days
+    else:
+        return
+
+    offset = max(months_between(first_month, start), 0)
+    last = min(months_between(first_month, end), count - 1)
+    while offset <= last:
+        month = add_months(first_month, offset)
+        covered = working_calendar.working_days(month, start, end)
+        if percentage is not None:
+            available = working_calendar.working_days(month)
+        else:
+            available = working_calendar.capacity(month)
+        if covered and available:
+            yield offset, rate * covered / available
+        offset += 1
+
+
+def commitment_rows(commitments, *fields):
+    """Yield the values of ``fields`` for each commitment followed by its
+    start, end, percentage, hours and the working calendar of its resource.
+    """
+    columns = list(fields) + ['start', 'end', 'percentage', 'hours']
+    if unit_calendars():
+        columns.append('resource__unit__abbreviation')
+        for row in commitments.values_list(*columns).iterator():
+            yield row[:-1] + (get_calendar(row[-1]),)
+    else:
+        working_calendar = get_calendar()
+        for row in commitments.values_list(*columns).iterator():
+            yield row + (working_calendar,)
+
+
+class CoverageMatrix(object):
+    """Coverage for a set of resources over a contiguous range of months.
+
+    ``values`` holds one ``array('d')`` row per resource, ordered like
+    ``resource_ids``, with one column per entry in ``months``.
+    """
+
+    def __init__(self, resource_ids, months):
+        self.resource_ids = list(resource_ids)
+        self.months = list(months)
+        self.index = dict((pk, i) for i, pk in enumerate(self.resource_ids))
+        blank = array('d', [0.0]) * len(self.months)
+        self.values = [array('d', blank) for _ in self.resource_ids]
+
+    def add(self, resource_id, start, end, percentage, hours,
+            working_calendar=None):
+        """Add a single commitment to the matrix."""
+        if resource_id not in self.index:
+            return
+        row = self.values[self.index[resource_id]]
+        for offset, fraction in split_commitment(
+                start, end, percentage, hours,
+                self.months[0], len(self.months), working_calendar):
+            row[offset] += fraction
+
+    def get(self, resource_id, month):
+        """Return the coverage of ``resource_id`` for ``month``."""
+        offset = months_between(self.months[0], month)
+        if offset < 0 or offset >= len(self.months):
+            raise KeyError(month)
+        return self.values[self.index[resource_id]][offset]
+
+    def row(self, resource_id):
+        """Return a ``{month: coverage}`` dict for ``resource_id``."""
+        return dict(zip(self.months, self.values[self.index[resource_id]]))
+
+    def below(self, threshold=1.0):
+        """Yield ``(resource_id, month, coverage)`` under ``threshold``."""
+        for resource_id, row in zip(self.resource_ids, self.values):
+            for month, value in zip(self.months, row):
+                if value < threshold:
+                    yield resource_id, month, value
+
+
+def _resource_ids(resources):
+    from resources.models import Resource
+
+    if resources is None:
+        resources = Resource.objects.all()
+    if isinstance(resources, QuerySet):
+        return list(resources.order_by('pk').values_list('pk', flat=True))
+    return [getattr(resource, 'pk', resource) for resource in resources]
+
+
+def overlapping_commitments(resources, first, last):
+    """Return commitments for ``resources`` overlapping ``first``-``last``.
+
+    ``resources`` may be a queryset, an iterable of resources or primary keys,
+    or ``None`` for every resource.
+    """
+    commitments = Commitment.objects.overlapping(first, last)
+    if isinstance(resources, QuerySet):
+        commitments = commitments.filter(resource__in=resources.values('pk'))
+    elif resources is not None:
+        commitments = commitments.filter(
+            resource_id__in=_resource_ids(resources))
+    return commitments
+
+
+def coverage_matrix(resources, start, end=None):
+    """Build a ``CoverageMatrix`` for ``resources`` from ``start`` to ``end``.
+
+    Every overlapping commitment is fetched in a single query regardless of
+    the number of resources or months requested.
+    """
+    if resources is not None and not isinstance(resources, QuerySet):
+        resources = list(resources)
+    months = month_range(start, end or start)
+    matrix = CoverageMatrix(_resource_ids(resources), months)
+    commitments = overlapping_commitments(
+        resources, months[0], month_end(months[-1]))
+    for row in commitment_rows(commitments, 'resource_id'):
+        matrix.add(*row)
+    return matrix
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""Batch enjoyment scoring.
+
+A resource's enjoyment of a project is the average ``SkillEnjoyment.value``
+they gave the skills the project uses.  Enjoyment for a month is then the
+average over their commitments, weighted by the fraction of the month each
+commitment covers.  Project team enjoyment is the same average taken over
+everyone committed to the project.
+"""
+from __future__ import unicode_literals
+
+from array import array
+
+from django.db.models.query import QuerySet
+
+from crm.models import Project
+from resources.models import ResourceSkill
+
+from .coverage import (commitment_rows, month_end, month_range,
+                       months_between, overlapping_commitments,
+                       split_commitment)
+from .models import Commitment
+
+
+def _ids(objects):
+    if isinstance(objects, QuerySet):
+        return objects.values('pk')
+    return [getattr(obj, 'pk', obj) for obj in objects]
+
+
+class EnjoymentTable(object):
+    """In-memory lookup of enjoyment values per resource/skill pair.
+
+    Only skills with an enjoyment level are loaded.  The table is built with
+    two queries, after which ``score`` never touches the database.
+    """
+
+    def __init__(self, resources=None, projects=None):
+        skills = ResourceSkill.objects.filter(enjoyment__isnull=False)
+        if resources is not None:
+            skills = skills.filter(resource__in=_ids(resources))
+        elif projects is not None:
+            skills = skills.filter(resource__in=Commitment.objects.filter(
+                project__in=_ids(projects)).values('resource_id'))
+        self.values = dict(
+            ((resource_id, skill_id), value)
+            for resource_id, skill_id, value in skills.values_list(
+                'resource_id', 'skill_id', 'enjoyment__value').iterator())
+
+        project_skills = Project.skills.through.objects.all()
+        if projects is not None:
+            project_skills = project_skills.filter(
+                project__in=_ids(projects))
+        elif resources is not None:
+            project_skills = project_skills.filter(
+                project__in=Commitment.objects.filter(
+                    resource__in=_ids(resources)).values('project_id'))
+        self.project_skills = {}
+        for project_id, skill_id in project_skills.values_list(
+                'project_id', 'skill_id').iterator():
+            self.project_skills.setdefault(project_id, []).append(skill_id)
+
+        self._scores = {}
+
+    def score(self, resource_id, project_id):
+        """Return how much ``resource_id`` enjoys ``project_id``.
+
+        Returns ``None`` when the project has no skills the resource rated.
+        """
+        key = (resource_id, project_id)
+        if key not in self._scores:
+            values = [self.values[(resource_id, skill_id)]
+                      for skill_id in self.project_skills.get(project_id, ())
+                      if (resource_id, skill_id) in self.values]
+            self._scores[key] = (
+                float(sum(values)) / len(values) if values else None)
+        return self._scores[key]
+
+
+class EnjoymentScores(object):
+    """Weighted enjoyment totals per resource and project for each month."""
+
+    def __init__(self, months):
+        self.months = list(months)
+        self.resources = {}
+        self.projects = {}
+
+    def _totals(self, totals, key):
+        if key not in totals:
+            blank = array('d', [0.0]) * len(self.months)
+            totals[key] = (array('d', blank), array('d', blank))
+        return totals[key]
+
+    def add(self, resource_id, project_id, offset, weight, score):
+        for totals, key in ((self.resources, resource_id),
+                            (self.projects, project_id)):
+            weighted, weights = self._totals(totals, key)
+            weighted[offset] += weight * score
+            weights[offset] += weight
+
+    def _score(self, totals, key, month):
+        offset = months_between(self.months[0], month)
+        if key not in totals or not 0 <= offset < len(self.months):
+            return None
+        weighted, weights = totals[key]
+        if not weights[offset]:
+            return None
+        return weighted[offset] / weights[offset]
+
+    def resource(self, resource_id, month):
+        """Return the weighted enjoyment of ``resource_id`` for ``month``."""
+        return self._score(self.resources, resource_id, month)
+
+    def project(self, project_id, month):
+        """Return the team enjoyment of ``project_id`` for ``month``."""
+        return self._score(self.projects, project_id, month)
+
+    def resource_row(self, resource_id):
+        return dict((month, self.resource(resource_id, month))
+                    for month in self.months)
+
+    def project_row(self, project_id):
+        return dict((month, self.project(project_id, month))
+                    for month in self.months)
+
+
+def score_enjoyment(start, end=None, resources=None, projects=None,
+                    table=None):
+    """Score every resource and project from ``start`` through ``end``.
+
+    ``resources`` and ``projects`` optionally limit the commitments that are
+    considered.  A prebuilt ``EnjoymentTable`` may be passed in to share the
+    lookup between calls; otherwise one is loaded for the same scope.
+    """
+    if resources is not None and not isinstance(resources, QuerySet):
+        resources = list(resources)
+    if projects is not None and not isinstance(projects, QuerySet):
+        projects = list(projects)
+    if table is None:
+        table = EnjoymentTable(resources, projects)
+
+    months = month_range(start, end or start)
+    scores = EnjoymentScores(months)
+    commitments = overlapping_commitments(
+        resources, months[0], month_end(months[-1]))
+    if projects is not None:
+        commitments = commitments.filter(project__in=_ids(projects))
+    rows = commitment_rows(commitments, 'resource_id', 'project_id')
+    for resource_id, project_id, start, end, percentage, hours, \
+            working_calendar in rows:
+        score = table.score(resource_id, project_id)
+        if score is None:
+            continue
+        for offset, weight in split_commitment(
+                start, end, percentage, hours, months[0], len(months),
+                working_calendar):
+            scores.add(resource_id, project_id, offset, weight, score)
+    return scores
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""Streaming export of the resource x project x month allocation grid.
+
+Commitments are read with ``QuerySet.iterator()`` ordered by resource and
+project, so each resource/project pair's commitments arrive together; their
+monthly split is accumulated into one ``array('d')`` pair, written out as a
+row and dropped before the next pair is read.  Memory use therefore depends
+on the number of months, not on the number of people or commitments.
+"""
+from __future__ import unicode_literals
+
+import csv
+from array import array
+from itertools import groupby
+
+from django.utils import six
+
+from .coverage import (commitment_rows, month_end, month_range,
+                       split_commitment)
+from .models import Commitment
+
+
+def allocation_header(months):
+    header = ['resource', 'unit', 'project']
+    for month in months:
+        label = month.strftime('%Y-%m')
+        header.extend(['%s hours' % label, '%s %%' % label])
+    return header
+
+
+def _allocations(start, end, resources):
+    months = month_range(start, end)
+    commitments = Commitment.objects.overlapping(
+        months[0], month_end(months[-1]))
+    if resources is not None:
+        commitments = commitments.filter(
+            resource__in=[getattr(r, 'pk', r) for r in resources])
+    return months, commitments
+
+
+def allocation_count(start, end, resources=None):
+    """Return how many rows (besides the header) ``allocation_rows``
+    yields.
+    """
+    _, commitments = _allocations(start, end, resources)
+    return commitments.order_by().values(
+        'resource_id', 'project_id').distinct().count()
+
+
+def allocation_rows(start, end, resources=None):
+    """Yield the header and then one row per resource and project giving the
+    committed hours and percentage for every month from ``start`` through
+    ``end``.
+    """
+    months, commitments = _allocations(start, end, resources)
+    yield allocation_header(months)
+
+    rows = commitment_rows(
+        commitments.order_by('resource_id', 'project_id', 'start'),
+        'resource_id', 'project_id', 'resource__user__username',
+        'resource__unit__abbreviation', 'project__name')
+    blank = array('d', [0.0]) * len(months)
+    for _, group in groupby(rows, key=lambda row: row[:2]):
+        hours, fractions = array('d', blank), array('d', blank)
+        for row in group:
+            labels = row[2:5]
+            begins, ends, percentage, committed, working_calendar = row[5:]
+            for offset, fraction in split_commitment(
+                    begins, ends, percentage, committed, months[0],
+                    len(months), working_calendar):
+                fractions[offset] += fraction
+                hours[offset] += (fraction *
+                                  working_calendar.capacity(months[offset]))
+        line = list(labels)
+        for committed, fraction in zip(hours, fractions):
+            line.extend(['%.2f' % committed, '%.1f' % (fraction * 100)])
+        yield line
+
+
+class Echo(object):
+    """A file-like object that hands back whatever is written to it, so
+    ``csv.writer`` can format rows one at a time for streaming.
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    """Yield each row of ``rows`` formatted as a CSV line."""
+    writer = csv.writer(Echo())
+    for row in rows:
+        if six.PY2:
+            row = [six.text_type(cell).encode('utf-8') for cell in row]
+        yield writer.writerow(row)
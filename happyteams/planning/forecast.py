@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""Probability weighted demand forecasts.
+
+A ``PipelineForecast`` reads every commitment in its months once and keeps
+each project's unweighted contribution to each unit's monthly coverage (in
+full time equivalents).  Work on projects certain to go ahead (a win
+probability of 1) is committed: it is taken off the unit's headcount to
+give its supply, the capacity still free.  Expected demand is the rest of
+the pipeline's contributions weighted by the win probability of each
+project's status.  When a project's status changes only that project's
+contribution moves, and when its commitments change only that project is
+re-read.
+
+Forecasts are kept current by ``planning.signals`` for writes made in the
+same process, which suits one built for a planning view or report.
+
+Win probabilities are ``DEFAULT_PROBABILITIES``, with any status overridden
+by the optional ``PIPELINE_PROBABILITIES`` setting.
+"""
+from __future__ import unicode_literals
+
+import weakref
+from array import array
+
+from django.conf import settings
+from django.db.models import Count
+
+from resources.models import Resource
+
+from .coverage import (commitment_rows, month_end, month_range,
+                       months_between, split_commitment)
+from .models import Commitment
+
+DEFAULT_PROBABILITIES = {
+    'opportunity': 0.25,
+    'pending': 0.9,
+    'active': 1.0,
+    'close-out': 1.0,
+    'archived': 0.0,
+}
+
+# live forecasts, kept current by planning.signals
+_forecasts = weakref.WeakSet()
+
+
+def get_probabilities():
+    probabilities = dict(DEFAULT_PROBABILITIES)
+    probabilities.update(getattr(settings, 'PIPELINE_PROBABILITIES', {}))
+    return probabilities
+
+
+class PipelineForecast(object):
+    """Expected pipeline demand against free capacity per unit and month.
+
+    ``demand`` and ``supply`` map unit primary keys to ``array('d')`` rows
+    with one column per entry in ``months``.
+    """
+
+    def __init__(self, start, end=None, probabilities=None):
+        self.months = month_range(start, end or start)
+        self.probabilities = probabilities or get_probabilities()
+        self.status = {}
+        self.contributions = {}
+        self.demand = {}
+        self.supply = {}
+        for unit_id, headcount in Resource.objects.values_list(
+                'unit_id').annotate(Count('pk')).order_by():
+            self.supply[unit_id] = array('d', [headcount]) * len(self.months)
+        for project_id in self._load(None):
+            self._apply(project_id, 1)
+        _forecasts.add(self)
+
+    def _blank(self):
+        return array('d', [0.0]) * len(self.months)
+
+    def _load(self, project_id):
+        commitments = Commitment.objects.overlapping(
+            self.months[0], month_end(self.months[-1]))
+        if project_id is not None:
+            commitments = commitments.filter(project_id=project_id)
+        loaded = set()
+        for pk, status, unit_id, start, end, percentage, hours, \
+                working_calendar in commitment_rows(
+                    commitments, 'project_id', 'project__status',
+                    'resource__unit_id'):
+            loaded.add(pk)
+            self.status[pk] = status
+            units = self.contributions.setdefault(pk, {})
+            if unit_id not in units:
+                units[unit_id] = self._blank()
+            row = units[unit_id]
+            for offset, fraction in split_commitment(
+                    start, end, percentage, hours, self.months[0],
+                    len(self.months), working_calendar):
+                row[offset] += fraction
+        return loaded
+
+    def _apply(self, project_id, sign):
+        probability = self.probabilities.get(self.status[project_id], 0.0)
+        if not probability:
+            return
+        if probability >= 1.0:
+            # committed work uses up supply
+            totals, weight = self.supply, -sign
+        else:
+            totals, weight = self.demand, sign * probability
+        for unit_id, row in self.contributions[project_id].items():
+            if unit_id not in totals:
+                totals[unit_id] = self._blank()
+            total = totals[unit_id]
+            for offset, fraction in enumerate(row):
+                total[offset] += weight * fraction
+
+    def set_status(self, project_id, status):
+        """Re-weight a project whose status changed."""
+        if project_id not in self.status:
+            return
+        self._apply(project_id, -1)
+        self.status[project_id] = status
+        self._apply(project_id, 1)
+
+    def refresh_project(self, project_id):
+        """Re-read a single project's commitments."""
+        if project_id in self.status:
+            self._apply(project_id, -1)
+            del self.status[project_id]
+            del self.contributions[project_id]
+        if self._load(project_id):
+            self._apply(project_id, 1)
+
+    def gap(self, unit_id, month):
+        """Free capacity less expected demand; negative when short
+        staffed.
+        """
+        offset = months_between(self.months[0], month)
+        supply = self.supply.get(unit_id)
+        demand = self.demand.get(unit_id)
+        return ((supply[offset] if supply else 0.0) -
+                (demand[offset] if demand else 0.0))
+
+    def report(self):
+        """Return the forecast as JSON-serializable data."""
+        units = sorted(set(self.supply) | set(self.demand))
+        return {
+            'months': [month.isoformat() for month in self.months],
+            'probabilities': self.probabilities,
+            'units': [{
+                'id': unit_id,
+                'supply': list(self.supply.get(unit_id, self._blank())),
+                'demand': list(self.demand.get(unit_id, self._blank())),
+                'gap': [self.gap(unit_id, month) for month in self.months],
+            } for unit_id in units],
+        }
+
+
+def project_status_changed(project_id, status):
+    for forecast in list(_forecasts):
+        forecast.set_status(project_id, status)
+
+
+def project_commitments_changed(project_id):
+    for forecast in list(_forecasts):
+        forecast.refresh_project(project_id)
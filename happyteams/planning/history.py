@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""Append-only history of the plan.
+
+``take_snapshot`` compares the planning tables listed in ``TABLES`` with
+the state recorded by the previous snapshot and stores only the rows that
+were added, removed or changed, as ``PlanChange`` rows.  Now and then a
+snapshot is also a checkpoint holding the whole state, compressed: once the
+changes recorded since the last checkpoint add up to
+``PLAN_CHECKPOINT_RATIO`` times the number of rows.  Storage therefore grows with the amount of
+change, and rebuilding any past state (``state_at``) replays at most that
+many changes on top of the nearest checkpoint.
+
+``unit_trend`` walks the snapshots in order, applying each one's changes to
+the previous state, to report how a unit's projected coverage and enjoyment
+for a range of months moved as the plan was revised.  Units and project
+skills are taken as they are now; only the tables in ``TABLES`` are
+historical.
+"""
+from __future__ import unicode_literals
+
+import datetime
+import json
+import zlib
+from array import array
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from crm.models import Project
+from resources.models import Resource, ResourceSkill, SkillEnjoyment
+
+from . import forecast
+from .coverage import month_end, month_range, split_commitment
+from .enjoyment import EnjoymentScores, EnjoymentTable
+from .models import Commitment, PlanChange, PlanSnapshot
+from .workcalendar import get_calendar, unit_calendars
+
+TABLES = OrderedDict((
+    ('commitment', (Commitment, ('resource_id', 'project_id', 'start', 'end',
+                                 'percentage', 'hours'))),
+    ('resourceskill', (ResourceSkill, ('resource_id', 'skill_id',
+                                       'skill_level_id', 'enjoyment_id'))),
+    ('project', (Project, ('status',))),
+))
+
+
+def get_checkpoint_ratio():
+    return getattr(settings, 'PLAN_CHECKPOINT_RATIO', 0.5)
+
+
+def _encode(values):
+    # dates and decimals as the strings they serialize to
+    return json.loads(json.dumps(list(values), cls=DjangoJSONEncoder))
+
+
+def _date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _decimal(value):
+    return None if value is None else Decimal(value)
+
+
+class PlanState(object):
+    """The planning tables at one snapshot: ``tables`` maps each name in
+    ``TABLES`` to ``{primary key: [values]}`` with values encoded as JSON.
+    """
+
+    def __init__(self, tables=None):
+        self.tables = tables or dict((name, {}) for name in TABLES)
+
+    @classmethod
+    def current(cls):
+        tables = {}
+        for name, (model, fields) in TABLES.items():
+            tables[name] = dict(
+                (row[0], _encode(row[1:])) for row in
+                model.objects.values_list('pk', *fields).iterator())
+        return cls(tables)
+
+    @classmethod
+    def unpack(cls, data):
+        tables = json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
+        return cls(dict(
+            (name, dict((int(pk), values) for pk, values in rows.items()))
+            for name, rows in tables.items()))
+
+    def pack(self):
+        return zlib.compress(json.dumps(
+            self.tables, separators=(',', ':')).encode('utf-8'))
+
+    def rows(self):
+        return sum(len(rows) for rows in self.tables.values())
+
+    def apply(self, table, row, action, values):
+        if action == PlanChange.REMOVED:
+            self.tables[table].pop(row, None)
+        else:
+            self.tables[table][row] = values
+
+    def changes(self, other):
+        """Yield ``(table, row, action, values)`` turning this state into
+        ``other``.
+        """
+        for name in TABLES:
+            before, after = self.tables.get(name, {}), other.tables[name]
+            for pk, values in after.items():
+                if pk not in before:
+                    yield name, pk, PlanChange.ADDED, values
+                elif before[pk] != values:
+                    yield name, pk, PlanChange.CHANGED, values
+            for pk in before:
+                if pk not in after:
+                    yield name, pk, PlanChange.REMOVED, None
+
+    def commitments(self, resources=None):
+        """Yield ``(resource_id, project_id, start, end, percentage,
+        hours)`` for the commitments, optionally only of ``resources``.
+        """
+        for values in self.tables['commitment'].values():
+            if resources is None or values[0] in resources:
+                yield (values[0], values[1], _date(values[2]),
+                       _date(values[3]), _decimal(values[4]),
+                       _decimal(values[5]))
+
+
+def _replay(since=None, until=None):
+    # yield (snapshot, state) from since through until, starting at the
+    # nearest checkpoint at or before since
+    checkpoints = PlanSnapshot.objects.filter(checkpoint__isnull=False)
+    if since is not None:
+        checkpoints = checkpoints.filter(pk__lte=since).order_by('-pk')
+    else:
+        checkpoints = checkpoints.order_by('pk')
+    base = checkpoints.values_list('pk', 'checkpoint').first()
+    if base is None:
+        return
+    snapshots = PlanSnapshot.objects.defer('checkpoint')
+    if until is not None:
+        snapshots = snapshots.filter(pk__lte=until)
+    state = PlanState.unpack(base[1])
+    changes = PlanChange.objects.filter(snapshot__gt=base[0]).order_by(
+        'snapshot', 'pk').values_list(
+            'snapshot_id', 'table', 'row', 'action', 'values')
+    if until is not None:
+        changes = changes.filter(snapshot__lte=until)
+    changes = iter(changes.iterator())
+    pending = next(changes, None)
+    for snapshot in snapshots.filter(pk__gte=base[0]).iterator():
+        while pending is not None and pending[0] <= snapshot.pk:
+            state.apply(pending[1], pending[2], pending[3],
+                        json.loads(pending[4]) if pending[4] else None)
+            pending = next(changes, None)
+        if since is None or snapshot.pk >= since:
+            yield snapshot, state
+
+
+def _latest(when):
+    snapshots = PlanSnapshot.objects.defer('checkpoint').order_by('-pk')
+    if isinstance(when, PlanSnapshot):
+        return when
+    if when is not None:
+        snapshots = snapshots.filter(taken__lte=when)
+    return snapshots.first()
+
+
+def state_at(when=None):
+    """Rebuild the plan as of a snapshot, or as of the latest snapshot
+    taken at or before a datetime (the latest of all when ``None``).
+    Returns ``None`` if there is no such snapshot.
+    """
+    snapshot = _latest(when)
+    if snapshot is None:
+        return None
+    for _, state in _replay(snapshot.pk, snapshot.pk):
+        return state
+
+
+def take_snapshot(label='', checkpoint=False):
+    """Record the current plan as a new snapshot and return it."""
+    with transaction.atomic():
+        previous = _latest(None)
+        current = PlanState.current()
+        if previous is None:
+            changes, checkpoint = [], True
+        else:
+            changes = list(state_at(previous).changes(current))
+            last = PlanSnapshot.objects.filter(
+                checkpoint__isnull=False).order_by('-pk').values_list(
+                    'pk', flat=True).first()
+            since = sum(PlanSnapshot.objects.filter(pk__gt=last).values_list(
+                'changes', flat=True)) + len(changes)
+            checkpoint = checkpoint or (
+                since >= get_checkpoint_ratio() * max(1, current.rows()))
+        snapshot = PlanSnapshot.objects.create(
+            label=label, changes=len(changes),
+            checkpoint=current.pack() if checkpoint else None)
+        PlanChange.objects.bulk_create([
+            PlanChange(snapshot=snapshot, table=table, row=row,
+                       action=action, values=json.dumps(values)
+                       if values is not None else '')
+            for table, row, action, values in changes])
+    return snapshot
+
+
+class HistoryEnjoymentTable(EnjoymentTable):
+    """An ``EnjoymentTable`` loaded from a past state's ratings."""
+
+    def __init__(self, state, levels, project_skills):
+        self.values = {}
+        for resource_id, skill_id, _, enjoyment_id in \
+                state.tables['resourceskill'].values():
+            if enjoyment_id in levels:
+                self.values[(resource_id, skill_id)] = levels[enjoyment_id]
+        self.project_skills = project_skills
+        self._scores = {}
+
+
+def unit_trend(unit, start, end=None, since=None, until=None):
+    """Report, for every snapshot from ``since`` through ``until`` (both
+    optional snapshots), the coverage, probability weighted coverage and
+    enjoyment the plan then projected for the resources now in ``unit``'s
+    subtree from ``start`` through ``end``.
+    """
+    months = month_range(start, end or start)
+    first, last = months[0], month_end(months[-1])
+    by_unit = unit_calendars()
+    calendars = dict(
+        (pk, get_calendar(abbreviation if by_unit else None))
+        for pk, abbreviation in Resource.objects.filter(
+            unit__path__startswith=unit.path).values_list(
+                'pk', 'unit__abbreviation'))
+    levels = dict(SkillEnjoyment.objects.values_list('pk', 'value'))
+    project_skills = {}
+    for project_id, skill_id in Project.skills.through.objects.values_list(
+            'project_id', 'skill_id'):
+        project_skills.setdefault(project_id, []).append(skill_id)
+    probabilities = forecast.get_probabilities()
+    headcount = len(calendars)
+
+    report = []
+    for snapshot, state in _replay(getattr(since, 'pk', since),
+                                   getattr(until, 'pk', until)):
+        statuses = dict((pk, row[0]) for pk, row in
+                        state.tables['project'].items())
+        table = HistoryEnjoymentTable(state, levels, project_skills)
+        blank = array('d', [0.0]) * len(months)
+        coverage, expected = array('d', blank), array('d', blank)
+        scores = EnjoymentScores(months)
+        for resource_id, project_id, begins, ends, percentage, hours in \
+                state.commitments(calendars):
+            if ends < first or begins > last:
+                continue
+            weight = probabilities.get(statuses.get(project_id), 0.0)
+            score = table.score(resource_id, project_id)
+            for offset, fraction in split_commitment(
+                    begins, ends, percentage, hours, first, len(months),
+                    calendars[resource_id]):
+                coverage[offset] += fraction
+                expected[offset] += fraction * weight
+                if score is not None:
+                    scores.add(resource_id, project_id, offset, fraction,
+                               score)
+        enjoyment = []
+        for month in months:
+            rated = [value for value in (
+                scores.resource(resource_id, month)
+                for resource_id in scores.resources) if value is not None]
+            enjoyment.append(sum(rated) / len(rated) if rated else None)
+        report.append({
+            'snapshot': snapshot.pk,
+            'taken': snapshot.taken.isoformat(),
+            'label': snapshot.label,
+            'coverage': [value / headcount if headcount else None
+                         for value in coverage],
+            'expected_coverage': [value / headcount if headcount else None
+                                  for value in expected],
+            'enjoyment': enjoyment,
+        })
+    return {
+        'unit': unit.pk,
+        'headcount': headcount,
+        'months': [month.isoformat() for month in months],
+        'snapshots': report,
+    }
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""Bulk loading of commitments from CSV.
+
+The file is streamed twice: once to collect the projects and resources it
+references, which are then fetched with a single query each, and once to
+validate every row in memory and hand the good ones to ``bulk_create`` in
+chunks.  Memory use depends on the number of distinct projects and
+resources, not on the number of rows.
+"""
+from __future__ import unicode_literals
+
+import csv
+import datetime
+import io
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.utils import six
+
+from crm.models import Project
+from resources.models import Resource
+
+from . import forecast, rollups, snapshot
+from .models import Commitment, commitment_errors
+from .workcalendar import get_calendar
+
+COLUMNS = ('project', 'resource', 'start', 'end', 'percentage', 'hours')
+
+
+def _open(path):
+    if six.PY2:
+        return open(path, 'rb')
+    return io.open(path, newline='', encoding='utf-8')
+
+
+def read_rows(path):
+    """Yield ``(line_number, row)`` pairs from the CSV file at ``path``."""
+    with _open(path) as handle:
+        reader = csv.DictReader(handle)
+        missing = set(COLUMNS) - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(
+                'Missing column(s): %s' % ', '.join(sorted(missing)))
+        for row in reader:
+            yield reader.line_num, dict(
+                (key, _text(value)) for key, value in row.items()
+                if key is not None)
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    return (value or '').strip()
+
+
+def _date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _decimal(value):
+    return Decimal(value) if value else None
+
+
+class CommitmentImport(object):
+    """Validate and load the commitments in a CSV file.
+
+    Projects are referenced by name and resources by username.  After
+    ``run`` the ``errors`` attribute holds every ``(line, message)`` problem
+    found and ``created`` the number of commitments written.
+    """
+
+    def __init__(self, path, batch_size=1000, dry_run=False):
+        self.path = path
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.errors = []
+        self.created = 0
+
+    def _prefetch(self):
+        names, usernames = set(), set()
+        for _, row in read_rows(self.path):
+            names.add(row['project'])
+            usernames.add(row['resource'])
+        self.projects = dict(
+            (name, (pk, start, end))
+            for name, pk, start, end in Project.objects.filter(
+                name__in=names).values_list('name', 'pk', 'start', 'end'))
+        self.resources = dict(
+            (username, (pk, get_calendar(unit)))
+            for username, pk, unit in Resource.objects.filter(
+                user__username__in=usernames).values_list(
+                    'user__username', 'pk', 'unit__abbreviation'))
+
+    def _parse(self, line, row):
+        errors = []
+        project = self.projects.get(row['project'])
+        if project is None:
+            errors.append('Unknown project "%s".' % row['project'])
+        resource = self.resources.get(row['resource'])
+        if resource is None:
+            errors.append('Unknown resource "%s".' % row['resource'])
+        try:
+            start, end = _date(row['start']), _date(row['end'])
+        except ValueError:
+            errors.append('Dates must be formatted as YYYY-MM-DD.')
+            start = end = None
+        try:
+            percentage = _decimal(row['percentage'])
+            hours = _decimal(row['hours'])
+        except InvalidOperation:
+            errors.append('Percentage and Hours must be numbers.')
+            percentage = hours = None
+
+        if not errors:
+            errors = commitment_errors(start, end, percentage, hours,
+                                       project[1], project[2], resource[1])
+        if errors:
+            self.errors.extend((line, error) for error in errors)
+            return None
+        return Commitment(project_id=project[0], resource_id=resource[0],
+                          start=start, end=end, percentage=percentage,
+                          hours=hours)
+
+    def commitments(self):
+        """Yield an unsaved ``Commitment`` for every valid row."""
+        for line, row in read_rows(self.path):
+            commitment = self._parse(line, row)
+            if commitment is not None:
+                yield commitment
+
+    def run(self):
+        self._prefetch()
+        commitments = self.commitments()
+        resource_ids, project_ids = set(), set()
+        start = end = None
+        with transaction.atomic():
+            while True:
+                batch = list(islice(commitments, self.batch_size))
+                if not batch:
+                    break
+                self.created += len(batch)
+                for commitment in batch:
+                    resource_ids.add(commitment.resource_id)
+                    project_ids.add(commitment.project_id)
+                    start = min(start or commitment.start, commitment.start)
+                    end = max(end or commitment.end, commitment.end)
+                if not self.dry_run:
+                    Commitment.objects.bulk_create(batch)
+
+            # bulk_create skips the signals that keep the monthly metrics,
+            # forecasts and snapshot current, so refresh them once for
+            # everything that was loaded.
+            if self.created and not self.dry_run:
+                rollups.refresh_resources(list(resource_ids), start, end)
+                rollups.refresh_projects(list(project_ids), start, end)
+                for project_id in project_ids:
+                    forecast.project_commitments_changed(project_id)
+                snapshot.schedule_rebuild()
+        return self
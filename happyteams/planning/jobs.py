@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+"""Background jobs queued in the database and run by ``manage.py run_worker``.
+
+Work that is too slow for a request (rebuilding every monthly metric,
+scanning for over-allocations, writing a large export) is queued with
+``enqueue`` as a ``Job`` row and picked up by a worker.  There is no broker:
+workers poll the table and claim a job with a conditional ``UPDATE`` from
+``pending`` to ``running``, so any number of them can share one SQLite file.
+
+Identical pending jobs (same kind and arguments) are queued only once; a
+unique column on pending jobs makes that hold between processes too.
+``refresh_later`` coalesces bursts of commitment edits: every edit within
+``COALESCE_SECONDS`` of the last widens the span of the one pending refresh
+for each resource and project instead of queueing another.  Commitment saves
+use it instead of refreshing the rollups in the request when
+``DEFER_ROLLUPS`` is set.
+
+Running jobs carry a heartbeat, renewed by the worker while they run (from
+a thread when it runs them itself) and by ``Job.set_progress``.  A job whose
+heartbeat is older than ``STALE_SECONDS`` lost its worker; it is queued
+again, or failed once it has been attempted ``MAX_ATTEMPTS`` times.  Each
+claim counts as an attempt, and a run only records its outcome if the job
+has not been claimed again since it started.
+
+Configured through the ``JOBS`` setting::
+
+    JOBS = {
+        'PROCESSES': 2,  # worker pool size; 0 runs jobs in the worker itself
+        'POLL_SECONDS': 2.0,
+        'COALESCE_SECONDS': 10,
+        'DEFER_ROLLUPS': False,
+        'STALE_SECONDS': 300,
+        'MAX_ATTEMPTS': 3,
+    }
+"""
+from __future__ import unicode_literals
+
+import datetime
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import alerts, conflicts, history, rollups, snapshot
+from .export import allocation_count, allocation_rows, csv_lines
+from .models import EnjoymentAlert, Job, ProjectMonth, ResourceMonth
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'PROCESSES': 2,
+    'POLL_SECONDS': 2.0,
+    'COALESCE_SECONDS': 10,
+    'DEFER_ROLLUPS': False,
+    'STALE_SECONDS': 300,
+    'MAX_ATTEMPTS': 3,
+}
+
+# a burst of edits postpones its refresh by at most this many delays
+COALESCE_LIMIT = 6
+
+TASKS = {}
+
+
+def get_option(name):
+    return getattr(settings, 'JOBS', {}).get(name, DEFAULTS[name])
+
+
+def task(kind):
+    """Register a function as the job ``kind``.  It is called with the
+    ``Job`` and the job's arguments and may return JSON-serializable data.
+    """
+    def decorator(function):
+        TASKS[kind] = function
+        return function
+    return decorator
+
+
+def _date(value):
+    if value is None:
+        return None
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def enqueue(kind, delay=0, **arguments):
+    """Queue a job unless an identical one is already pending, and return
+    the pending job.
+    """
+    if kind not in TASKS:
+        raise ValueError('Unknown job kind "%s".' % kind)
+    encoded = json.dumps(arguments, cls=DjangoJSONEncoder, sort_keys=True)
+    key = '%s:%s' % (kind, hashlib.sha1(encoded.encode('utf-8')).hexdigest())
+    return _queue(key, lambda job: job, kind=kind, arguments=encoded,
+                  run_after=timezone.now() + datetime.timedelta(seconds=delay))
+
+
+def _queue(key, merge, **fields):
+    # return the pending job holding key, as merge(job) leaves it, or
+    # queue a new one; merge returns None if the job changed under it
+    while True:
+        job = Job.objects.filter(pending_key=key).first()
+        if job is not None:
+            merged = merge(job)
+            if merged is not None:
+                return merged
+            continue
+        try:
+            with transaction.atomic():
+                return Job.objects.create(key=key, pending_key=key, **fields)
+        except IntegrityError:
+            # another process queued it first
+            continue
+
+
+def _coalesce(kind, pk, start, end):
+    delay = datetime.timedelta(seconds=get_option('COALESCE_SECONDS'))
+    now = timezone.now()
+
+    def widen(job):
+        arguments = json.loads(job.arguments)
+        arguments['start'] = min(arguments['start'], start.isoformat())
+        arguments['end'] = max(arguments['end'], end.isoformat())
+        # wait for the burst to end, but not indefinitely
+        run_after = max(job.run_after, min(
+            now + delay, job.created + delay * COALESCE_LIMIT))
+        # only if no worker claimed it and no other edit widened it since
+        if Job.objects.filter(
+                pk=job.pk, pending_key=job.pending_key,
+                arguments=job.arguments).update(
+                    arguments=json.dumps(arguments, sort_keys=True),
+                    run_after=run_after):
+            return job
+        return None
+
+    return _queue(
+        '%s:%s' % (kind, pk), widen, kind=kind, run_after=now + delay,
+        arguments=json.dumps({'pk': pk, 'start': start.isoformat(),
+                              'end': end.isoformat()}, sort_keys=True))
+
+
+def refresh_later(resource_id, project_id, start, end):
+    """Queue (or widen) the refresh of a resource's and a project's
+    monthly metrics.
+    """
+    _coalesce('refresh_resource', resource_id, start, end)
+    _coalesce('refresh_project', project_id, start, end)
+
+
+def purge(days):
+    """Delete finished jobs more than ``days`` old."""
+    return Job.objects.filter(
+        status__in=(Job.DONE, Job.FAILED),
+        finished__lt=timezone.now() - datetime.timedelta(days=days)).delete()
+
+
+def claim(limit):
+    """Mark up to ``limit`` due jobs as running and return their primary keys."""
+    now = timezone.now()
+    claimed = []
+    for pk in Job.objects.filter(
+            status=Job.PENDING, run_after__lte=now).values_list(
+                'pk', flat=True)[:limit]:
+        if Job.objects.filter(pk=pk, status=Job.PENDING).update(
+                status=Job.RUNNING, pending_key=None, started=now,
+                heartbeat=now, attempts=F('attempts') + 1):
+            claimed.append(pk)
+    return claimed
+
+
+def reclaim():
+    """Queue again the running jobs whose heartbeat is older than
+    ``STALE_SECONDS``, or fail those attempted ``MAX_ATTEMPTS`` times.
+    Returns the primary keys of the jobs queued again.
+    """
+    now = timezone.now()
+    stale = now - datetime.timedelta(seconds=get_option('STALE_SECONDS'))
+    requeued = []
+    for job in Job.objects.filter(
+            Q(heartbeat__lt=stale) |
+            Q(heartbeat__isnull=True, started__lt=stale),
+            status=Job.RUNNING).only(
+                'pk', 'kind', 'key', 'attempts', 'heartbeat'):
+        # unless its worker finished or renewed it meanwhile
+        current = Job.objects.filter(pk=job.pk, status=Job.RUNNING,
+                                     heartbeat=job.heartbeat)
+        if job.attempts < get_option('MAX_ATTEMPTS'):
+            try:
+                with transaction.atomic():
+                    if current.update(status=Job.PENDING, run_after=now,
+                                      pending_key=job.key):
+                        requeued.append(job.pk)
+                continue
+            except IntegrityError:
+                # an identical job is pending and will do the work
+                pass
+        logger.error('Job %s (%s) was abandoned by its worker.', job.pk,
+                     job.kind)
+        current.update(status=Job.FAILED, finished=now,
+                       result='Abandoned by its worker after %d attempts.'
+                       % job.attempts)
+    return requeued
+
+
+class Heartbeat(threading.Thread):
+    """Renews a running job's heartbeat every third of ``STALE_SECONDS``
+    until stopped, for jobs run in the worker's own process.
+    """
+
+    def __init__(self, job):
+        super(Heartbeat, self).__init__()
+        self.daemon = True
+        self.job = job
+        self.interval = get_option('STALE_SECONDS') / 3.0
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                Job.objects.filter(
+                    pk=self.job.pk, status=Job.RUNNING,
+                    attempts=self.job.attempts).update(
+                        heartbeat=timezone.now())
+        finally:
+            # the thread's own connections
+            _close_connections()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_job(pk, heartbeat=False):
+    """Run a claimed job and record how it finished.  With ``heartbeat``
+    its heartbeat is renewed from a thread while it runs.
+    """
+    job = Job.objects.get(pk=pk)
+    # a job reclaimed while still running here is left to its new worker
+    running = Job.objects.filter(pk=pk, status=Job.RUNNING,
+                                 attempts=job.attempts)
+    beating = Heartbeat(job) if heartbeat else None
+    if beating is not None:
+        beating.start()
+    try:
+        result = TASKS[job.kind](job, **json.loads(job.arguments))
+    except Exception:
+        logger.exception('Job %s (%s) failed.', job.pk, job.kind)
+        running.update(status=Job.FAILED, result=traceback.format_exc(),
+                       finished=timezone.now())
+        return Job.FAILED
+    finally:
+        if beating is not None:
+            beating.stop()
+    running.update(status=Job.DONE, progress=1.0, finished=timezone.now(),
+                   result=json.dumps(result, cls=DjangoJSONEncoder))
+    return Job.DONE
+
+
+def _initialize():
+    # forked children must not share the parent's database connections;
+    # spawned ones start without Django configured
+    if not apps.ready:
+        django.setup()
+    _close_connections()
+
+
+def _close_connections():
+    for connection in connections.all():
+        connection.close()
+
+
+class Worker(object):
+    """Claims due jobs and runs them on a pool of ``processes`` (in this
+    process when 0).
+    """
+
+    def __init__(self, processes=None, poll=None):
+        self.processes = (get_option('PROCESSES') if processes is None
+                          else processes)
+        self.poll = get_option('POLL_SECONDS') if poll is None else poll
+        self.finished = {}
+
+    def run(self, once=False):
+        """Run jobs until interrupted, or with ``once`` until none are
+        due.  Returns ``{job pk: status}`` of the jobs run.
+        """
+        if not self.processes:
+            while True:
+                reclaim()
+                claimed = claim(1)
+                for pk in claimed:
+                    self.finished[pk] = run_job(pk, heartbeat=True)
+                if not claimed:
+                    if once:
+                        return self.finished
+                    time.sleep(self.poll)
+
+        _close_connections()
+        pool = multiprocessing.Pool(self.processes, initializer=_initialize)
+        running = {}
+        try:
+            while True:
+                for pk, pending in list(running.items()):
+                    if pending.ready():
+                        del running[pk]
+                        self.finished[pk] = pending.get()
+                if running:
+                    Job.objects.filter(pk__in=list(running)).update(
+                        heartbeat=timezone.now())
+                reclaim()
+                claimed = claim(self.processes - len(running))
+                for pk in claimed:
+                    running[pk] = pool.apply_async(run_job, (pk,))
+                if once and not claimed and not running:
+                    return self.finished
+                if not claimed:
+                    time.sleep(self.poll)
+        finally:
+            pool.close()
+            pool.join()
+
+
+@task('rebuild_rollups')
+def rebuild_rollups(job):
+    job.set_progress(0.0, 'Rebuilding monthly metrics.')
+    rollups.rebuild(progress=lambda done: job.set_progress(
+        done, 'Rebuilding monthly metrics.'))
+    return {'resource_months': ResourceMonth.objects.count(),
+            'project_months': ProjectMonth.objects.count()}
+
+
+@task('refresh_resource')
+def refresh_resource(job, pk, start, end):
+    rollups.refresh_resources([pk], _date(start), _date(end))
+
+
+@task('refresh_project')
+def refresh_project(job, pk, start, end):
+    rollups.refresh_projects([pk], _date(start), _date(end))
+
+
+@task('build_planning_snapshot')
+def build_planning_snapshot(job):
+    return {'generation': snapshot.build()}
+
+
+@task('take_plan_snapshot')
+def take_plan_snapshot(job, label='', checkpoint=False):
+    taken = history.take_snapshot(label, checkpoint)
+    return {'snapshot': taken.pk, 'changes': taken.changes,
+            'checkpoint': taken.checkpoint is not None}
+
+
+@task('scan_overallocation')
+def scan_overallocation(job, start=None, end=None, threshold=None):
+    found = conflicts.scan(start=_date(start), end=_date(end),
+                           threshold=threshold)
+    return [[conflict.resource_id, conflict.month, round(conflict.total, 4)]
+            for conflict in found]
+
+
+@task('scan_enjoyment')
+def scan_enjoyment(job, full=False, threshold=None, months=None,
+                   horizon=None, today=None):
+    scan = alerts.scan(full=full, threshold=threshold, months=months,
+                       horizon=horizon, today=_date(today))
+    return {'scan': scan.pk, 'full': scan.full, 'resources': scan.resources,
+            'alerts': EnjoymentAlert.objects.count()}
+
+
+@task('export_allocations')
+def export_allocations(job, path, start, end):
+    # written alongside and moved into place so readers never see half
+    temporary = '%s.%s.tmp' % (path, os.getpid())
+    total = max(1, allocation_count(_date(start), _date(end)))
+    rows = 0
+    with open(temporary, 'w') as handle:
+        for line in csv_lines(allocation_rows(_date(start), _date(end))):
+            handle.write(line)
+            rows += 1
+            if not rows % 1000:
+                job.set_progress(min(1.0, float(rows - 1) / total),
+                                 '%d rows written.' % (rows - 1))
+    getattr(os, 'replace', os.rename)(temporary, path)
+    return {'path': path, 'rows': rows - 1}
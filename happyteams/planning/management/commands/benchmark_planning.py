@@ -0,0 +1,47 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from planning.benchmark import SCALES, compare, run_benchmark
+
+def scales(value):
+    return [int(scale) for scale in value.split(',')]
+
+class Command(BaseCommand):
+    help = ('Times coverage, enjoyment, rollups, overlap queries and '
+            'imports against synthetic organizations of several sizes.  '
+            'Nothing is left in the database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', type=scales, default=list(SCALES),
+            help='Comma separated numbers of resources (default: %s).' %
+                 ','.join(str(scale) for scale in SCALES))
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--import-rows', type=int, default=1000,
+            help='Number of commitments in the timed CSV import.')
+        parser.add_argument('--output',
+            help='Write the JSON results to this file.')
+        parser.add_argument('--compare',
+            help='JSON results of an earlier run to compare against.')
+
+    def handle(self, *args, **options):
+        previous = {}
+        if options['compare']:
+            try:
+                with open(options['compare']) as handle:
+                    previous = json.load(handle)
+            except (IOError, ValueError) as e:
+                raise CommandError(e)
+
+        results = run_benchmark(options['scales'], options['seed'],
+                                options['import_rows'])
+        for scale, name, seconds, ratio in compare(results, previous):
+            queries = results['scales'][scale][name]['queries']
+            self.stdout.write('%8s  %-22s %9.3fs %8d queries%s' % (
+                scale, name, seconds, queries,
+                '  (x%.2f)' % ratio if ratio else ''))
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(results, handle, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(
+                'Wrote results to %s.' % options['output']))
@@ -0,0 +1,25 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from planning import snapshot
+
+class Command(BaseCommand):
+    help = ('Writes the memory-mapped planning snapshot that worker '
+            'processes read coverage and enjoyment from.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path',
+            help='Where to write the snapshot (default: PLANNING_SNAPSHOT).')
+
+    def handle(self, *args, **options):
+        path = options['path'] or snapshot.get_path()
+        if not path:
+            raise CommandError(
+                'Set PLANNING_SNAPSHOT or pass --path to build a snapshot.')
+        generation = snapshot.build(path)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                'Wrote generation %d of %s (%d bytes).' % (
+                    generation, path, os.path.getsize(path)))
+        )
@@ -0,0 +1,45 @@
+import datetime
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from planning import jobs
+from planning.export import allocation_rows, csv_lines
+
+def month(value):
+    return datetime.datetime.strptime(value[:7], '%Y-%m').date()
+
+class Command(BaseCommand):
+    help = ('Writes the resource x project x month allocation grid (hours '
+            'and percentage per month) as CSV.')
+
+    def add_arguments(self, parser):
+        year = datetime.date.today().year
+        parser.add_argument('--start', type=month,
+            default=datetime.date(year, 1, 1),
+            help='First month to export, as YYYY-MM.')
+        parser.add_argument('--end', type=month,
+            default=datetime.date(year, 12, 1),
+            help='Last month to export, as YYYY-MM.')
+        parser.add_argument('--output',
+            help='File to write to (default: standard output).')
+        parser.add_argument('--background', action='store_true',
+            help='Queue the export for run_worker; needs --output.')
+
+    def handle(self, *args, **options):
+        if options['end'] < options['start']:
+            raise CommandError('The end month is before the start.')
+        if options['background']:
+            if not options['output']:
+                raise CommandError('--background needs --output.')
+            job = jobs.enqueue(
+                'export_allocations', start=options['start'],
+                end=options['end'], path=os.path.abspath(options['output']))
+            self.stdout.write('Queued job %d.' % job.pk)
+            return
+        lines = csv_lines(allocation_rows(options['start'], options['end']))
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
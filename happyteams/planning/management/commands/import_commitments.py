@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from planning.importer import COLUMNS, CommitmentImport
+
+class Command(BaseCommand):
+    help = ('Loads commitments from a CSV file with the columns: %s.  '
+            'Projects are matched by name and resources by username.' %
+            ', '.join(COLUMNS))
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=1000,
+            help='Number of commitments written per insert.')
+        parser.add_argument('--dry-run', action='store_true',
+            help='Validate the file without writing anything.')
+
+    def handle(self, *args, **options):
+        try:
+            result = CommitmentImport(
+                options['path'],
+                batch_size=options['batch_size'],
+                dry_run=options['dry_run'],
+            ).run()
+        except (IOError, ValueError) as e:
+            raise CommandError(e)
+
+        for line, error in result.errors:
+            self.stderr.write('Line %d: %s' % (line, error))
+
+        if options['dry_run']:
+            message = '%d valid commitments (dry run, nothing written).'
+        else:
+            message = 'Successfully loaded %d commitments.'
+        self.stdout.write(self.style.SUCCESS(message % result.created))
+        if result.errors:
+            self.stdout.write(self.style.WARNING(
+                '%d problems found.' % len(result.errors)))
@@ -0,0 +1,57 @@
+import datetime
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from planning.reports import org_rollup
+from resources.models import OrganizationalUnit
+
+def month(value):
+    return datetime.datetime.strptime(value[:7], '%Y-%m').date()
+
+class Command(BaseCommand):
+    help = ('Reports monthly coverage, allocation and enjoyment for an '
+            'organizational unit and everything below it as JSON.')
+
+    def add_arguments(self, parser):
+        today = datetime.date.today().replace(day=1)
+        parser.add_argument('--unit', type=int,
+            help='Primary key of the unit to report on (default: all).')
+        parser.add_argument('--manager',
+            help='Report on every unit managed by this username.')
+        parser.add_argument('--start', type=month, default=today,
+            help='First month to report, as YYYY-MM.')
+        parser.add_argument('--end', type=month,
+            help='Last month to report, as YYYY-MM (default: --start).')
+        parser.add_argument('--over', type=float, default=1.0,
+            help='Coverage above which a resource is over allocated.')
+        parser.add_argument('--under', type=float, default=1.0,
+            help='Coverage below which a resource is under allocated.')
+        parser.add_argument('--indent', type=int)
+
+    def handle(self, *args, **options):
+        if options['manager']:
+            try:
+                manager = User.objects.get(username=options['manager'])
+            except User.DoesNotExist:
+                raise CommandError(
+                    'No user named "%s".' % options['manager'])
+            units = list(OrganizationalUnit.objects.filter(
+                Q(primary_manager=manager) | Q(secondary_manager=manager)))
+        elif options['unit']:
+            try:
+                units = [OrganizationalUnit.objects.get(pk=options['unit'])]
+            except OrganizationalUnit.DoesNotExist:
+                raise CommandError('No unit with id %s.' % options['unit'])
+        else:
+            units = [None]
+
+        reports = [
+            org_rollup(unit, options['start'], options['end'],
+                       over=options['over'], under=options['under'])
+            for unit in units
+        ]
+        self.stdout.write(json.dumps(
+            reports if options['manager'] else reports[0],
+            indent=options['indent']))
@@ -0,0 +1,35 @@
+import datetime
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from planning.history import unit_trend
+from resources.models import OrganizationalUnit
+
+def month(value):
+    return datetime.datetime.strptime(value[:7], '%Y-%m').date()
+
+class Command(BaseCommand):
+    help = ('Reports how the coverage and enjoyment projected for a unit '
+            'changed across the plan snapshots, as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('unit', type=int,
+            help='Primary key of the unit to report on.')
+        parser.add_argument('--start', type=month, required=True,
+            help='First month projected, as YYYY-MM.')
+        parser.add_argument('--end', type=month,
+            help='Last month projected, as YYYY-MM (default: --start).')
+        parser.add_argument('--since', type=int,
+            help='First snapshot to report (default: the earliest).')
+        parser.add_argument('--until', type=int,
+            help='Last snapshot to report (default: the latest).')
+        parser.add_argument('--indent', type=int)
+
+    def handle(self, *args, **options):
+        try:
+            unit = OrganizationalUnit.objects.get(pk=options['unit'])
+        except OrganizationalUnit.DoesNotExist:
+            raise CommandError('No unit with id %s.' % options['unit'])
+        report = unit_trend(unit, options['start'], options['end'],
+                            since=options['since'], until=options['until'])
+        self.stdout.write(json.dumps(report, indent=options['indent']))
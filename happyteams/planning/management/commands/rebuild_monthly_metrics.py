@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from planning import jobs, rollups
+from planning.models import ProjectMonth, ResourceMonth
+
+class Command(BaseCommand):
+    help = ('Rebuilds the monthly resource and project metrics from the '
+            'current commitments.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--background', action='store_true',
+            help='Queue the rebuild for run_worker instead.')
+
+    def handle(self, *args, **options):
+        if options['background']:
+            job = jobs.enqueue('rebuild_rollups')
+            self.stdout.write('Queued job %d.' % job.pk)
+            return
+        rollups.rebuild()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                'Successfully rebuilt %d resource and %d project months.' % (
+                    ResourceMonth.objects.count(),
+                    ProjectMonth.objects.count()))
+        )
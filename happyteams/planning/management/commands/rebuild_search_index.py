@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+from planning import search
+
+class Command(BaseCommand):
+    help = ('Recreates the full-text search index of sponsors, projects, '
+            'skills and skill levels.')
+
+    def handle(self, *args, **options):
+        count = search.rebuild()
+        if count is None:
+            raise CommandError(
+                'Full-text search needs SQLite with FTS5; searches will use '
+                'slower substring matching instead.')
+
+        self.stdout.write(
+            self.style.SUCCESS('Indexed %d documents.' % count))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from planning import jobs
+from planning.models import Job
+
+class Command(BaseCommand):
+    help = ('Runs queued background jobs (metric rebuilds, over allocation '
+            'scans, exports) on a pool of worker processes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int,
+            help='Worker processes; 0 runs jobs in this process '
+                 '(default: %s).' % jobs.get_option('PROCESSES'))
+        parser.add_argument('--poll', type=float,
+            help='Seconds to wait when no job is due (default: %s).' %
+                 jobs.get_option('POLL_SECONDS'))
+        parser.add_argument('--once', action='store_true',
+            help='Exit once no job is due instead of waiting for more.')
+        parser.add_argument('--purge-days', type=int, default=7,
+            help='Delete jobs that finished more than this many days ago.')
+
+    def handle(self, *args, **options):
+        jobs.purge(options['purge_days'])
+        worker = jobs.Worker(options['processes'], options['poll'])
+        try:
+            finished = worker.run(once=options['once'])
+        except KeyboardInterrupt:
+            finished = worker.finished
+        failed = sum(1 for status in finished.values()
+                     if status != Job.DONE)
+
+        style = self.style.WARNING if failed else self.style.SUCCESS
+        self.stdout.write(style('Ran %d jobs, %d failed.' % (
+            len(finished), failed)))
@@ -0,0 +1,58 @@
+import datetime
+import json
+
+from django.core.management.base import BaseCommand
+from planning import alerts, jobs
+
+def month(value):
+    return datetime.datetime.strptime(value[:7], '%Y-%m').date()
+
+class Command(BaseCommand):
+    help = ('Flags everyone whose projected enjoyment stays below the '
+            'threshold for several consecutive months, re-scoring only the '
+            'resources whose commitments or ratings changed since the last '
+            'scan.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+            help='Re-score every resource.')
+        parser.add_argument('--threshold', type=float,
+            help='Enjoyment to flag below (default: %s).' %
+                 alerts.get_option('THRESHOLD'))
+        parser.add_argument('--months', type=int,
+            help='Consecutive months below the threshold to flag '
+                 '(default: %s).' % alerts.get_option('MONTHS'))
+        parser.add_argument('--horizon', type=int,
+            help='Months to scan from the current one (default: %s).' %
+                 alerts.get_option('HORIZON'))
+        parser.add_argument('--start', type=month,
+            help='First month to scan, as YYYY-MM (default: this month).')
+        parser.add_argument('--background', action='store_true',
+            help='Queue the scan for run_worker instead.')
+        parser.add_argument('--json', action='store_true',
+            help='Print the alerts grouped by manager as JSON.')
+
+    def handle(self, *args, **options):
+        arguments = dict((name, options[name]) for name in (
+            'full', 'threshold', 'months', 'horizon'))
+        if options['background']:
+            job = jobs.enqueue('scan_enjoyment', today=options['start'],
+                               **arguments)
+            self.stdout.write('Queued job %d.' % job.pk)
+            return
+        scan = alerts.scan(today=options['start'], **arguments)
+        report = alerts.report()
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for group in report['managers']:
+            self.stdout.write('%s' % (group['username'] or '(no manager)'))
+            for alert in group['alerts']:
+                self.stdout.write('\t%s\t%s\t%s\t%d\t%.2f' % (
+                    alert['username'], alert['unit'], alert['start'][:7],
+                    alert['months'], alert['lowest']))
+
+        count = sum(len(group['alerts']) for group in report['managers'])
+        style = self.style.WARNING if count else self.style.SUCCESS
+        self.stdout.write(style('%d alerts (%s scan of %d resources).' % (
+            count, 'full' if scan.full else 'incremental', scan.resources)))
@@ -0,0 +1,40 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from planning import jobs
+from planning.conflicts import get_threshold, scan
+
+def month(value):
+    return datetime.datetime.strptime(value[:7], '%Y-%m').date()
+
+class Command(BaseCommand):
+    help = ('Lists every resource and month where the resource is '
+            'committed above the over allocation threshold.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float,
+            help='Allocation to flag above (default: %s).' % get_threshold())
+        parser.add_argument('--start', type=month,
+            help='First month to check, as YYYY-MM.')
+        parser.add_argument('--end', type=month,
+            help='Last month to check, as YYYY-MM.')
+        parser.add_argument('--background', action='store_true',
+            help='Queue the scan for run_worker instead.')
+
+    def handle(self, *args, **options):
+        if options['background']:
+            job = jobs.enqueue('scan_overallocation', start=options['start'],
+                               end=options['end'],
+                               threshold=options['threshold'])
+            self.stdout.write('Queued job %d.' % job.pk)
+            return
+        conflicts = scan(start=options['start'], end=options['end'],
+                         threshold=options['threshold'])
+        for conflict in conflicts:
+            self.stdout.write('%s\t%s\t%.2f' % (
+                conflict.resource_id, conflict.month.strftime('%Y-%m'),
+                conflict.total))
+
+        style = self.style.WARNING if conflicts else self.style.SUCCESS
+        self.stdout.write(style(
+            '%d over allocated resource months.' % len(conflicts)))
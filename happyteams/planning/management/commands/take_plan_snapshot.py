@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from planning import history, jobs
+
+class Command(BaseCommand):
+    help = ('Records the changes to commitments, skill ratings and project '
+            'statuses since the last plan snapshot; run it on a schedule.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--label', default='',
+            help='Name to give the snapshot, e.g. "Q2 review".')
+        parser.add_argument('--checkpoint', action='store_true',
+            help='Also store the whole plan with this snapshot.')
+        parser.add_argument('--background', action='store_true',
+            help='Queue the snapshot for run_worker instead.')
+
+    def handle(self, *args, **options):
+        if options['background']:
+            job = jobs.enqueue('take_plan_snapshot', label=options['label'],
+                               checkpoint=options['checkpoint'])
+            self.stdout.write('Queued job %d.' % job.pk)
+            return
+        snapshot = history.take_snapshot(options['label'],
+                                         options['checkpoint'])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                'Took snapshot %d with %d changes%s.' % (
+                    snapshot.pk, snapshot.changes,
+                    ' and a checkpoint' if snapshot.checkpoint else ''))
+        )
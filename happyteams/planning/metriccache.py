@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""Caching of per-resource and per-project monthly metrics.
+
+Each cached value's key includes a version number for its resource or
+project (and a global version), so invalidating everything cached for a
+resource or project is a single ``incr`` and old entries are simply never
+read again; they age out of the cache on their own.  Versions are bumped
+whenever a commitment or rating of a resource or project is written (see
+``planning.signals``), which is exactly when their coverage and enjoyment
+can change.  ``invalidate`` bumps once right away, so the writing
+transaction reads its own changes, and again once it commits, so a value a
+concurrent reader computed from the data before the commit and cached under
+the intermediate version is never read either.
+
+Values and versions live in the caches named by the ``METRIC_CACHE``
+setting, by default the in-process ``LRUMemoryCache`` below.  With more
+than one worker process, point ``VERSIONS`` at a cache they share (e.g.
+``FileBasedCache``) so every worker sees a bump.
+"""
+from __future__ import unicode_literals
+
+import pickle
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.db import transaction
+
+from .coverage import month_floor
+
+DEFAULTS = {
+    'VALUES': 'metrics',
+    'VERSIONS': 'metrics',
+}
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+# Django creates a cache backend per thread, so like ``LocMemCache`` the
+# storage is shared between them by cache location.
+_entries = defaultdict(OrderedDict)
+_locks = defaultdict(threading.Lock)
+_evictions = defaultdict(int)
+
+
+class LRUMemoryCache(BaseCache):
+    """A local memory cache that evicts the least recently used entry once
+    ``MAX_ENTRIES`` is reached (Django's ``LocMemCache`` culls a fraction
+    of its keys in no particular order).
+    """
+
+    def __init__(self, name, params):
+        super(LRUMemoryCache, self).__init__(params)
+        with _stats_lock:
+            self._entries = _entries[name]
+            self._lock = _locks[name]
+        self._name = name
+
+    @property
+    def evictions(self):
+        return _evictions[self._name]
+
+    def _get(self, key):
+        # the entry for ``key`` marked as most recently used, or None
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.time():
+            return None
+        self._entries[key] = entry
+        return entry
+
+    def _set(self, key, value, timeout):
+        self._entries.pop(key, None)
+        while len(self._entries) >= self._max_entries:
+            self._entries.popitem(last=False)
+            _evictions[self._name] += 1
+        self._entries[key] = (
+            pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+            self.get_backend_timeout(timeout))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            if self._get(key) is not None:
+                return False
+            self._set(key, value, timeout)
+            return True
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            entry = self._get(key)
+        return default if entry is None else pickle.loads(entry[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            self._set(key, value, timeout)
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            entry = self._get(key)
+            if entry is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(entry[0]) + delta
+            self._entries[key] = (
+                pickle.dumps(value, pickle.HIGHEST_PROTOCOL), entry[1])
+        return value
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            return self._get(key) is not None
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _cache(name):
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, 'METRIC_CACHE', {}))
+    return caches[options[name]]
+
+
+def _version_key(kind, pk=None):
+    return 'metric-version:%s:%s' % (kind, '*' if pk is None else pk)
+
+
+def _fresh_version():
+    # a version never handed out before, for keys that were evicted
+    return int(time.time() * 1000000)
+
+
+def _versions(kind, pk):
+    versions = _cache('VERSIONS')
+    keys = [_version_key('all'), _version_key(kind, pk)]
+    found = versions.get_many(keys)
+    for key in keys:
+        if key not in found:
+            versions.add(key, _fresh_version(), None)
+            found[key] = versions.get(key)
+    return [found[key] for key in keys]
+
+
+def cached(kind, pk, name, month, compute):
+    """Return the ``name`` metric of the ``kind`` ('resource' or 'project')
+    with primary key ``pk`` for ``month``, calling ``compute()`` on a miss.
+    """
+    values = _cache('VALUES')
+    key = 'metric:%s:%s:%s:%s:%s:%s' % (
+        (kind, pk, name, month_floor(month).isoformat()) +
+        tuple(_versions(kind, pk)))
+    entry = values.get(key)
+    with _stats_lock:
+        _stats['hits' if entry is not None else 'misses'] += 1
+    if entry is not None:
+        return entry[0]
+    value = compute()
+    values.set(key, (value,), None)
+    return value
+
+
+def _bump(key):
+    versions = _cache('VERSIONS')
+    try:
+        versions.incr(key)
+    except ValueError:
+        versions.set(key, _fresh_version(), None)
+
+
+def _bump_all(keys):
+    for key in keys:
+        _bump(key)
+
+
+def invalidate(kind, pks):
+    """Drop every cached metric of the given resources or projects (of
+    everything when ``pks`` is ``None``), now and when the current
+    transaction commits.
+    """
+    if pks is None:
+        bump('all')
+        return
+    keys = [_version_key(kind, pk) for pk in pks]
+    _bump_all(keys)
+    transaction.on_commit(lambda: _bump_all(keys))
+
+
+def version(name):
+    """Return the shared version of ``name``, which a process-local cache
+    can compare to notice a ``bump`` made by any process.
+    """
+    versions = _cache('VERSIONS')
+    key = _version_key(name)
+    found = versions.get(key)
+    if found is None:
+        versions.add(key, _fresh_version(), None)
+        found = versions.get(key)
+    return found
+
+
+def bump(name):
+    """Change the shared version of ``name``, now and when the current
+    transaction commits.
+    """
+    keys = [_version_key(name)]
+    _bump_all(keys)
+    transaction.on_commit(lambda: _bump_all(keys))
+
+
+def stats():
+    """Return this process's hit and miss counts (and LRU evictions)."""
+    values = _cache('VALUES')
+    with _stats_lock:
+        found = dict(_stats)
+    if isinstance(values, LRUMemoryCache):
+        found.update(entries=len(values), evictions=values.evictions)
+    return found
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.update(hits=0, misses=0)
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 21:39
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0001_initial'),
+        ('crm', '0002_project_skills'),
+        ('planning', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectMonth',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(db_index=True)),
+                ('coverage', models.FloatField(default=0.0)),
+                ('hours', models.FloatField(default=0.0)),
+                ('team_enjoyment', models.FloatField(blank=True, null=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crm.Project')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResourceMonth',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(db_index=True)),
+                ('coverage', models.FloatField(default=0.0)),
+                ('hours', models.FloatField(default=0.0)),
+                ('enjoyment', models.FloatField(blank=True, null=True)),
+                ('resource', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='resources.Resource')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='resourcemonth',
+            unique_together=set([('resource', 'month')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='projectmonth',
+            unique_together=set([('project', 'month')]),
+        ),
+    ]
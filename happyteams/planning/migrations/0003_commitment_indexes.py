@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 21:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planning', '0002_monthly_metrics'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commitment',
+            index=models.Index(fields=['resource', 'start', 'end'], name='planning_co_resourc_0bbac7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commitment',
+            index=models.Index(fields=['project', 'start', 'end'], name='planning_co_project_377f6a_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 22:19
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planning', '0005_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=32)),
+                ('row', models.IntegerField()),
+                ('action', models.CharField(choices=[('added', 'Added'), ('changed', 'Changed'), ('removed', 'Removed')], max_length=8)),
+                ('values', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PlanSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('label', models.CharField(blank=True, max_length=64)),
+                ('changes', models.PositiveIntegerField(default=0)),
+                ('checkpoint', models.BinaryField(null=True)),
+            ],
+            options={
+                'ordering': ('pk',),
+            },
+        ),
+        migrations.AddField(
+            model_name='planchange',
+            name='snapshot',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deltas', to='planning.PlanSnapshot'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import DatabaseError, migrations
+
+# documents are keyed by pk * 8 + a code for their kind (see planning.search)
+POPULATE = (
+    "INSERT INTO planning_search (rowid, title, body) "
+    "SELECT id * 8 + 1, name, description FROM crm_project",
+    "INSERT INTO planning_search (rowid, title, body) "
+    "SELECT id * 8 + 2, name, description FROM crm_sponsor",
+    "INSERT INTO planning_search (rowid, title, body) "
+    "SELECT id * 8 + 3, name, description FROM resources_skill",
+    "INSERT INTO planning_search (rowid, title, body) "
+    "SELECT level.id * 8 + 4, skill.name || ' level ' || level.rank, "
+    "level.description FROM resources_skilllevel level "
+    "JOIN resources_skill skill ON skill.id = level.skill_id",
+)
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                "CREATE VIRTUAL TABLE planning_search USING fts5(title, body, "
+                "tokenize='unicode61 remove_diacritics 1', prefix='2 3')")
+        except DatabaseError:
+            # no FTS5 in this SQLite; searches fall back to icontains
+            return
+        for sql in POPULATE:
+            cursor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS planning_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0003_project_root'),
+        ('resources', '0003_hourly_rates'),
+        ('planning', '0006_plan_history'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 22:27
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0003_hourly_rates'),
+        ('planning', '0008_change_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnjoymentAlert',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateField()),
+                ('months', models.PositiveIntegerField()),
+                ('lowest', models.FloatField()),
+                ('average', models.FloatField()),
+                ('resource', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='resources.Resource')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EnjoymentScan',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('finished', models.DateTimeField(default=django.utils.timezone.now)),
+                ('start', models.DateField()),
+                ('horizon', models.PositiveIntegerField()),
+                ('months', models.PositiveIntegerField()),
+                ('threshold', models.FloatField()),
+                ('full', models.BooleanField(default=False)),
+                ('resources', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ('pk',),
+            },
+        ),
+        migrations.CreateModel(
+            name='StaleEnjoyment',
+            fields=[
+                ('resource_id', models.IntegerField(primary_key=True, serialize=False)),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 22:43
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def hold_pending_keys(apps, schema_editor):
+    # the oldest pending job of each key holds it; any duplicates the old
+    # check-then-insert let through are left without one
+    Job = apps.get_model('planning', 'Job')
+    held = set()
+    for pk, key in Job.objects.filter(status='pending').order_by(
+            'pk').values_list('pk', 'key'):
+        if key not in held:
+            held.add(key)
+            Job.objects.filter(pk=pk).update(pending_key=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('planning', '0009_enjoyment_alerts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='heartbeat',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='pending_key',
+            field=models.CharField(editable=False, max_length=128, null=True, unique=True),
+        ),
+        migrations.RunPython(hold_pending_keys, migrations.RunPython.noop),
+    ]
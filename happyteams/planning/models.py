@@ -1,11 +1,67 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.utils import timezone
 
 from crm.models import Project
 from resources.models import Resource
 
+from .workcalendar import get_calendar, unit_calendars
+
+import calendar
+import json
+
+
+def commitment_errors(start, end, percentage, hours, project_start,
+                      project_end, working_calendar=None):
+    """Return a list of the problems with a commitment's values.  This lets
+    bulk loaders validate rows without building (or saving) model instances.
+    """
+    errors = []
+    # ensure that the commitment falls within the project's schedule
+    if not (project_start <= start <= end <= project_end and
+            end > project_start and start < project_end):
+        errors.append(
+            'Ensure the commitments dates are with the Project schedule.')
+
+    if percentage is None and hours is None:
+        errors.append('You must provide either a Percentage or Hours.')
+    if percentage is not None and hours is not None:
+        errors.append(
+            'You can provide either a Percentage or Hours, but not both.')
+
+    if hours and not errors:
+        # ensure the number of hours does not exceed the number of working
+        # hours in the months covered.
+        working_calendar = working_calendar or get_calendar()
+        if hours > working_calendar.hours_between(start, end):
+            errors.append('The Hours exceed the working hours available '
+                          'between the start and end dates.')
+
+    return errors
+
+
+class CommitmentQuerySet(models.QuerySet):
+
+    def overlapping(self, start, end):
+        """Commitments sharing at least one day with ``start``-``end``.
+
+        Written as two range predicates on the raw columns so the
+        (resource, start, end) and (project, start, end) indexes apply.
+        """
+        return self.filter(start__lte=end, end__gte=start)
+
+    def active_in(self, month):
+        """Commitments covering any part of the month containing
+        ``month``.
+        """
+        first = month.replace(day=1)
+        last = month.replace(
+            day=calendar.monthrange(month.year, month.month)[1])
+        return self.overlapping(first, last)
+
 
 class Commitment(models.Model):
     """This model captures the commitments for a specific resource on a
@@ -23,27 +79,210 @@ class Commitment(models.Model):
     hours = models.DecimalField(max_digits=7, decimal_places=2,
         null=True, blank=True)
 
+    objects = CommitmentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['resource', 'start', 'end']),
+            models.Index(fields=['project', 'start', 'end']),
+        ]
+
     def clean(self):
-        # ensure that the 
-        try:
-            assert self.start >= self.project.start
-            assert self.end > self.project.start
-            assert self.start < self.project.end
-            assert self.end <= self.project.end
-        except:
-            raise 'Ensure the commitments dates are with the Project schedule.'
-
-        
-        if self.percentage is None and self.hours is None:
-            raise 'You must provide either a Percentage or Hours.'
-        if self.percentage is not None and self.hours is not None:
-            raise 'You can provide either a Percentage or Hours, but not both.'
-
-        if self.hours:
-            # add logic to ensure the number of hours does not exceed the number
-            # of working hours in the month.
-            pass
+        working_calendar = None
+        if self.hours and unit_calendars():
+            working_calendar = get_calendar(self.resource.unit.abbreviation)
+        errors = commitment_errors(self.start, self.end, self.percentage,
+            self.hours, self.project.start, self.project.end,
+            working_calendar)
+        if errors:
+            raise ValidationError(errors)
 
     def save(self, *args, **kwargs):
         self.clean()
         return super(Commitment, self).save(*args, **kwargs)
+
+
+class ResourceMonth(models.Model):
+    """Materialized monthly metrics for a resource.  Rows are maintained by
+    ``planning.rollups`` as commitments change; months without any
+    commitments have no row.
+    """
+
+    resource = models.ForeignKey(Resource, on_delete=models.CASCADE)
+    month = models.DateField(db_index=True)
+    coverage = models.FloatField(default=0.0)
+    hours = models.FloatField(default=0.0)
+    enjoyment = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        unique_together = (('resource', 'month',),)
+
+
+class ProjectMonth(models.Model):
+    """Materialized monthly metrics for a project.  ``coverage`` is the sum
+    of the committed fractions, i.e. the number of full time resources.
+    """
+
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    month = models.DateField(db_index=True)
+    coverage = models.FloatField(default=0.0)
+    hours = models.FloatField(default=0.0)
+    team_enjoyment = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        unique_together = (('project', 'month',),)
+
+
+class Scenario(models.Model):
+    """A saved what-if scenario.  ``changes`` holds the JSON form of a
+    ``planning.scenarios.Overlay``; the plan itself is untouched until the
+    overlay is committed.
+    """
+
+    name = models.CharField(max_length=64, unique=True)
+    description = models.TextField(blank=True)
+    changes = models.TextField(default='{}', editable=False)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def overlay(self):
+        from .scenarios import Overlay
+        return Overlay.from_dict(json.loads(self.changes))
+
+    def set_overlay(self, overlay):
+        self.changes = json.dumps(overlay.to_dict(), sort_keys=True)
+
+
+class Job(models.Model):
+    """A unit of background work run by ``manage.py run_worker`` (see
+    ``planning.jobs``).  ``key`` identifies identical work; a pending job
+    also holds it in the unique ``pending_key``, so the database itself
+    keeps identical work from being queued twice.  A running job's
+    ``heartbeat`` shows its worker is still alive.
+    """
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    kind = models.CharField(max_length=64)
+    key = models.CharField(max_length=128, db_index=True)
+    pending_key = models.CharField(max_length=128, null=True, unique=True,
+                                   editable=False)
+    arguments = models.TextField(default='{}')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES,
+                              default=PENDING)
+    run_after = models.DateTimeField()
+    progress = models.FloatField(default=0.0)
+    message = models.CharField(max_length=255, blank=True)
+    result = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    heartbeat = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+        ordering = ('run_after', 'pk')
+
+    def set_progress(self, progress, message=''):
+        """Record how far through the job is, visible to other processes
+        straight away.
+        """
+        self.progress, self.message = progress, message[:255]
+        # not once another worker has claimed the job
+        Job.objects.filter(pk=self.pk, attempts=self.attempts).update(
+            progress=self.progress, message=self.message,
+            heartbeat=timezone.now())
+
+
+class PlanSnapshot(models.Model):
+    """A point in the history of the plan (see ``planning.history``).  The
+    rows that changed since the previous snapshot are its ``deltas``; a
+    checkpoint snapshot also stores the whole plan, compressed.
+    """
+
+    taken = models.DateTimeField(default=timezone.now, db_index=True)
+    label = models.CharField(max_length=64, blank=True)
+    changes = models.PositiveIntegerField(default=0)
+    checkpoint = models.BinaryField(null=True, editable=False)
+
+    class Meta:
+        ordering = ('pk',)
+
+
+class PlanChange(models.Model):
+    """A row added, removed or changed between two snapshots.  ``values``
+    holds the row's new values as a JSON list and is empty for removals.
+    """
+
+    ADDED = 'added'
+    CHANGED = 'changed'
+    REMOVED = 'removed'
+    ACTION_CHOICES = (
+        (ADDED, 'Added'),
+        (CHANGED, 'Changed'),
+        (REMOVED, 'Removed'),
+    )
+
+    snapshot = models.ForeignKey(PlanSnapshot, on_delete=models.CASCADE,
+                                 related_name='deltas')
+    table = models.CharField(max_length=32)
+    row = models.IntegerField()
+    action = models.CharField(max_length=8, choices=ACTION_CHOICES)
+    values = models.TextField(blank=True)
+
+
+class ChangeCounter(models.Model):
+    """How many times rows of a table were written, maintained by database
+    triggers (see ``planning.changes``).
+    """
+
+    name = models.CharField(max_length=64, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+
+class EnjoymentAlert(models.Model):
+    """A resource whose projected enjoyment stays below the alert threshold
+    for the required number of consecutive months (see
+    ``planning.alerts``).  ``start`` and ``months`` describe the longest
+    such run within the scanned horizon.
+    """
+
+    resource = models.OneToOneField(Resource, on_delete=models.CASCADE)
+    start = models.DateField()
+    months = models.PositiveIntegerField()
+    lowest = models.FloatField()
+    average = models.FloatField()
+
+
+class EnjoymentScan(models.Model):
+    """A run of the enjoyment alert scan and the parameters it used."""
+
+    finished = models.DateTimeField(default=timezone.now)
+    start = models.DateField()
+    horizon = models.PositiveIntegerField()
+    months = models.PositiveIntegerField()
+    threshold = models.FloatField()
+    full = models.BooleanField(default=False)
+    resources = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ('pk',)
+
+
+class StaleEnjoyment(models.Model):
+    """A resource whose commitments or skill ratings changed since the last
+    enjoyment alert scan, recorded by database triggers.
+    """
+
+    resource_id = models.IntegerField(primary_key=True)
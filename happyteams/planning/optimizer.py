@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""Enjoyment maximizing staffing proposals.
+
+Given open demand as ``(project, skill, hours per month)`` the optimizer
+fills as much of it as the resources' remaining capacity allows and, among
+all such assignments, picks the one with the highest total enjoyment
+(hours x ``SkillEnjoyment.value``).  Each month is solved as a min-cost
+max-flow problem::
+
+    source -> skill -> enjoyment profile -> sink
+
+Flow is measured in hours at the full monthly rate: an hour of flow to a
+project running for part of a month is worth only its working-day share of
+an hour of work, so no resource can be proposed at more than 100% of their
+remaining capacity even over a short stretch of a month.
+
+Demands for the same skill and share of the month are interchangeable, as
+are resources who rated every demanded skill the same way, so the flow
+network only has a node per skill and share and per distinct profile no
+matter how many projects and people are involved.  The flow is then split
+back out into per-project, per-resource hours and returned as unsaved
+``Commitment`` objects for review.
+"""
+from __future__ import unicode_literals
+
+import heapq
+from decimal import Decimal
+
+from django.db import transaction
+
+from crm.models import Project
+from resources.models import Resource, ResourceSkill
+
+from .coverage import coverage_matrix, month_end, month_range
+from .models import Commitment
+from .workcalendar import get_calendar, unit_calendars
+
+INFINITY = float('inf')
+
+
+class MinCostFlow(object):
+    """Successive shortest paths with Dijkstra over reduced costs."""
+
+    def __init__(self, size):
+        self.graph = [[] for _ in range(size)]
+
+    def add_edge(self, source, target, capacity, cost):
+        """Add an edge and return a handle for reading its flow later."""
+        self.graph[source].append(
+            [target, capacity, cost, len(self.graph[target])])
+        self.graph[target].append(
+            [source, 0, -cost, len(self.graph[source]) - 1])
+        return source, len(self.graph[source]) - 1
+
+    def flow(self, handle):
+        source, index = handle
+        target, _, _, reverse = self.graph[source][index]
+        return self.graph[target][reverse][1]
+
+    def _potentials(self, source):
+        # Bellman-Ford so the negative edge costs are handled
+        distance = [INFINITY] * len(self.graph)
+        distance[source] = 0
+        for _ in range(len(self.graph)):
+            changed = False
+            for node, edges in enumerate(self.graph):
+                if distance[node] == INFINITY:
+                    continue
+                for target, capacity, cost, _ in edges:
+                    if capacity and distance[node] + cost < distance[target]:
+                        distance[target] = distance[node] + cost
+                        changed = True
+            if not changed:
+                break
+        return [0 if d == INFINITY else d for d in distance]
+
+    def _shortest(self, source, potential):
+        # Dijkstra over reduced costs, which the potentials keep >= 0
+        distance = [INFINITY] * len(self.graph)
+        distance[source] = 0
+        queue = [(0, source)]
+        while queue:
+            dist, node = heapq.heappop(queue)
+            if dist > distance[node]:
+                continue
+            for target, capacity, cost, _ in self.graph[node]:
+                if not capacity:
+                    continue
+                reduced = dist + cost + potential[node] - potential[target]
+                if reduced < distance[target]:
+                    distance[target] = reduced
+                    heapq.heappush(queue, (reduced, target))
+        return distance
+
+    def _levels(self, source, potential):
+        # breadth first levels over the zero reduced cost edges
+        level = [-1] * len(self.graph)
+        level[source] = 0
+        queue = [source]
+        for node in queue:
+            for target, capacity, cost, _ in self.graph[node]:
+                if (capacity and level[target] < 0 and
+                        cost + potential[node] == potential[target]):
+                    level[target] = level[node] + 1
+                    queue.append(target)
+        return level
+
+    def _push(self, node, sink, limit, level, position, potential):
+        if node == sink:
+            return limit
+        edges = self.graph[node]
+        while position[node] < len(edges):
+            edge = edges[position[node]]
+            target, capacity, cost = edge[0], edge[1], edge[2]
+            if (capacity and level[target] == level[node] + 1 and
+                    cost + potential[node] == potential[target]):
+                pushed = self._push(target, sink, min(limit, capacity),
+                                    level, position, potential)
+                if pushed:
+                    edge[1] -= pushed
+                    self.graph[target][edge[3]][1] += pushed
+                    return pushed
+            position[node] += 1
+        return 0
+
+    def solve(self, source, sink):
+        """Push the maximum flow from ``source`` to ``sink`` at minimum
+        cost.  Returns ``(flow, cost)``.
+
+        Each round finds shortest path distances once and then saturates
+        every shortest path with a blocking flow, so the number of rounds
+        is bounded by the number of distinct path costs rather than the
+        number of augmenting paths.
+        """
+        potential = self._potentials(source)
+        total_flow = total_cost = 0
+        while True:
+            distance = self._shortest(source, potential)
+            if distance[sink] == INFINITY:
+                return total_flow, total_cost
+            for node, dist in enumerate(distance):
+                potential[node] += min(dist, distance[sink])
+            path_cost = potential[sink] - potential[source]
+
+            while True:
+                level = self._levels(source, potential)
+                if level[sink] < 0:
+                    break
+                position = [0] * len(self.graph)
+                while True:
+                    pushed = self._push(source, sink, INFINITY, level,
+                                        position, potential)
+                    if not pushed:
+                        break
+                    total_flow += pushed
+                    total_cost += pushed * path_cost
+
+
+class Proposal(object):
+    """The result of ``propose_assignments``.
+
+    ``commitments`` are unsaved ``Commitment`` instances, ``unmet`` maps
+    ``(project_id, skill_id, month)`` to the hours that could not be staffed
+    and ``enjoyment`` is the total hours x enjoyment value of the proposal.
+    """
+
+    def __init__(self):
+        self.commitments = []
+        self.unmet = {}
+        self.enjoyment = 0
+
+    def save(self):
+        """Write the proposed commitments once they have been reviewed."""
+        with transaction.atomic():
+            for commitment in self.commitments:
+                commitment.save()
+
+
+def _fill(demands, supplies, hours):
+    # pair up the front of two [key, hours] queues until ``hours`` is used
+    while hours:
+        demand, supply = demands[0], supplies[0]
+        amount = min(hours, demand[1], supply[1])
+        yield demand[0], supply[0], amount
+        hours -= amount
+        demand[1] -= amount
+        supply[1] -= amount
+        if not demand[1]:
+            demands.pop(0)
+        if not supply[1]:
+            supplies.pop(0)
+
+
+def propose_assignments(demand, start, end=None, resources=None):
+    """Propose commitments to cover ``demand`` from ``start`` to ``end``.
+
+    ``demand`` is an iterable of ``(project, skill, hours_per_month)``
+    where project and skill may be instances or primary keys.  Only months
+    within each project's schedule are staffed, prorated by working days
+    in partial months.  ``resources`` optionally limits who is considered.
+    """
+    demand = [(getattr(p, 'pk', p), getattr(s, 'pk', s), int(h))
+              for p, s, h in demand]
+    months = month_range(start, end or start)
+    skill_ids = sorted(set(skill for _, skill, _ in demand))
+    projects = dict(
+        (pk, (start, end)) for pk, start, end in Project.objects.filter(
+            pk__in=set(p for p, _, _ in demand)).values_list(
+                'pk', 'start', 'end'))
+
+    ratings = ResourceSkill.objects.filter(
+        skill__in=skill_ids, enjoyment__isnull=False)
+    if resources is not None:
+        ratings = ratings.filter(
+            resource__in=[getattr(r, 'pk', r) for r in resources])
+    enjoyment = {}
+    for resource_id, skill_id, value in ratings.values_list(
+            'resource_id', 'skill_id', 'enjoyment__value').iterator():
+        enjoyment.setdefault(resource_id, {})[skill_id] = value
+    candidates = sorted(enjoyment)
+
+    calendars = dict.fromkeys(candidates, get_calendar())
+    if unit_calendars():
+        calendars.update(
+            (pk, get_calendar(unit)) for pk, unit in Resource.objects.filter(
+                pk__in=candidates).values_list('pk', 'unit__abbreviation'))
+    coverage = coverage_matrix(candidates, months[0], months[-1])
+
+    # resources who rated every demanded skill the same are interchangeable
+    profiles = {}
+    for resource_id in candidates:
+        key = tuple(enjoyment[resource_id].get(s) for s in skill_ids)
+        profiles.setdefault(key, []).append(resource_id)
+    profile_keys = sorted(profiles, key=lambda key: profiles[key][0])
+
+    proposal = Proposal()
+    assigned = {}
+    source, sink = 0, 1
+    working_calendar = get_calendar()
+    for offset, month in enumerate(months):
+        last_day = month_end(month)
+        available = working_calendar.working_days(month)
+        # (skill, working days of the project in the month) -> demand at
+        # the full monthly rate
+        requested = {}
+        for project_id, skill_id, hours in demand:
+            if project_id not in projects:
+                continue
+            project_start, project_end = projects[project_id]
+            if project_start > last_day or project_end < month:
+                continue
+            days = working_calendar.working_days(
+                month, project_start, project_end)
+            if hours and days:
+                requested.setdefault((skill_id, days), []).append(
+                    [project_id, hours])
+
+        remaining = dict(
+            (pk, int(calendars[pk].capacity(month) *
+                     max(0.0, 1.0 - coverage.get(pk, month))))
+            for pk in candidates)
+
+        groups = sorted(requested)
+        network = MinCostFlow(2 + len(groups) + len(profile_keys))
+        group_node = dict((g, 2 + i) for i, g in enumerate(groups))
+        profile_node = dict((key, 2 + len(groups) + i)
+                            for i, key in enumerate(profile_keys))
+        for group in groups:
+            network.add_edge(source, group_node[group],
+                             sum(hours for _, hours in requested[group]), 0)
+        for key in profile_keys:
+            capacity = sum(remaining[pk] for pk in profiles[key])
+            if capacity:
+                network.add_edge(profile_node[key], sink, capacity, 0)
+        edges = []
+        index = dict((s, i) for i, s in enumerate(skill_ids))
+        for group in groups:
+            skill_id, days = group
+            for key in profile_keys:
+                value = key[index[skill_id]]
+                if value is not None:
+                    # an hour of flow is ``days / available`` hours of work
+                    edges.append((group, key, value, network.add_edge(
+                        group_node[group], profile_node[key],
+                        INFINITY, -value * days)))
+        network.solve(source, sink)
+
+        # split each group -> profile flow back out to projects and people
+        supplies = dict(
+            (key, [[pk, remaining[pk]] for pk in profiles[key]
+                   if remaining[pk]]) for key in profile_keys)
+        for group, key, value, handle in edges:
+            flow = network.flow(handle)
+            for project_id, resource_id, hours in _fill(
+                    requested[group], supplies[key], flow):
+                pair = (project_id, resource_id)
+                assigned.setdefault(pair, [0] * len(months))[offset] += hours
+                proposal.enjoyment += value * hours * group[1] / available
+        for (skill_id, days), wanted in requested.items():
+            for project_id, hours in wanted:
+                proposal.unmet[(project_id, skill_id, month)] = int(
+                    round(hours * days / available))
+
+    for (project_id, resource_id), hours_by_month in sorted(assigned.items()):
+        proposal.commitments.extend(_commitments(
+            project_id, resource_id, months, hours_by_month,
+            projects[project_id], calendars[resource_id]))
+    return proposal
+
+
+def _commitments(project_id, resource_id, months, hours_by_month, schedule,
+                 working_calendar):
+    # one percentage based commitment per run of months at the same rate;
+    # hours are at the full monthly rate, so never above capacity
+    current = None
+    for month, hours in zip(months, hours_by_month):
+        percentage = None
+        if hours:
+            percentage = Decimal(
+                100.0 * hours / working_calendar.capacity(month)
+            ).quantize(Decimal('0.01'))
+        if current is not None and current.percentage != percentage:
+            yield current
+            current = None
+        if percentage is None:
+            continue
+        if current is None:
+            current = Commitment(
+                project_id=project_id, resource_id=resource_id,
+                start=max(month, schedule[0]), percentage=percentage)
+        current.end = min(month_end(month), schedule[1])
+    if current is not None:
+        yield current
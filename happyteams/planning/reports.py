@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""Organizational unit and project lineage rollup reports.
+
+Per unit and month the database sums the materialized ``ResourceMonth``
+rows of the unit's own resources; a single pass up the tree (deepest units
+first) then folds every unit's totals into its ancestors, so each unit in
+the report describes its whole subtree.  ``lineage_rollup`` similarly
+totals funding, committed hours and team enjoyment over each chain of
+follow-on projects.  The results are plain JSON-serializable data.
+"""
+from __future__ import unicode_literals
+
+from array import array
+
+from django.db.models import (Case, Count, F, FloatField, IntegerField, Sum,
+                              When)
+
+from crm.lineage import lineages
+from crm.models import BudgetIncrement
+from resources.models import OrganizationalUnit, Resource
+
+from .coverage import month_range, months_between
+from .models import Commitment, ProjectMonth, ResourceMonth
+
+FIELDS = ('coverage', 'over', 'covered', 'enjoyment', 'rated')
+
+
+def _flag(**condition):
+    return Sum(Case(When(then=1, **condition), default=0,
+                    output_field=IntegerField()))
+
+
+def org_rollup(unit, start, end=None, over=1.0, under=1.0):
+    """Report coverage and enjoyment for ``unit`` and every unit below it.
+
+    For each unit and month this gives the average coverage across the
+    subtree's headcount, the number of resources above ``over`` and below
+    ``under`` coverage, and the mean enjoyment of those with a score.
+    ``unit`` may be ``None`` to report on the whole organization.
+    """
+    months = month_range(start, end or start)
+    path = unit.path if unit is not None else ''
+
+    units = list(OrganizationalUnit.objects.filter(
+        path__startswith=path).order_by('path').values(
+            'pk', 'name', 'abbreviation', 'parent_id', 'depth'))
+    headcount = dict(
+        Resource.objects.filter(unit__path__startswith=path)
+        .values_list('unit_id').annotate(Count('pk')).order_by())
+
+    blank = array('d', [0.0]) * len(months)
+    totals = dict((u['pk'], dict((field, array('d', blank))
+                                 for field in FIELDS)) for u in units)
+    rows = ResourceMonth.objects.filter(
+        resource__unit__path__startswith=path,
+        month__gte=months[0], month__lte=months[-1],
+    ).values('resource__unit_id', 'month').annotate(
+        coverage_sum=Sum('coverage'),
+        over_count=_flag(coverage__gt=over),
+        covered_count=_flag(coverage__gte=under),
+        enjoyment_sum=Sum('enjoyment'),
+        rated_count=Count('enjoyment'),
+    ).order_by()
+    for row in rows.iterator():
+        unit_totals = totals[row['resource__unit_id']]
+        offset = months_between(months[0], row['month'])
+        unit_totals['coverage'][offset] += row['coverage_sum']
+        unit_totals['over'][offset] += row['over_count']
+        unit_totals['covered'][offset] += row['covered_count']
+        unit_totals['enjoyment'][offset] += row['enjoyment_sum'] or 0.0
+        unit_totals['rated'][offset] += row['rated_count']
+
+    # fold each unit into its parent, deepest units first
+    subtree_headcount = dict((u['pk'], headcount.get(u['pk'], 0))
+                             for u in units)
+    for u in sorted(units, key=lambda u: -u['depth']):
+        parent = u['parent_id']
+        if parent in totals:
+            subtree_headcount[parent] += subtree_headcount[u['pk']]
+            for field in FIELDS:
+                parent_totals = totals[parent][field]
+                for offset, value in enumerate(totals[u['pk']][field]):
+                    parent_totals[offset] += value
+
+    report = []
+    for u in units:
+        people = subtree_headcount[u['pk']]
+        unit_totals = totals[u['pk']]
+        report.append({
+            'id': u['pk'],
+            'name': u['name'],
+            'abbreviation': u['abbreviation'],
+            'parent': u['parent_id'],
+            'depth': u['depth'],
+            'headcount': people,
+            'months': [{
+                'month': month.isoformat(),
+                'coverage': (unit_totals['coverage'][i] / people
+                             if people else None),
+                'over_allocated': int(unit_totals['over'][i]),
+                'under_allocated': people - int(unit_totals['covered'][i]),
+                'enjoyment': (
+                    unit_totals['enjoyment'][i] / unit_totals['rated'][i]
+                    if unit_totals['rated'][i] else None),
+            } for i, month in enumerate(months)],
+        })
+    return {
+        'unit': unit.pk if unit is not None else None,
+        'months': [month.isoformat() for month in months],
+        'over': over,
+        'under': under,
+        'units': report,
+    }
+
+
+def lineage_rollup(projects):
+    """Report totals across the whole chain of follow-on projects each of
+    ``projects`` belongs to.
+
+    Funding is the sum of every ``BudgetIncrement`` in the chain, hours and
+    coverage (full time equivalent months) come from ``ProjectMonth`` and
+    enjoyment is the hours weighted mean of its ``team_enjoyment``.
+    """
+    chains = lineages(projects)
+    members = set(pk for chain in chains.values() for pk in chain)
+
+    funding = dict(BudgetIncrement.objects.filter(
+        project__in=members).values_list('project_id').annotate(
+            Sum('amount')).order_by())
+    months = dict(
+        (row['project_id'], row) for row in ProjectMonth.objects.filter(
+            project__in=members).values('project_id').annotate(
+                hours_sum=Sum('hours'),
+                coverage_sum=Sum('coverage'),
+                rated_hours=Sum(Case(
+                    When(team_enjoyment__isnull=False, then=F('hours')),
+                    default=0.0, output_field=FloatField())),
+                enjoyment_hours=Sum(
+                    F('hours') * F('team_enjoyment'),
+                    output_field=FloatField()),
+            ).order_by())
+    staffing = {}
+    for project_id, resource_id in Commitment.objects.filter(
+            project__in=members).values_list(
+                'project_id', 'resource_id').iterator():
+        staffing.setdefault(project_id, []).append(resource_id)
+
+    report = []
+    for pk, chain in chains.items():
+        rows = [months[member] for member in chain if member in months]
+        rated = sum(row['rated_hours'] or 0.0 for row in rows)
+        report.append({
+            'project': pk,
+            'lineage': chain,
+            'funding': float(sum(funding.get(member, 0) for member in chain)),
+            'hours': sum(row['hours_sum'] for row in rows),
+            'coverage': sum(row['coverage_sum'] for row in rows),
+            'enjoyment': (
+                sum(row['enjoyment_hours'] or 0.0 for row in rows) / rated
+                if rated else None),
+            'commitments': sum(
+                len(staffing.get(member, ())) for member in chain),
+            'resources': len(set(
+                resource_id for member in chain
+                for resource_id in staffing.get(member, ()))),
+        })
+    return report
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""Maintenance of the materialized ``ResourceMonth`` and ``ProjectMonth``
+tables.
+
+Saving or deleting a commitment only refreshes the months between its start
+and end for its resource and project (see ``planning.signals``);
+``rebuild`` recomputes everything and backs the ``rebuild_monthly_metrics``
+management command.
+"""
+from __future__ import unicode_literals
+
+from array import array
+
+from django.db import transaction
+from django.db.models import Max, Min
+
+from .coverage import (commitment_rows, month_end, month_range,
+                       overlapping_commitments, split_commitment)
+from . import metriccache
+from .enjoyment import score_enjoyment
+from .models import Commitment, ProjectMonth, ResourceMonth
+
+REBUILD_MONTHS = 12
+
+
+def _coverage(commitments, key, months):
+    # sum the committed fraction and hours per key and month
+    totals = {}
+    blank = array('d', [0.0]) * len(months)
+    for pk, start, end, percentage, hours, working_calendar in \
+            commitment_rows(commitments, key):
+        if pk not in totals:
+            totals[pk] = (array('d', blank), array('d', blank))
+        coverage, committed = totals[pk]
+        for offset, fraction in split_commitment(
+                start, end, percentage, hours, months[0], len(months),
+                working_calendar):
+            coverage[offset] += fraction
+            committed[offset] += fraction * working_calendar.capacity(
+                months[offset])
+    return totals
+
+
+def refresh_resources(resources, start, end):
+    """Recompute ``ResourceMonth`` rows for ``resources`` from ``start``
+    through ``end``.  ``resources`` may be ``None`` for every resource.
+    """
+    months = month_range(start, end)
+    metriccache.invalidate('resource', resources)
+    commitments = overlapping_commitments(
+        resources, months[0], month_end(months[-1]))
+    totals = _coverage(commitments, 'resource_id', months)
+    scores = score_enjoyment(months[0], months[-1], resources=resources)
+
+    stale = ResourceMonth.objects.filter(
+        month__gte=months[0], month__lte=months[-1])
+    if resources is not None:
+        stale = stale.filter(resource_id__in=resources)
+    with transaction.atomic():
+        stale.delete()
+        ResourceMonth.objects.bulk_create([
+            ResourceMonth(
+                resource_id=pk, month=month, coverage=coverage, hours=hours,
+                enjoyment=scores.resource(pk, month))
+            for pk, (coverage_row, hours_row) in totals.items()
+            for month, coverage, hours in zip(
+                months, coverage_row, hours_row) if coverage
+        ], batch_size=500)
+
+
+def refresh_projects(projects, start, end):
+    """Recompute ``ProjectMonth`` rows for ``projects`` from ``start``
+    through ``end``.  ``projects`` may be ``None`` for every project.
+    """
+    months = month_range(start, end)
+    metriccache.invalidate('project', projects)
+    commitments = Commitment.objects.overlapping(
+        months[0], month_end(months[-1]))
+    if projects is not None:
+        commitments = commitments.filter(project_id__in=projects)
+    totals = _coverage(commitments, 'project_id', months)
+    scores = score_enjoyment(months[0], months[-1], projects=projects)
+
+    stale = ProjectMonth.objects.filter(
+        month__gte=months[0], month__lte=months[-1])
+    if projects is not None:
+        stale = stale.filter(project_id__in=projects)
+    with transaction.atomic():
+        stale.delete()
+        ProjectMonth.objects.bulk_create([
+            ProjectMonth(
+                project_id=pk, month=month, coverage=coverage, hours=hours,
+                team_enjoyment=scores.project(pk, month))
+            for pk, (coverage_row, hours_row) in totals.items()
+            for month, coverage, hours in zip(
+                months, coverage_row, hours_row) if coverage
+        ], batch_size=500)
+
+
+def refresh_commitment(resource_id, project_id, start, end):
+    """Refresh the months a single commitment touches."""
+    refresh_resources([resource_id], start, end)
+    refresh_projects([project_id], start, end)
+
+
+def rebuild(progress=None):
+    """Recompute every monthly metric from scratch, ``REBUILD_MONTHS`` at a
+    time, calling ``progress`` with the fraction done after each batch.
+    Each batch is its own transaction, so a month's rows are always either
+    the old or the new ones.
+    """
+    bounds = Commitment.objects.aggregate(start=Min('start'), end=Max('end'))
+    if bounds['start'] is None:
+        with transaction.atomic():
+            ResourceMonth.objects.all().delete()
+            ProjectMonth.objects.all().delete()
+        return
+    months = month_range(bounds['start'], bounds['end'])
+    with transaction.atomic():
+        # months no commitment covers any more
+        for model in (ResourceMonth, ProjectMonth):
+            model.objects.exclude(
+                month__gte=months[0], month__lte=months[-1]).delete()
+    batches = [months[i:i + REBUILD_MONTHS]
+               for i in range(0, len(months), REBUILD_MONTHS)]
+    for done, batch in enumerate(batches, 1):
+        with transaction.atomic():
+            refresh_resources(None, batch[0], batch[-1])
+            refresh_projects(None, batch[0], batch[-1])
+        if progress is not None:
+            progress(float(done) / len(batches))
+
+
+def refresh_resource_skills(resource_id):
+    """Refresh every month a resource is committed in after their skill
+    ratings change, along with the projects they are committed to.
+    """
+    commitments = Commitment.objects.filter(resource_id=resource_id)
+    bounds = commitments.aggregate(start=Min('start'), end=Max('end'))
+    if bounds['start'] is None:
+        return
+    refresh_resources([resource_id], bounds['start'], bounds['end'])
+    refresh_projects(
+        list(commitments.values_list('project_id', flat=True).distinct()),
+        bounds['start'], bounds['end'])
+
+
+def refresh_project_skills(project_id):
+    """Refresh every month a project has commitments in after the skills it
+    uses change, along with the resources committed to it.
+    """
+    commitments = Commitment.objects.filter(project_id=project_id)
+    bounds = commitments.aggregate(start=Min('start'), end=Max('end'))
+    if bounds['start'] is None:
+        return
+    refresh_projects([project_id], bounds['start'], bounds['end'])
+    refresh_resources(
+        list(commitments.values_list('resource_id', flat=True).distinct()),
+        bounds['start'], bounds['end'])
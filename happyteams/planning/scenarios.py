@@ -0,0 +1,429 @@
+# -*- coding: utf-8 -*-
+"""What-if planning scenarios.
+
+An ``Overlay`` records changes to the plan (commitments added, removed or
+modified and project status overrides) without touching the database.
+``ScenarioResult`` evaluates an overlay: it reads the current commitments of
+only the resources and projects the overlay touches, applies the changes in
+memory and recomputes their coverage, probability weighted coverage,
+enjoyment and over-allocations.  Everyone else is unaffected and keeps the
+values in ``ResourceMonth``/``ProjectMonth``, which ``diff`` compares
+against.
+
+Overlays serialize to a small JSON-able dict (``Scenario`` stores one) and
+``Overlay.commit`` writes the changes to the real tables in one transaction.
+"""
+from __future__ import unicode_literals
+
+import datetime
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+
+from crm.models import Project
+from resources.models import Resource
+
+from . import forecast, rollups, snapshot
+from .conflicts import Conflict, _allocations, _month, _ordinal, get_threshold
+from .coverage import (CoverageMatrix, month_end, month_range,
+                       split_commitment)
+from .enjoyment import EnjoymentScores, EnjoymentTable
+from .models import (Commitment, ProjectMonth, ResourceMonth,
+                     commitment_errors)
+from .workcalendar import get_calendar, unit_calendars
+
+FIELDS = ('resource_id', 'project_id', 'start', 'end', 'percentage', 'hours')
+
+
+def _pk(obj):
+    return getattr(obj, 'pk', obj)
+
+
+def _encode(values):
+    return dict((field, None if value is None else (
+        value.isoformat() if isinstance(value, datetime.date) else
+        str(value) if isinstance(value, Decimal) else value))
+        for field, value in values.items())
+
+
+def _decode(values):
+    decoded = {}
+    for field, value in values.items():
+        if value is not None and field in ('start', 'end'):
+            value = datetime.datetime.strptime(value, '%Y-%m-%d').date()
+        elif value is not None and field in ('percentage', 'hours'):
+            value = Decimal(value)
+        decoded[field] = value
+    return decoded
+
+
+def _calendars(resource_ids):
+    # {resource pk: working calendar of their unit}
+    if not unit_calendars():
+        return dict((pk, get_calendar()) for pk in resource_ids)
+    return dict((pk, get_calendar(unit)) for pk, unit in
+                Resource.objects.filter(pk__in=resource_ids).values_list(
+                    'pk', 'unit__abbreviation'))
+
+
+def _fields(changes):
+    # accept resource=/project= as instances or keys
+    fields = {}
+    for field, value in changes.items():
+        if field in ('resource', 'project'):
+            field, value = field + '_id', _pk(value)
+        if field not in FIELDS:
+            raise TypeError('Unknown commitment field "%s".' % field)
+        if field in ('percentage', 'hours') and value is not None:
+            value = Decimal(str(value))
+        fields[field] = value
+    return fields
+
+
+class Overlay(object):
+    """Uncommitted changes to the plan.
+
+    ``added`` maps a temporary key to the fields of a new commitment,
+    ``removed`` holds the primary keys of deleted commitments, ``modified``
+    maps primary keys to changed fields and ``statuses`` maps project
+    primary keys to an overriding status.
+    """
+
+    def __init__(self, added=None, removed=None, modified=None,
+                 statuses=None):
+        self.added = dict(added or {})
+        self.removed = set(removed or ())
+        self.modified = dict(modified or {})
+        self.statuses = dict(statuses or {})
+
+    def add(self, resource, project, start, end, percentage=None,
+            hours=None):
+        """Add a commitment and return its temporary key."""
+        key = 'new-%d' % (max([0] + [int(k[4:]) for k in self.added]) + 1)
+        self.added[key] = _fields(dict(
+            resource=resource, project=project, start=start, end=end,
+            percentage=percentage, hours=hours))
+        return key
+
+    def remove(self, commitment):
+        """Remove a commitment (or an added one, by its temporary key)."""
+        key = _pk(commitment)
+        if key in self.added:
+            del self.added[key]
+            return
+        self.modified.pop(key, None)
+        self.removed.add(key)
+
+    def modify(self, commitment, **changes):
+        """Change fields of a commitment (or an added one)."""
+        key = _pk(commitment)
+        if key in self.added:
+            self.added[key].update(_fields(changes))
+        else:
+            self.modified.setdefault(key, {}).update(_fields(changes))
+
+    def reassign(self, commitment, on, resource=None, project=None):
+        """Hand the rest of ``commitment`` from ``on`` onwards to another
+        resource and/or project.  Returns the temporary key of the new part.
+
+        Hours based commitments are split in proportion to the working days
+        either side of ``on``.
+        """
+        changes = {}
+        if resource is not None:
+            changes['resource'] = resource
+        if project is not None:
+            changes['project'] = project
+        if on <= commitment.start:
+            self.modify(commitment, **changes)
+            return None
+        working_calendar = _calendars([commitment.resource_id])[
+            commitment.resource_id]
+        before = commitment.start, on - datetime.timedelta(days=1)
+        hours = after_hours = commitment.hours
+        if hours is not None:
+            days = working_calendar.working_days_between(
+                commitment.start, commitment.end)
+            hours = (hours * working_calendar.working_days_between(*before) /
+                     days).quantize(Decimal('0.01')) if days else hours
+            after_hours = commitment.hours - hours
+        self.modify(commitment, end=before[1], hours=hours)
+        return self.add(
+            resource or commitment.resource_id,
+            project or commitment.project_id, on, commitment.end,
+            commitment.percentage, after_hours)
+
+    def set_status(self, project, status):
+        """Evaluate ``project`` as if it had ``status``."""
+        self.statuses[_pk(project)] = status
+
+    def to_dict(self):
+        return {
+            'added': dict((key, _encode(values))
+                          for key, values in self.added.items()),
+            'removed': sorted(self.removed),
+            'modified': dict((str(pk), _encode(values))
+                             for pk, values in self.modified.items()),
+            'statuses': dict((str(pk), status)
+                             for pk, status in self.statuses.items()),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            added=dict((key, _decode(values))
+                       for key, values in data.get('added', {}).items()),
+            removed=data.get('removed', ()),
+            modified=dict((int(pk), _decode(values))
+                          for pk, values in data.get('modified', {}).items()),
+            statuses=dict((int(pk), status)
+                          for pk, status in data.get('statuses', {}).items()))
+
+    def commit(self):
+        """Write the changes to the real tables, in one transaction, and
+        refresh what depends on them.  Raises ``ValidationError`` if any
+        new or modified commitment is invalid, or if a commitment, project
+        or resource it refers to no longer exists.
+        """
+        with transaction.atomic():
+            current = Commitment.objects.in_bulk(
+                list(self.removed) + list(self.modified))
+            missing = sorted(set(self.modified) - set(current))
+            if missing:
+                raise ValidationError([
+                    'Commitment %s no longer exists.' % pk for pk in missing])
+            rows = [Commitment(**values) for values in self.added.values()]
+            for pk, changes in self.modified.items():
+                values = dict((field, getattr(current[pk], field))
+                              for field in FIELDS)
+                values.update(changes)
+                rows.append(Commitment(pk=pk, **values))
+
+            project_ids = set(row.project_id for row in rows)
+            project_ids.update(self.statuses)
+            resource_ids = set(row.resource_id for row in rows)
+            schedules = Project.objects.in_bulk(project_ids)
+            resources = set(Resource.objects.filter(
+                pk__in=resource_ids).values_list('pk', flat=True))
+            errors = ['Project %s no longer exists.' % pk
+                      for pk in sorted(project_ids - set(schedules))]
+            errors.extend('Resource %s no longer exists.' % pk
+                          for pk in sorted(resource_ids - resources))
+            if errors:
+                raise ValidationError(errors)
+
+            calendars = _calendars(resource_ids)
+            for row in rows:
+                project = schedules[row.project_id]
+                errors.extend(commitment_errors(
+                    row.start, row.end, row.percentage, row.hours,
+                    project.start, project.end, calendars[row.resource_id]))
+            if errors:
+                raise ValidationError(errors)
+
+            # modified rows are replaced under their own primary keys; a
+            # plain delete would send post_delete (and refresh everything)
+            # per row, and nothing references commitments
+            Commitment.objects.filter(pk__in=list(current))._raw_delete(
+                Commitment.objects.db)
+            Commitment.objects.bulk_create(rows)
+            for status in set(self.statuses.values()):
+                Project.objects.filter(pk__in=[
+                    pk for pk, value in self.statuses.items()
+                    if value == status]).update(status=status)
+
+            # bulk writes skip the signals, so refresh dependants directly
+            spans = list(current.values()) + rows
+            if spans:
+                start = min(row.start for row in spans)
+                end = max(row.end for row in spans)
+                rollups.refresh_resources(
+                    list(set(row.resource_id for row in spans)), start, end)
+                rollups.refresh_projects(
+                    list(set(row.project_id for row in spans)), start, end)
+            for project_id in set(row.project_id for row in spans):
+                forecast.project_commitments_changed(project_id)
+            for project_id, status in self.statuses.items():
+                forecast.project_status_changed(project_id, status)
+            snapshot.schedule_rebuild()
+
+
+class ScenarioResult(object):
+    """An overlay evaluated from ``start`` through ``end``.
+
+    ``resources`` and ``projects`` are the primary keys the overlay
+    touches; results for anyone else are the stored ``ResourceMonth`` and
+    ``ProjectMonth`` values.
+    """
+
+    def __init__(self, overlay, start, end=None):
+        self.overlay = overlay
+        self.months = month_range(start, end or start)
+        first, last = self.months[0], month_end(self.months[-1])
+
+        previous = dict(
+            (row[0], dict(zip(FIELDS, row[1:])))
+            for row in Commitment.objects.filter(
+                pk__in=list(overlay.removed) + list(overlay.modified))
+            .values_list('pk', *FIELDS))
+        changed = list(previous.values()) + list(overlay.added.values()) + [
+            dict(previous.get(pk, {}), **changes)
+            for pk, changes in overlay.modified.items()]
+        self.resources = set(values['resource_id'] for values in changed)
+        self.projects = set(values['project_id'] for values in changed)
+        self.projects.update(overlay.statuses)
+
+        # every current commitment of the touched resources and projects,
+        # plus the people on projects whose status is overridden
+        commitments = Commitment.objects.overlapping(first, last).filter(
+            Q(resource__in=self.resources) | Q(project__in=self.projects) |
+            Q(resource__in=Commitment.objects.filter(
+                project__in=list(overlay.statuses)).values('resource_id')))
+        rows = {}
+        for row in commitments.values_list('pk', 'project__status', *FIELDS):
+            rows[row[0]] = dict(zip(FIELDS, row[2:]), status=row[1])
+        for pk in overlay.removed:
+            rows.pop(pk, None)
+        for pk, changes in overlay.modified.items():
+            if pk in rows:
+                rows[pk].update(changes)
+        rows.update((key, dict(values))
+                    for key, values in overlay.added.items())
+        self.resources.update(row['resource_id'] for row in rows.values()
+                              if row['project_id'] in overlay.statuses)
+
+        statuses = dict(Project.objects.filter(pk__in=set(
+            row['project_id'] for row in rows.values())).values_list(
+                'pk', 'status'))
+        statuses.update(overlay.statuses)
+        calendars = {}
+        if unit_calendars():
+            calendars = dict(
+                (pk, get_calendar(unit)) for pk, unit in
+                Resource.objects.filter(pk__in=set(
+                    row['resource_id'] for row in rows.values()))
+                .values_list('pk', 'unit__abbreviation'))
+        self.rows = [
+            dict(row, status=statuses.get(row['project_id']),
+                 calendar=calendars.get(row['resource_id'], get_calendar()))
+            for row in rows.values()]
+        self._evaluate()
+
+    def _split(self, row):
+        return split_commitment(
+            row['start'], row['end'], row['percentage'], row['hours'],
+            self.months[0], len(self.months), row['calendar'])
+
+    def _evaluate(self):
+        resource_ids = sorted(self.resources)
+        self.coverage = CoverageMatrix(resource_ids, self.months)
+        self.expected = CoverageMatrix(resource_ids, self.months)
+        self.enjoyment = EnjoymentScores(self.months)
+        probabilities = forecast.get_probabilities()
+        table = EnjoymentTable(
+            resources=set(row['resource_id'] for row in self.rows),
+            projects=set(row['project_id'] for row in self.rows))
+        for row in self.rows:
+            resource_id, project_id = row['resource_id'], row['project_id']
+            weight = probabilities.get(row['status'], 0.0)
+            score = table.score(resource_id, project_id)
+            for offset, fraction in self._split(row):
+                if resource_id in self.coverage.index:
+                    index = self.coverage.index[resource_id]
+                    self.coverage.values[index][offset] += fraction
+                    self.expected.values[index][offset] += fraction * weight
+                if score is not None:
+                    self.enjoyment.add(resource_id, project_id, offset,
+                                       fraction, score)
+
+    def conflicts(self, threshold=None):
+        """Over-allocations of the touched resources under the scenario."""
+        threshold = get_threshold() if threshold is None else threshold
+        first, last = _ordinal(self.months[0]), _ordinal(self.months[-1])
+        found = []
+        for resource_id in sorted(self.resources):
+            rows = [(row['start'], row['end'], row['percentage'],
+                     row['hours'], row['calendar']) for row in self.rows
+                    if row['resource_id'] == resource_id]
+            for ordinal, total in sorted(_allocations(rows, first, last)):
+                if total > threshold + 1e-9:
+                    found.append(Conflict(resource_id, _month(ordinal), total))
+        return found
+
+    def diff(self):
+        """Return the touched resources' and projects' monthly values that
+        differ from the stored ones, as JSON-serializable data.
+        """
+        before = self._stored_resources(self.resources)
+        resources = []
+        for resource_id, row in zip(self.coverage.resource_ids,
+                                    self.coverage.values):
+            for month, coverage in zip(self.months, row):
+                old = before.get((resource_id, month), (0.0, None))
+                new = (coverage, self.enjoyment.resource(resource_id, month))
+                if _changed(old, new):
+                    resources.append({
+                        'resource': resource_id, 'month': month.isoformat(),
+                        'coverage': [old[0], new[0]],
+                        'enjoyment': [old[1], new[1]]})
+
+        stored = self._stored_projects(self.projects)
+        projects = []
+        for project_id in sorted(self.projects):
+            for month in self.months:
+                old = stored.get((project_id, month))
+                new = self.enjoyment.project(project_id, month)
+                if _changed((old,), (new,)):
+                    projects.append({
+                        'project': project_id, 'month': month.isoformat(),
+                        'team_enjoyment': [old, new]})
+        return {'resources': resources, 'projects': projects}
+
+    def _stored_resources(self, resources):
+        return dict(
+            ((resource_id, month), (coverage, enjoyment))
+            for resource_id, month, coverage, enjoyment in
+            ResourceMonth.objects.filter(
+                resource__in=resources, month__gte=self.months[0],
+                month__lte=self.months[-1]).values_list(
+                    'resource_id', 'month', 'coverage', 'enjoyment'))
+
+    def _stored_projects(self, projects):
+        return dict(
+            ((project_id, month), enjoyment)
+            for project_id, month, enjoyment in
+            ProjectMonth.objects.filter(
+                project__in=projects, month__gte=self.months[0],
+                month__lte=self.months[-1]).values_list(
+                    'project_id', 'month', 'team_enjoyment'))
+
+    def resource(self, resource_id, month):
+        """Return ``(coverage, enjoyment)`` of any resource for ``month``
+        under the scenario.
+        """
+        month = month.replace(day=1)
+        if resource_id in self.resources:
+            return (self.coverage.get(resource_id, month),
+                    self.enjoyment.resource(resource_id, month))
+        return self._stored_resources([resource_id]).get(
+            (resource_id, month), (0.0, None))
+
+    def team_enjoyment(self, project_id, month):
+        """Return the team enjoyment of any project for ``month`` under
+        the scenario.
+        """
+        month = month.replace(day=1)
+        if project_id in self.projects:
+            return self.enjoyment.project(project_id, month)
+        return self._stored_projects([project_id]).get((project_id, month))
+
+
+def _changed(old, new):
+    for a, b in zip(old, new):
+        if (a is None) != (b is None):
+            return True
+        if a is not None and abs(a - b) > 1e-9:
+            return True
+    return False
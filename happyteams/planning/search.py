@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""Full-text search over sponsors, projects, skills and skill levels.
+
+Every searchable row is a document in one SQLite FTS5 table, ``INDEX``,
+with a ``title`` (the name) and a ``body`` (the description).  A document's
+rowid encodes both its kind and its primary key (``pk * 8 + code``), so
+keeping it in sync on save and delete is a lookup by rowid and a search of
+every kind is a single ranked query.  Each word of the query matches as a
+prefix, and matches in the title rank above matches in the body.
+
+When the database is not SQLite, SQLite lacks FTS5, the index has not been
+created or ``SEARCH_FTS`` is off, ``search`` falls back to ``icontains``
+filters on each model, unranked.  ``rebuild`` (``manage.py
+rebuild_search_index``) recreates the index from the tables.
+"""
+from __future__ import unicode_literals
+
+import re
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q
+
+from crm.models import Project, Sponsor
+from resources.models import Skill, SkillLevel
+
+INDEX = 'planning_search'
+CODES = 8
+BATCH_SIZE = 500
+# relative weight of title and body matches
+WEIGHTS = (10.0, 1.0)
+
+Kind = namedtuple('Kind', ('code', 'model', 'fields', 'label', 'body'))
+Result = namedtuple('Result', ('kind', 'pk', 'title', 'snippet', 'score'))
+
+KINDS = OrderedDict((
+    ('project', Kind(1, Project, ('name',), '{0}', 'description')),
+    ('sponsor', Kind(2, Sponsor, ('name',), '{0}', 'description')),
+    ('skill', Kind(3, Skill, ('name',), '{0}', 'description')),
+    ('skilllevel', Kind(4, SkillLevel, ('skill__name', 'rank'),
+                        '{0} level {1}', 'description')),
+))
+NAMES = dict((kind.code, name) for name, kind in KINDS.items())
+
+_available = {}
+
+
+def _kind_of(model):
+    for name, kind in KINDS.items():
+        if kind.model is model:
+            return name, kind
+    return None, None
+
+
+def available():
+    """Return whether searches can use the FTS5 index."""
+    if (not getattr(settings, 'SEARCH_FTS', True) or
+            connection.vendor != 'sqlite'):
+        return False
+    key = connection.settings_dict['NAME']
+    if key not in _available:
+        _available[key] = INDEX in connection.introspection.table_names()
+    return _available[key]
+
+
+def _documents(name, pks=None):
+    kind = KINDS[name]
+    rows = kind.model.objects.order_by()
+    if pks is not None:
+        rows = rows.filter(pk__in=pks)
+    for row in rows.values_list('pk', kind.body, *kind.fields).iterator():
+        yield (row[0] * CODES + kind.code, kind.label.format(*row[2:]),
+               row[1])
+
+
+def _write(cursor, documents):
+    cursor.executemany(
+        'INSERT OR REPLACE INTO %s (rowid, title, body) '
+        'VALUES (%%s, %%s, %%s)' % INDEX, list(documents))
+
+
+def index(obj):
+    """Add or update the document for a saved object.  Renaming a skill
+    also retitles its levels.
+    """
+    name, kind = _kind_of(type(obj))
+    if kind is None or not available():
+        return
+    with connection.cursor() as cursor:
+        _write(cursor, _documents(name, [obj.pk]))
+        if name == 'skill':
+            _write(cursor, _documents('skilllevel', SkillLevel.objects.filter(
+                skill=obj).values('pk')))
+
+
+def remove(obj):
+    """Remove the document for a deleted object."""
+    name, kind = _kind_of(type(obj))
+    if kind is None or not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s WHERE rowid = %%s' % INDEX,
+                       [obj.pk * CODES + kind.code])
+
+
+def rebuild():
+    """Recreate the index from the tables; returns the documents indexed,
+    or ``None`` when FTS5 is not available.
+    """
+    _available.clear()
+    if (not getattr(settings, 'SEARCH_FTS', True) or
+            connection.vendor != 'sqlite'):
+        return None
+    count = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS %s' % INDEX)
+        try:
+            cursor.execute(
+                "CREATE VIRTUAL TABLE %s USING fts5(title, body, "
+                "tokenize='unicode61 remove_diacritics 1', "
+                "prefix='2 3')" % INDEX)
+        except DatabaseError:
+            # this SQLite was built without FTS5
+            return None
+        for name in KINDS:
+            batch = []
+            for document in _documents(name):
+                batch.append(document)
+                if len(batch) == BATCH_SIZE:
+                    _write(cursor, batch)
+                    count, batch = count + len(batch), []
+            _write(cursor, batch)
+            count += len(batch)
+        cursor.execute("INSERT INTO %s (%s) VALUES ('optimize')" % (
+            INDEX, INDEX))
+    return count
+
+
+def _words(text):
+    return re.findall(r'\w+', text, re.UNICODE)
+
+
+def search(text, kinds=None, limit=20):
+    """Return up to ``limit`` ``Result``s for the words in ``text``, best
+    first.  ``kinds`` optionally limits them to some of the ``KINDS``.
+    """
+    words = _words(text)
+    kinds = list(kinds or KINDS)
+    if not words:
+        return []
+    if not available():
+        return _fallback(words, kinds, limit)
+
+    codes = [KINDS[name].code for name in kinds]
+    query = ' '.join('"%s"*' % word.replace('"', '""') for word in words)
+    sql = (
+        "SELECT rowid, title, snippet(%s, 1, '[', ']', '...', 12), "
+        "bm25(%s, %s, %s) AS score FROM %s WHERE %s MATCH %%s "
+        "AND rowid %%%% %d IN (%s) ORDER BY score LIMIT %%s" % (
+            INDEX, INDEX, WEIGHTS[0], WEIGHTS[1], INDEX, INDEX, CODES,
+            ', '.join(str(code) for code in codes)))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [query, limit])
+        rows = cursor.fetchall()
+    # bm25 is lower for better matches
+    return [Result(NAMES[rowid % CODES], rowid // CODES, title, snippet,
+                   -score) for rowid, title, snippet, score in rows]
+
+
+def _fallback(words, kinds, limit):
+    results = []
+    for name in kinds:
+        kind = KINDS[name]
+        condition = Q()
+        for word in words:
+            condition &= (Q(**{kind.fields[0] + '__icontains': word}) |
+                          Q(**{kind.body + '__icontains': word}))
+        for row in kind.model.objects.filter(condition).order_by(
+                kind.fields[0], 'pk').values_list(
+                    'pk', *kind.fields)[:limit]:
+            results.append(Result(name, row[0], kind.label.format(*row[1:]),
+                                  None, None))
+    return results[:limit]
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db.models import Max, Min
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+
+from crm.models import Project, Sponsor
+from resources.models import (ResourceSkill, Skill, SkillEnjoyment,
+                              SkillLevel)
+
+from . import conflicts, forecast, jobs, metriccache, rollups, search, snapshot
+from .models import Commitment
+
+
+def _span(commitment):
+    return (commitment.resource_id, commitment.project_id,
+            commitment.start, commitment.end)
+
+
+def _refresh(resource_id, project_id, start, end):
+    if jobs.get_option('DEFER_ROLLUPS'):
+        # cached metrics are computed from the commitments, not the rollups,
+        # so they must not wait for the queued refresh
+        metriccache.invalidate('resource', [resource_id])
+        metriccache.invalidate('project', [project_id])
+        jobs.refresh_later(resource_id, project_id, start, end)
+    else:
+        rollups.refresh_commitment(resource_id, project_id, start, end)
+
+
+@receiver(pre_save, sender=Commitment)
+def remember_commitment_span(sender, instance, raw=False, **kwargs):
+    # keep the span the commitment covered before this save so the months
+    # it is moving away from get refreshed too.
+    instance._previous_span = None
+    if instance.pk is not None and not raw:
+        instance._previous_span = Commitment.objects.filter(
+            pk=instance.pk).values_list(
+                'resource_id', 'project_id', 'start', 'end').first()
+
+
+@receiver(post_save, sender=Commitment)
+def refresh_saved_commitment(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    spans = set([_span(instance)])
+    if getattr(instance, '_previous_span', None):
+        spans.add(instance._previous_span)
+    for span in spans:
+        _refresh(*span)
+    for project_id in set(span[1] for span in spans):
+        forecast.project_commitments_changed(project_id)
+    instance.conflicts = conflicts.check_commitment(instance)
+    snapshot.schedule_rebuild()
+
+
+@receiver(post_delete, sender=Commitment)
+def refresh_deleted_commitment(sender, instance, **kwargs):
+    _refresh(*_span(instance))
+    forecast.project_commitments_changed(instance.project_id)
+    snapshot.schedule_rebuild()
+
+
+@receiver(pre_save, sender=Project)
+def remember_project_status(sender, instance, raw=False, update_fields=None,
+                            **kwargs):
+    instance._previous_status = instance._previous_text = None
+    # nothing to compare when the save cannot change status or text
+    watched = {'status', 'name', 'description'}
+    if update_fields is not None and not watched.intersection(update_fields):
+        instance._previous_text = (instance.name, instance.description)
+        return
+    if instance.pk is not None and not raw:
+        previous = Project.objects.filter(pk=instance.pk).values_list(
+            'status', 'name', 'description').first()
+        if previous:
+            instance._previous_status = previous[0]
+            instance._previous_text = previous[1:]
+
+
+@receiver(post_save, sender=Project)
+def reweight_project(sender, instance, raw=False, **kwargs):
+    previous = getattr(instance, '_previous_status', None)
+    if not raw and previous and previous != instance.status:
+        forecast.project_status_changed(instance.pk, instance.status)
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_save, sender=Sponsor)
+@receiver(post_save, sender=Skill)
+@receiver(post_save, sender=SkillLevel)
+def index_document(sender, instance, raw=False, **kwargs):
+    # projects are saved often for status changes; skip unchanged text
+    previous = getattr(instance, '_previous_text', None)
+    if raw or (previous is not None and
+               previous == (instance.name, instance.description)):
+        return
+    search.index(instance)
+
+
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=Sponsor)
+@receiver(post_delete, sender=Skill)
+@receiver(post_delete, sender=SkillLevel)
+def remove_document(sender, instance, **kwargs):
+    search.remove(instance)
+
+
+@receiver(post_save, sender=ResourceSkill)
+@receiver(post_delete, sender=ResourceSkill)
+def refresh_resource_skill(sender, instance, raw=False, **kwargs):
+    if not raw:
+        rollups.refresh_resource_skills(instance.resource_id)
+        snapshot.schedule_rebuild()
+
+
+@receiver(pre_save, sender=SkillEnjoyment)
+def remember_enjoyment_value(sender, instance, raw=False, **kwargs):
+    instance._previous_value = None
+    if instance.pk is not None and not raw:
+        instance._previous_value = SkillEnjoyment.objects.filter(
+            pk=instance.pk).values_list('value', flat=True).first()
+
+
+@receiver(post_save, sender=SkillEnjoyment)
+def rescore_enjoyment_value(sender, instance, created, raw=False, **kwargs):
+    # every score using the level changes: the resources who rated a skill
+    # with it and the projects they work on
+    previous = getattr(instance, '_previous_value', None)
+    if raw or created or previous == instance.value:
+        return
+    metriccache.invalidate('resource', None)
+    rated = ResourceSkill.objects.filter(enjoyment=instance).values(
+        'resource_id')
+    if not rated.exists():
+        return
+    if jobs.get_option('DEFER_ROLLUPS'):
+        jobs.enqueue('rebuild_rollups')
+    else:
+        work = Commitment.objects.filter(resource__in=rated)
+        span = work.aggregate(start=Min('start'), end=Max('end'))
+        if span['start'] is not None:
+            rollups.refresh_resources(
+                list(set(work.values_list('resource_id', flat=True))),
+                span['start'], span['end'])
+            rollups.refresh_projects(
+                list(set(work.values_list('project_id', flat=True))),
+                span['start'], span['end'])
+    snapshot.schedule_rebuild()
+
+
+@receiver(m2m_changed, sender=Project.skills.through)
+def refresh_project_skills(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    if action == 'pre_clear' and reverse:
+        # post_clear has no pk_set; note the projects losing the skill
+        instance._cleared_projects = list(
+            instance.project_set.values_list('pk', flat=True))
+    if not action.startswith('post_'):
+        return
+    if action == 'post_clear' and reverse:
+        project_ids = getattr(instance, '_cleared_projects', [])
+    elif reverse:
+        # a skill's projects changed rather than a project's skills
+        project_ids = pk_set or []
+    else:
+        project_ids = [instance.pk]
+    for project_id in project_ids:
+        rollups.refresh_project_skills(project_id)
+    snapshot.schedule_rebuild()
@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+"""Shared, memory-mapped snapshot of the planning data.
+
+``build`` writes commitments, enjoyment ratings and project skills to a
+single binary file as fixed-width columns (ids, date ordinals, fractions),
+each ``array('i')`` or ``array('d')`` laid out back to back.  Every worker
+process maps the same file read-only, so the operating system shares one
+copy of the pages between them and columns are read in place through
+``memoryview`` without building ORM objects.
+
+The file starts with a generation counter which ``build`` increments while
+holding a lock on ``<path>.lock``, so concurrent builds never write the
+same generation.  ``get_snapshot`` compares it with the mapped copy and
+re-maps after a rebuild.  The old mapping is left to the garbage
+collector, since other threads may still be reading from it.
+
+A build reads every row, so writes do not rebuild the file themselves.
+With ``PLANNING_SNAPSHOT`` set to a path, saving or deleting commitments,
+ratings or project skills queues one ``build_planning_snapshot`` job for
+``run_worker``; further writes before it runs are coalesced into it.
+``manage.py build_planning_snapshot`` rebuilds it on demand.
+"""
+from __future__ import unicode_literals
+
+import datetime
+import json
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:
+    # not on Windows; concurrent builds are then left unserialized
+    fcntl = None
+
+from crm.models import Project
+from resources.models import Resource, ResourceSkill
+
+from .conflicts import Conflict, _allocations, _month, _ordinal, get_threshold
+from .coverage import (CoverageMatrix, month_end, month_range,
+                       split_commitment)
+from .enjoyment import EnjoymentScores, EnjoymentTable
+from .models import Commitment
+from .workcalendar import get_calendar, unit_calendars
+
+MAGIC = b'HTSNAP01'
+# magic, generation, length of the JSON directory that follows
+HEADER = struct.Struct('=8sQQ')
+
+COLUMNS = (
+    ('resource', 'i'),
+    ('resource_calendar', 'i'),
+    ('commitment_resource', 'i'),
+    ('commitment_project', 'i'),
+    ('commitment_start', 'i'),
+    ('commitment_end', 'i'),
+    ('commitment_percentage', 'd'),
+    ('commitment_hours', 'd'),
+    ('rating_resource', 'i'),
+    ('rating_skill', 'i'),
+    ('rating_value', 'i'),
+    ('project_skill_project', 'i'),
+    ('project_skill_skill', 'i'),
+)
+
+NULL = float('nan')
+
+_mapped = None
+
+
+def get_path():
+    return getattr(settings, 'PLANNING_SNAPSHOT', None)
+
+
+def _to_bytes(column):
+    return column.tobytes() if hasattr(column, 'tobytes') else \
+        column.tostring()
+
+
+def read_generation(path):
+    """Return the generation of the snapshot at ``path``, or 0 if missing."""
+    try:
+        with open(path, 'rb') as handle:
+            magic, generation, _ = HEADER.unpack(handle.read(HEADER.size))
+    except (IOError, OSError, struct.error):
+        return 0
+    return generation if magic == MAGIC else 0
+
+
+@contextmanager
+def _locked(path):
+    with open('%s.lock' % path, 'a') as handle:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+def build(path=None):
+    """Write a fresh snapshot to ``path`` (default ``PLANNING_SNAPSHOT``)
+    and return its generation.
+
+    The file is written alongside and renamed into place, so readers only
+    ever map a complete snapshot.  Builds of the same path run one at a
+    time, so the last one renamed into place is also the newest.
+    """
+    path = path or get_path()
+    with _locked(path):
+        return _build(path)
+
+
+def _build(path):
+    columns = dict((name, array(str(typecode)))
+                   for name, typecode in COLUMNS)
+
+    calendars, calendar_index = [], {}
+    resources = Resource.objects.order_by('pk')
+    if unit_calendars():
+        rows = resources.values_list('pk', 'unit__abbreviation')
+    else:
+        rows = ((pk, None) for pk in resources.values_list('pk', flat=True))
+    for pk, unit in rows:
+        if unit is not None and unit not in calendar_index:
+            calendar_index[unit] = len(calendars)
+            calendars.append(unit)
+        columns['resource'].append(pk)
+        columns['resource_calendar'].append(calendar_index.get(unit, -1))
+
+    for resource_id, project_id, start, end, percentage, hours in \
+            Commitment.objects.order_by('resource_id', 'start').values_list(
+                'resource_id', 'project_id', 'start', 'end', 'percentage',
+                'hours').iterator():
+        columns['commitment_resource'].append(resource_id)
+        columns['commitment_project'].append(project_id)
+        columns['commitment_start'].append(start.toordinal())
+        columns['commitment_end'].append(end.toordinal())
+        columns['commitment_percentage'].append(
+            NULL if percentage is None else float(percentage))
+        columns['commitment_hours'].append(
+            NULL if hours is None else float(hours))
+
+    for resource_id, skill_id, value in ResourceSkill.objects.filter(
+            enjoyment__isnull=False).order_by('resource_id').values_list(
+                'resource_id', 'skill_id', 'enjoyment__value').iterator():
+        columns['rating_resource'].append(resource_id)
+        columns['rating_skill'].append(skill_id)
+        columns['rating_value'].append(value)
+
+    for project_id, skill_id in Project.skills.through.objects.values_list(
+            'project_id', 'skill_id').iterator():
+        columns['project_skill_project'].append(project_id)
+        columns['project_skill_skill'].append(skill_id)
+
+    # lay the columns out on 8 byte boundaries after the directory
+    directory = {'calendars': calendars, 'columns': {}}
+    offset = 0
+    for name, typecode in COLUMNS:
+        directory['columns'][name] = [typecode, offset, len(columns[name])]
+        offset += -(-len(columns[name]) * columns[name].itemsize // 8) * 8
+    encoded = json.dumps(directory).encode('utf-8')
+    start = -(-(HEADER.size + len(encoded)) // 8) * 8
+
+    generation = read_generation(path) + 1
+    temporary = '%s.%s.tmp' % (path, os.getpid())
+    with open(temporary, 'wb') as handle:
+        handle.write(HEADER.pack(MAGIC, generation, len(encoded)))
+        handle.write(encoded)
+        for name, _ in COLUMNS:
+            handle.seek(start + directory['columns'][name][1])
+            handle.write(_to_bytes(columns[name]))
+        handle.truncate(start + offset)
+    getattr(os, 'replace', os.rename)(temporary, path)
+    return generation
+
+
+class CommitmentView(object):
+    """Read-only view of one commitment in a snapshot."""
+
+    __slots__ = ('snapshot', 'index')
+
+    def __init__(self, snapshot, index):
+        self.snapshot = snapshot
+        self.index = index
+
+    @property
+    def resource_id(self):
+        return self.snapshot.commitment_resource[self.index]
+
+    @property
+    def project_id(self):
+        return self.snapshot.commitment_project[self.index]
+
+    @property
+    def start(self):
+        return datetime.date.fromordinal(
+            self.snapshot.commitment_start[self.index])
+
+    @property
+    def end(self):
+        return datetime.date.fromordinal(
+            self.snapshot.commitment_end[self.index])
+
+    @property
+    def percentage(self):
+        value = self.snapshot.commitment_percentage[self.index]
+        return None if value != value else value
+
+    @property
+    def hours(self):
+        value = self.snapshot.commitment_hours[self.index]
+        return None if value != value else value
+
+    def __repr__(self):
+        return '<CommitmentView %s: resource %s, project %s>' % (
+            self.index, self.resource_id, self.project_id)
+
+
+class SnapshotEnjoymentTable(EnjoymentTable):
+    """An ``EnjoymentTable`` loaded from a snapshot instead of the ORM."""
+
+    def __init__(self, snapshot):
+        self.values = dict(
+            ((resource_id, skill_id), value) for resource_id, skill_id, value
+            in zip(snapshot.rating_resource, snapshot.rating_skill,
+                   snapshot.rating_value))
+        self.project_skills = {}
+        for project_id, skill_id in zip(snapshot.project_skill_project,
+                                        snapshot.project_skill_skill):
+            self.project_skills.setdefault(project_id, []).append(skill_id)
+        self._scores = {}
+
+
+class Snapshot(object):
+    """A mapped snapshot file.
+
+    Every entry of ``COLUMNS`` is available as an attribute holding a
+    read-only sequence backed by the mapped file.  Commitments are sorted by
+    resource and start date.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.generation, length = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError('%s is not a planning snapshot.' % path)
+        directory = json.loads(
+            self._map[HEADER.size:HEADER.size + length].decode('utf-8'))
+        start = -(-(HEADER.size + length) // 8) * 8
+        self.calendars = [get_calendar()] + [
+            get_calendar(unit) for unit in directory['calendars']]
+        buffer = memoryview(self._map)
+        for name, (typecode, offset, count) in \
+                directory['columns'].items():
+            size = count * array(str(typecode)).itemsize
+            view = buffer[start + offset:start + offset + size]
+            if hasattr(view, 'cast'):
+                view = view.cast(str(typecode))
+            else:
+                view = array(str(typecode), view.tobytes())
+            setattr(self, name, view)
+        self._resources = dict(
+            (pk, self.calendars[index + 1]) for pk, index in zip(
+                self.resource, self.resource_calendar))
+        self._views = [buffer] + [getattr(self, name) for name, _ in COLUMNS]
+
+    def close(self):
+        """Unmap the file; the columns cannot be read afterwards."""
+        for view in reversed(self._views):
+            if hasattr(view, 'release'):
+                view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            # a caller still holds a slice of a column; the mapping is
+            # closed once that is garbage collected
+            pass
+
+    def _span(self, resource_id):
+        # commitments are sorted by resource, so each resource's are a slice
+        return (bisect_left(self.commitment_resource, resource_id),
+                bisect_right(self.commitment_resource, resource_id))
+
+    def commitments(self, resource_id=None):
+        """Return a ``CommitmentView`` per commitment (of ``resource_id``)."""
+        first, last = (0, len(self.commitment_resource)) \
+            if resource_id is None else self._span(resource_id)
+        return [CommitmentView(self, index) for index in range(first, last)]
+
+    def rows(self, resource_ids=None, start=None, end=None):
+        """Yield ``(resource_id, project_id, start, end, percentage, hours,
+        working_calendar)`` for commitments overlapping ``start``-``end``,
+        the same shape ``coverage.commitment_rows`` produces.
+        """
+        if resource_ids is None:
+            spans = [(0, len(self.commitment_resource))]
+        else:
+            spans = [self._span(pk) for pk in sorted(set(resource_ids))]
+        first = start.toordinal() if start else 0
+        last = end.toordinal() if end else datetime.date.max.toordinal()
+        default = get_calendar()
+        for low, high in spans:
+            for index in range(low, high):
+                begins = self.commitment_start[index]
+                if begins > last or self.commitment_end[index] < first:
+                    continue
+                resource_id = self.commitment_resource[index]
+                percentage = self.commitment_percentage[index]
+                hours = self.commitment_hours[index]
+                yield (resource_id, self.commitment_project[index],
+                       datetime.date.fromordinal(begins),
+                       datetime.date.fromordinal(self.commitment_end[index]),
+                       None if percentage != percentage else percentage,
+                       None if hours != hours else hours,
+                       self._resources.get(resource_id, default))
+
+    def coverage_matrix(self, resources, start, end=None):
+        """Like ``coverage.coverage_matrix`` but read from the snapshot."""
+        months = month_range(start, end or start)
+        resource_ids = (list(self.resource) if resources is None else
+                        [getattr(r, 'pk', r) for r in resources])
+        matrix = CoverageMatrix(resource_ids, months)
+        for row in self.rows(resource_ids, months[0], month_end(months[-1])):
+            matrix.add(row[0], *row[2:])
+        return matrix
+
+    def score_enjoyment(self, start, end=None, resources=None):
+        """Like ``enjoyment.score_enjoyment`` but read from the snapshot."""
+        months = month_range(start, end or start)
+        table = SnapshotEnjoymentTable(self)
+        scores = EnjoymentScores(months)
+        resource_ids = None if resources is None else [
+            getattr(r, 'pk', r) for r in resources]
+        for resource_id, project_id, begins, ends, percentage, hours, \
+                working_calendar in self.rows(resource_ids, months[0],
+                                              month_end(months[-1])):
+            score = table.score(resource_id, project_id)
+            if score is None:
+                continue
+            for offset, weight in split_commitment(
+                    begins, ends, percentage, hours, months[0], len(months),
+                    working_calendar):
+                scores.add(resource_id, project_id, offset, weight, score)
+        return scores
+
+    def conflicts(self, resources=None, start=None, end=None,
+                  threshold=None):
+        """Like ``conflicts.scan`` but read from the snapshot."""
+        threshold = get_threshold() if threshold is None else threshold
+        resource_ids = None if resources is None else [
+            getattr(r, 'pk', r) for r in resources]
+        first = _ordinal(start) if start else 0
+        last = _ordinal(end) if end else _ordinal(datetime.date.max)
+        found, current, rows = [], None, []
+        for row in self.rows(resource_ids, start and start.replace(day=1)):
+            if row[0] != current:
+                found.extend(self._conflicts(current, rows, first, last,
+                                             threshold))
+                current, rows = row[0], []
+            rows.append(row[2:])
+        found.extend(self._conflicts(current, rows, first, last, threshold))
+        return found
+
+    def _conflicts(self, resource_id, rows, first, last, threshold):
+        for ordinal, total in _allocations(rows, first, last):
+            if total > threshold + 1e-9:
+                yield Conflict(resource_id, _month(ordinal), total)
+
+
+def get_snapshot():
+    """Return this process's mapping of ``PLANNING_SNAPSHOT``, re-mapping
+    it when the file's generation has moved on.  Returns ``None`` if no
+    snapshot is configured or built.
+    """
+    global _mapped
+    path = get_path()
+    if not path:
+        return None
+    generation = read_generation(path)
+    if not generation:
+        return None
+    if (_mapped is None or _mapped.path != path or
+            _mapped.generation != generation):
+        # threads still reading the old snapshot keep it mapped until
+        # they are done with it
+        _mapped = Snapshot(path)
+    return _mapped
+
+
+def schedule_rebuild():
+    """Queue a rebuild of the configured snapshot, unless one is already
+    pending.  The job is queued in the current transaction, so it only
+    becomes visible to workers once the writes that called for it commit.
+    """
+    if not get_path():
+        return
+    from . import jobs
+
+    jobs.enqueue('build_planning_snapshot',
+                 delay=jobs.get_option('COALESCE_SECONDS'))
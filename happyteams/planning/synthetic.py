@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""Deterministic synthetic organizations for load testing.
+
+``SyntheticOrg`` builds a unit tree, resources with skill ratings, sponsors,
+projects (some of them follow-ons), budget increments and commitments from a
+seeded ``random.Random``, so the same arguments always describe the same
+data.  Rows are written with ``bulk_create`` using primary keys picked up
+front, which lets foreign keys, unit paths and lineage roots be filled in
+without reading anything back.  ``bulk_create`` skips ``save`` and the
+signals, so the monthly rollups and the search index are rebuilt at the end
+and the in-process skill index and metric cache are dropped.
+"""
+from __future__ import unicode_literals
+
+import datetime
+from decimal import Decimal
+from random import Random
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.six import StringIO
+
+from crm.models import BudgetIncrement, Project, Sponsor
+from resources import skillindex
+from resources.models import (OrganizationalUnit, Resource, ResourceSkill,
+                              Skill, SkillEnjoyment, SkillLevel)
+
+from . import metriccache, rollups, search
+from .coverage import add_months, month_end
+from .models import Commitment
+from .workcalendar import get_calendar
+
+STATUSES = (('opportunity', 2), ('pending', 1), ('active', 5),
+            ('close-out', 1), ('archived', 1))
+
+DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+DAY = datetime.timedelta(days=1)
+
+
+def _next_pk(model):
+    return (model.objects.aggregate(pk=Max('pk'))['pk'] or 0) + 1
+
+
+def _abbreviation(i):
+    # four base 36 digits, unique for the first 1,679,616 units
+    digits = ''
+    for _ in range(4):
+        i, digit = divmod(i, len(DIGITS))
+        digits = DIGITS[digit] + digits
+    return digits
+
+
+class SyntheticOrg(object):
+    """Parameters for, and after ``generate`` the keys of, a synthetic
+    organization.  Anything left as ``None`` scales with ``resources``.
+    """
+
+    def __init__(self, resources=1000, units=None, skills=50, projects=None,
+                 commitments=3, start=datetime.date(2017, 1, 1), months=24,
+                 seed=0, batch_size=1000, prefix='synthetic'):
+        self.resource_count = resources
+        self.unit_count = units or max(1, resources // 25)
+        self.skill_count = skills
+        self.project_count = projects or max(1, resources // 5)
+        self.commitments_per_resource = commitments
+        self.start = start
+        self.months = months
+        self.random = Random(seed)
+        self.batch_size = batch_size
+        self.prefix = prefix
+        self.counts = {}
+        self.models = set()
+
+    def _create(self, model, objects):
+        # an explicit batch size is not capped to what the backend allows
+        limit = connection.ops.bulk_batch_size(
+            model._meta.concrete_fields, objects)
+        model.objects.bulk_create(
+            objects, batch_size=max(1, min(self.batch_size, limit)))
+        self.counts[model._meta.model_name] = (
+            self.counts.get(model._meta.model_name, 0) + len(objects))
+        self.models.add(model)
+
+    def _date(self, first, last):
+        return first + datetime.timedelta(
+            days=self.random.randint(0, (last - first).days))
+
+    def generate(self, refresh=True):
+        """Write the organization; with ``refresh`` rebuild the rollups."""
+        with transaction.atomic():
+            self._enjoyment()
+            self._units()
+            self._skills()
+            self._resources()
+            self._projects()
+            self._commitments()
+            # move sequences past the primary keys picked above
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(
+                        no_style(), list(self.models)):
+                    cursor.execute(sql)
+            if refresh:
+                rollups.rebuild()
+                search.rebuild()
+        skillindex.invalidate()
+        metriccache.invalidate('resource', None)
+        return self
+
+    def _enjoyment(self):
+        if not SkillEnjoyment.objects.exists():
+            call_command('populate_skill_enjoyment_levels', stdout=StringIO())
+        self.enjoyment_ids = list(
+            SkillEnjoyment.objects.order_by('value').values_list(
+                'pk', flat=True))
+
+    def _units(self):
+        # a tree about five units wide at each level
+        first = _next_pk(OrganizationalUnit)
+        units, paths = [], {}
+        for i in range(self.unit_count):
+            pk = first + i
+            parent = first + (i - 1) // 5 if i else None
+            paths[pk] = '%s%s/' % (paths.get(parent, ''), pk)
+            units.append(OrganizationalUnit(
+                pk=pk, parent_id=parent, path=paths[pk],
+                depth=paths[pk].count('/') - 1,
+                name=('%s unit %d' % (self.prefix, i))[:32],
+                abbreviation=_abbreviation(i),
+                hourly_rate=Decimal(self.random.randint(60, 180))))
+        self._create(OrganizationalUnit, units)
+        self.unit_ids = sorted(paths)
+
+    def _skills(self):
+        first = _next_pk(Skill)
+        self.skill_ids = list(range(first, first + self.skill_count))
+        self._create(Skill, [
+            Skill(pk=pk, name='%s skill %d' % (self.prefix, pk))
+            for pk in self.skill_ids])
+        first_level = _next_pk(SkillLevel)
+        self.levels = {}
+        levels = []
+        for i, skill_id in enumerate(self.skill_ids):
+            for rank in range(1, 5):
+                pk = first_level + i * 4 + rank - 1
+                self.levels[(skill_id, rank)] = pk
+                levels.append(SkillLevel(pk=pk, skill_id=skill_id, rank=rank,
+                                         description='Level %d' % rank))
+        self._create(SkillLevel, levels)
+
+    def _resources(self):
+        first_user, first = _next_pk(User), _next_pk(Resource)
+        self.usernames = {}
+        users, resources, ratings = [], [], []
+        for i in range(self.resource_count):
+            pk = first + i
+            self.usernames[pk] = '%s-%s' % (self.prefix, first_user + i)
+            users.append(User(pk=first_user + i,
+                              username=self.usernames[pk]))
+            resources.append(Resource(
+                pk=pk, user_id=first_user + i,
+                unit_id=self.random.choice(self.unit_ids)))
+            for skill_id in self.random.sample(
+                    self.skill_ids, min(len(self.skill_ids),
+                                        self.random.randint(3, 6))):
+                ratings.append(ResourceSkill(
+                    resource_id=pk, skill_id=skill_id,
+                    skill_level_id=self.levels[
+                        (skill_id, self.random.randint(1, 4))],
+                    enjoyment_id=self.random.choice(self.enjoyment_ids)))
+        self._create(User, users)
+        self._create(Resource, resources)
+        self._create(ResourceSkill, ratings)
+        self.resource_ids = sorted(self.usernames)
+
+    def _projects(self):
+        first_sponsor, first = _next_pk(Sponsor), _next_pk(Project)
+        sponsor_ids = list(range(
+            first_sponsor, first_sponsor + max(1, self.project_count // 20)))
+        self._create(Sponsor, [
+            Sponsor(pk=pk, name='%s sponsor %d' % (self.prefix, pk))
+            for pk in sponsor_ids])
+
+        statuses = [status for status, weight in STATUSES
+                    for _ in range(weight)]
+        # every project lasts at least a day, so commitments can fit inside
+        last_day = max(month_end(add_months(self.start, self.months - 1)),
+                       self.start + DAY)
+        self.projects = {}
+        projects, project_skills, increments, roots = [], [], [], {}
+        for i in range(self.project_count):
+            pk = first + i
+            start = self._date(self.start, last_day - DAY)
+            end = min(last_day, start + datetime.timedelta(
+                days=self.random.randint(60, 540)))
+            # about one in five projects follows on from an earlier one
+            predecessor = None
+            if i and self.random.random() < 0.2:
+                predecessor = self.random.randint(first, pk - 1)
+            roots[pk] = roots[predecessor] if predecessor else pk
+            self.projects[pk] = ('%s project %d' % (self.prefix, pk),
+                                 start, end)
+            projects.append(Project(
+                pk=pk, name=self.projects[pk][0], start=start, end=end,
+                sponsor_id=self.random.choice(sponsor_ids),
+                status=self.random.choice(statuses),
+                predecessor_id=predecessor, root_id=roots[pk]))
+            for skill_id in self.random.sample(
+                    self.skill_ids, min(len(self.skill_ids), 3)):
+                project_skills.append(Project.skills.through(
+                    project_id=pk, skill_id=skill_id))
+            for _ in range(self.random.randint(1, 3)):
+                increment_start = self._date(start, end)
+                increments.append(BudgetIncrement(
+                    project_id=pk, start=increment_start,
+                    end=self._date(increment_start, end),
+                    amount=Decimal(self.random.randint(10, 500) * 1000)))
+        self._create(Project, projects)
+        self._create(Project.skills.through, project_skills)
+        self._create(BudgetIncrement, increments)
+        self.project_ids = sorted(self.projects)
+
+    def _commitments(self):
+        commitments = []
+        for resource_id in self.resource_ids:
+            for _ in range(self.commitments_per_resource):
+                project_id = self.random.choice(self.project_ids)
+                commitments.append(self.commitment(resource_id, project_id))
+        self._create(Commitment, commitments)
+
+    def commitment(self, resource_id, project_id):
+        """Return an unsaved commitment that passes ``commitment_errors``
+        for the project's schedule.
+        """
+        _, project_start, project_end = self.projects[project_id]
+        # starts before the project ends and ends after it starts
+        start = self._date(project_start, project_end - DAY)
+        end = self._date(start + DAY, project_end)
+        hours = min(self.random.randint(1, 40) * 8,
+                    get_calendar().hours_between(start, end))
+        if self.random.random() < 0.75 or not hours:
+            return Commitment(
+                resource_id=resource_id, project_id=project_id, start=start,
+                end=end, percentage=Decimal(self.random.randint(1, 10) * 10))
+        return Commitment(
+            resource_id=resource_id, project_id=project_id, start=start,
+            end=end, hours=Decimal(hours))
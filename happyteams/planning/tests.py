@@ -1,6 +1,1574 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.test import TestCase
+import csv
+import datetime
+import json
+import os
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from random import Random
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from crm.lineage import lineage_roots
+from crm.models import BudgetIncrement, Project, Sponsor
+from resources.models import (OrganizationalUnit, Resource, ResourceSkill,
+                              Skill, SkillEnjoyment, SkillLevel)
+from resources.skillindex import find_resources
+
+from . import (alerts, history, jobs, metriccache, rollups, search,
+               snapshot)
+from .burn import portfolio_burn, unit_rates
+from .conflicts import scan
+from .coverage import coverage_matrix, month_range
+from .enjoyment import score_enjoyment
+from .importer import CommitmentImport
+from .models import (Commitment, EnjoymentAlert, Job, PlanChange,
+                     PlanSnapshot, ProjectMonth, ResourceMonth, Scenario,
+                     StaleEnjoyment, commitment_errors)
+from .forecast import PipelineForecast
+from .optimizer import propose_assignments
+from .reports import lineage_rollup, org_rollup
+from .scenarios import Overlay, ScenarioResult
+from .synthetic import SyntheticOrg
+from .workcalendar import WorkingCalendar, get_calendar
+
+
+class PlanningTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.unit = OrganizationalUnit.objects.create(
+            name='Engineering', abbreviation='ENG')
+        cls.sponsor = Sponsor.objects.create(name='Acme')
+        cls.project = Project.objects.create(
+            name='Apollo', sponsor=cls.sponsor, status='active',
+            start=datetime.date(2017, 1, 1), end=datetime.date(2017, 12, 31))
+        cls.alice = cls.make_resource('alice')
+        cls.bob = cls.make_resource('bob')
+        cls.python = Skill.objects.create(name='Python')
+        cls.excel = Skill.objects.create(name='Excel')
+        cls.enjoyment = dict(
+            (slug, SkillEnjoyment.objects.create(
+                slug=slug, value=value, description=slug))
+            for slug, value in (('None', 0), ('Little', 1), ('Enjoy', 4),
+                                ('Favorite', 9)))
+
+    @classmethod
+    def make_resource(cls, username, unit=None):
+        user = User.objects.create(username=username)
+        return Resource.objects.create(user=user, unit=unit or cls.unit)
+
+    def rate(self, resource, skill, slug):
+        return ResourceSkill.objects.create(
+            resource=resource, skill=skill, enjoyment=self.enjoyment[slug])
+
+    def commit(self, resource, start, end, percentage=None, hours=None,
+               project=None):
+        return Commitment.objects.create(
+            project=project or self.project, resource=resource,
+            start=start, end=end, percentage=percentage, hours=hours)
+
+
+class CoverageTests(PlanningTestCase):
+
+    def test_month_range(self):
+        months = month_range(datetime.date(2016, 11, 15),
+                             datetime.date(2017, 2, 1))
+        self.assertEqual(months, [
+            datetime.date(2016, 11, 1), datetime.date(2016, 12, 1),
+            datetime.date(2017, 1, 1), datetime.date(2017, 2, 1)])
+
+    def test_percentage_prorated_for_partial_months(self):
+        self.commit(self.alice, datetime.date(2017, 1, 1),
+                    datetime.date(2017, 2, 14), percentage=50)
+        matrix = coverage_matrix([self.alice], datetime.date(2017, 1, 1),
+                                 datetime.date(2017, 3, 1))
+        row = matrix.row(self.alice.pk)
+        self.assertAlmostEqual(row[datetime.date(2017, 1, 1)], 0.5)
+        self.assertAlmostEqual(row[datetime.date(2017, 2, 1)], 0.25)
+        self.assertAlmostEqual(row[datetime.date(2017, 3, 1)], 0.0)
+
+    def test_hours_split_across_months(self):
+        # 20 working days in April and 23 in May at 4 hours a day
+        self.commit(self.bob, datetime.date(2017, 4, 1),
+                    datetime.date(2017, 5, 31), hours=172)
+        matrix = coverage_matrix(Resource.objects.all(),
+                                 datetime.date(2017, 4, 1),
+                                 datetime.date(2017, 5, 1))
+        self.assertAlmostEqual(
+            matrix.get(self.bob.pk, datetime.date(2017, 4, 1)), 0.5)
+        self.assertAlmostEqual(
+            matrix.get(self.bob.pk, datetime.date(2017, 5, 1)), 0.5)
+        self.assertEqual(
+            matrix.get(self.alice.pk, datetime.date(2017, 4, 1)), 0.0)
+
+    def test_single_query_for_many_resources(self):
+        for resource in (self.alice, self.bob):
+            self.commit(resource, datetime.date(2017, 1, 1),
+                        datetime.date(2017, 12, 31), percentage=100)
+        with self.assertNumQueries(2):
+            matrix = coverage_matrix(None, datetime.date(2017, 1, 1),
+                                     datetime.date(2017, 12, 1))
+        self.assertEqual(list(matrix.below(1.0)), [])
+
+    def test_resource_coverage_wrapper(self):
+        self.commit(self.alice, datetime.date(2017, 6, 1),
+                    datetime.date(2017, 6, 30), percentage=40)
+        self.commit(self.alice, datetime.date(2017, 6, 1),
+                    datetime.date(2017, 7, 31), percentage=60)
+        self.assertAlmostEqual(
+            self.alice.coverage(datetime.date(2017, 6, 1)), 1.0)
+        self.assertAlmostEqual(
+            self.alice.coverage(datetime.date(2017, 7, 1)), 0.6)
+
+
+class WorkingCalendarTests(PlanningTestCase):
+
+    def test_working_days_and_capacity(self):
+        working_calendar = WorkingCalendar(holidays=('2017-07-04',))
+        july = datetime.date(2017, 7, 1)
+        self.assertEqual(working_calendar.working_days(july), 20)
+        self.assertEqual(working_calendar.capacity(july), 160.0)
+        self.assertEqual(working_calendar.working_days_between(
+            datetime.date(2017, 6, 30), datetime.date(2017, 7, 5)), 3)
+
+    @override_settings(WORKING_CALENDAR={
+        'UNITS': {'OPS': {'HOURS_PER_DAY': 10, 'WEEKEND': (4, 5, 6)}}})
+    def test_unit_overrides(self):
+        ops = OrganizationalUnit.objects.create(name='Ops', abbreviation='OPS')
+        carol = self.make_resource('carol', unit=ops)
+        self.assertIs(get_calendar('ENG'), get_calendar())
+        self.assertEqual(get_calendar('OPS').capacity(
+            datetime.date(2017, 8, 1)), 190.0)
+
+        # 19 Monday to Thursday working days in August at 10 hours a day
+        self.commit(carol, datetime.date(2017, 8, 1),
+                    datetime.date(2017, 8, 31), hours=95)
+        self.assertAlmostEqual(carol.coverage(datetime.date(2017, 8, 1)), 0.5)
+
+    def test_hours_limited_to_working_hours(self):
+        with self.assertRaises(ValidationError):
+            self.commit(self.alice, datetime.date(2017, 1, 1),
+                        datetime.date(2017, 1, 31), hours=177)
+        self.commit(self.alice, datetime.date(2017, 1, 1),
+                    datetime.date(2017, 1, 31), hours=176)
+
+
+class EnjoymentTests(PlanningTestCase):
+
+    def setUp(self):
+        self.reports = Project.objects.create(
+            name='Reports', sponsor=self.sponsor, status='active',
+            start=datetime.date(2017, 1, 1), end=datetime.date(2017, 12, 31))
+        self.project.skills.add(self.python)
+        self.reports.skills.add(self.python, self.excel)
+        self.rate(self.alice, self.python, 'Favorite')
+        self.rate(self.alice, self.excel, 'Little')
+        self.rate(self.bob, self.python, 'Enjoy')
+
+    def test_weighted_by_committed_fraction(self):
+        self.commit(self.alice, datetime.date(2017, 1, 1),
+                    datetime.date(2017, 12, 31), percentage=75)
+        self.commit(self.alice, datetime.date(2017, 1, 1),
+                    datetime.date(2017, 12, 31), percentage=25,
+                    project=self.reports)
+        self.commit(self.bob, datetime.date(2017, 1, 1),
+                    datetime.date(2017, 12, 31), percentage=100)
+        scores = score_enjoyment(datetime.date(2017, 1, 1),
+                                 datetime.date(2017, 3, 1))
+        march = datetime.date(2017, 3, 1)
+        # alice: 0.75 * 9 + 0.25 * mean(9, 1)
+        self.assertAlmostEqual(scores.resource(self.alice.pk, march), 8.0)
+        self.assertAlmostEqual(scores.resource(self.bob.pk, march), 4.0)
+        # apollo: alice at 0.75 * 9 and bob at 1.0 * 4
+        self.assertAlmostEqual(scores.project(self.project.pk, march),
+                               (0.75 * 9 + 4.0) / 1.75)
+        self.assertAlmostEqual(scores.project(self.reports.pk, march), 5.0)
+
+    def test_constant_queries(self):
+        for resource in (self.alice, self.bob):
+            self.commit(resource, datetime.date(2017, 1, 1),
+                        datetime.date(2017, 12, 31), percentage=50)
+        with self.assertNumQueries(3):
+            scores = score_enjoyment(datetime.date(2017, 1, 1),
+                                     datetime.date(2017, 12, 1))
+            scores.resource_row(self.alice.pk)
+
+    def test_model_wrappers(self):
+        month = datetime.date(2017, 5, 1)
+        self.assertIsNone(self.bob.enjoyment(month))
+        self.commit(self.bob, datetime.date(2017, 5, 1),
+                    datetime.date(2017, 5, 31), percentage=100)
+        self.assertAlmostEqual(self.bob.enjoyment(month), 4.0)
+        self.assertAlmostEqual(self.project.team_enjoyment(month), 4.0)
+
+
+class RollupTests(PlanningTestCase):
+
+    def test_commitment_save_refreshes_its_months(self):
+        commitment = self.commit(self.alice, datetime.date(2017, 1, 1),
+                                 datetime.date(2017, 2, 28), percentage=50)
+        self.assertEqual(
+            list(ResourceMonth.objects.filter(resource=self.alice)
+                 .order_by('month').values_list('month', 'coverage')),
+            [(datetime.date(2017, 1, 1), 0.5),
+             (datetime.date(2017, 2, 1), 0.5)])
+        self.assertEqual(
+            ProjectMonth.objects.get(
+                project=self.project, month=datetime.date(2017, 1, 1)).hours,
+            88.0)
+
+        commitment.start = datetime.date(2017, 3, 1)
+        commitment.end = datetime.date(2017, 3, 31)
+        commitment.save()
+        self.assertEqual(
+            list(ResourceMonth.objects.filter(resource=self.alice)
+                 .values_list('month', flat=True)),
+            [datetime.date(2017, 3, 1)])
+
+        commitment.delete()
+        self.assertFalse(ResourceMonth.objects.exists())
+        self.assertFalse(ProjectMonth.objects.exists())
+
+    def test_skill_change_refreshes_enjoyment(self):
+        self.project.skills.add(self.python)
+        self.commit(self.bob, datetime.date(2017, 1, 1),
+                    datetime.date(2017, 1, 31), percentage=100)
+        self.assertIsNone(ResourceMonth.objects.get(resource=self.bob)
+                          .enjoyment)
+        self.rate(self.bob, self.python, 'Enjoy')
+        self.assertEqual(ResourceMonth.objects.get(resource=self.bob)
+                         .enjoyment, 4.0)
+        self.assertEqual(ProjectMonth.objects.get(project=self.project)
+                         .team_enjoyment, 4.0)
+
+        # clearing from the skill's side sends no primary keys
+        self.python.project_set.clear()
+        self.assertIsNone(ProjectMonth.objects.get(project=self.project)
+                          .team_enjoyment)
+        self.assertIsNone(ResourceMonth.objects.get(resource=self.bob)
+                          .enjoyment)
+
+    def test_rebuild_command(self):
+        self.commit(self.alice, datetime.date(2017, 1, 1),
+                    datetime.date(2017, 6, 30), percentage=100)
+        ResourceMonth.objects.all().delete()
+        call_command('rebuild_monthly_metrics', stdout=StringIO())
+        self.assertEqual(
+            ResourceMonth.objects.filter(resource=self.alice).count(), 6)
+        self.assertEqual(
+            ProjectMonth.objects.filter(project=self.project).count(), 6)
+
+        # rebuilt a batch of months at a time
+        self.addCleanup(setattr, rollups, 'REBUILD_MONTHS',
+                        rollups.REBUILD_MONTHS)
+        rollups.REBUILD_MONTHS = 4
+        done = []
+        rollups.rebuild(progress=done.append)
+        self.assertEqual(done, [0.5, 1.0])
+        self.assertEqual(ResourceMonth.objects.count(), 6)
+
+
+class OverlapQueryTests(PlanningTestCase):
+
+    def test_overlapping_and_active_in(self):
+        early = self.commit(self.alice, datetime.date(2017, 1, 1),
+                            datetime.date(2017, 3, 15), percentage=50)
+        late = self.commit(self.alice, datetime.date(2017, 3, 16),
+                           datetime.date(2017, 6, 30), percentage=50)
+        self.commit(self.bob, datetime.date(2017, 7, 1),
+                    datetime.date(2017, 9, 30), percentage=50)
+        self.assertEqual(
+            set(Commitment.objects.active_in(datetime.date(2017, 3, 10))),
+            set([early, late]))
+        self.assertEqual(
+            list(Commitment.objects.filter(resource=self.alice).overlapping(
+                datetime.date(2017, 3, 16), datetime.date(2017, 12, 31))),
+            [late])
+
+    def test_query_plan_uses_interval_indexes(self):
+        # a million synthetic commitments spread over 2,000 resources and
+        # 500 projects, generated inside SQLite to keep the test quick.
+        with connection.cursor() as cursor:
+            cursor.execute('''
+                WITH RECURSIVE seq(n) AS (
+                    SELECT 0 UNION ALL SELECT n + 1 FROM seq
+                    WHERE n < 999999)
+                INSERT INTO planning_commitment
+                    (project_id, resource_id, start, "end", percentage)
+                SELECT n % 500 + 1, n % 2000 + 1,
+                       date('2010-01-01', '+' || (n % 3000) || ' days'),
+                       date('2010-01-01', '+' || (n % 3000 + 90) || ' days'),
+                       '50'
+                FROM seq''')
+            cursor.execute('ANALYZE')
+            self.assertEqual(
+                Commitment.objects.count(), 1000000)
+
+            queries = (
+                ('resource', Commitment.objects.filter(resource_id=7)
+                    .overlapping(datetime.date(2012, 1, 1),
+                                 datetime.date(2012, 3, 31))),
+                ('project', Commitment.objects.filter(project_id=7)
+                    .active_in(datetime.date(2012, 2, 1))),
+            )
+            for field, queryset in queries:
+                sql, params = queryset.query.sql_with_params()
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                plan = ' '.join(row[-1] for row in cursor.fetchall())
+                index = [i.name for i in Commitment._meta.indexes
+                         if i.fields[0] == field][0]
+                self.assertIn('USING INDEX %s (%s_id=? AND start<?)' % (
+                    index, field), plan)
+
+
+class ImportTests(PlanningTestCase):
+
+    def write_csv(self, *rows):
+        handle = tempfile.NamedTemporaryFile(
+            'w', suffix='.csv', delete=False)
+        self.addCleanup(os.remove, handle.name)
+        handle.write('project,resource,start,end,percentage,hours\n')
+        for row in rows:
+            handle.write(row + '\n')
+        handle.close()
+        return handle.name
+
+    def test_bulk_import_reports_every_bad_row(self):
+        path = self.write_csv(
+            'Apollo,alice,2017-01-01,2017-06-30,50,',
+            'Apollo,bob,2017-01-01,2017-03-31,,200',
+            'Apollo,carol,2017-01-01,2017-03-31,50,',
+            'Apollo,bob,2016-12-01,2017-03-31,50,',
+            'Apollo,bob,2017-01-01,2017-03-31,50,10',
+            'Zeus,bob,2017-01-01,2017-03-31,50,')
+        result = CommitmentImport(path, batch_size=1).run()
+        self.assertEqual(result.created, 2)
+        self.assertEqual([line for line, _ in result.errors], [4, 5, 6, 7])
+        self.assertEqual(Commitment.objects.count(), 2)
+        self.assertEqual(
+            ResourceMonth.objects.filter(resource=self.alice).count(), 6)
+
+    def test_import_refreshes_forecasts_and_snapshot(self):
+        live = PipelineForecast(datetime.date(2017, 1, 1))
+        path = self.write_csv('Apollo,alice,2017-01-01,2017-06-30,50,')
+        with override_settings(PLANNING_SNAPSHOT='unused.snapshot'):
+            CommitmentImport(path).run()
+        self.assertAlmostEqual(live.supply[self.unit.pk][0], 1.5)
+        self.assertEqual(Job.objects.filter(
+            kind='build_planning_snapshot').count(), 1)
+
+    def test_dry_run_writes_nothing(self):
+        path = self.write_csv('Apollo,alice,2017-01-01,2017-06-30,50,')
+        stdout = StringIO()
+        call_command('import_commitments', path, dry_run=True, stdout=stdout)
+        self.assertIn('1 valid commitments', stdout.getvalue())
+        self.assertFalse(Commitment.objects.exists())
+
+    def test_clean_raises_validation_error(self):
+        with self.assertRaises(ValidationError):
+            self.commit(self.alice, datetime.date(2017, 1, 1),
+                        datetime.date(2017, 2, 1))
+
+
+class OrgRollupTests(PlanningTestCase):
+
+    def test_rollup_covers_each_subtree(self):
+        web = OrganizationalUnit.objects.create(
+            name='Web', abbreviation='WEB', parent=self.unit)
+        carol = self.make_resource('carol', unit=web)
+        self.project.skills.add(self.python)
+        self.rate(self.alice, self.python, 'Favorite')
+        self.rate(carol, self.python, 'Little')
+        self.commit(self.alice, datetime.date(2017, 1, 1),
+                    datetime.date(2017, 2, 28), percentage=100)
+        with self.assertLogs('planning.conflicts', 'WARNING'):
+            self.commit(self.alice, datetime.date(2017, 1, 1),
+                        datetime.date(2017, 1, 31), percentage=20)
+        self.commit(carol, datetime.date(2017, 1, 1),
+                    datetime.date(2017, 2, 28), percentage=50)
+
+        with self.assertNumQueries(3):
+            report = org_rollup(self.unit, datetime.date(2017, 1, 1),
+                                datetime.date(2017, 2, 1))
+        engineering, web_report = report['units']
+        self.assertEqual(engineering['headcount'], 3)
+        january, february = engineering['months']
+        self.assertAlmostEqual(january['coverage'], (1.2 + 0.5) / 3)
+        self.assertEqual(january['over_allocated'], 1)
+        self.assertEqual(january['under_allocated'], 2)
+        self.assertEqual(february['over_allocated'], 0)
+        self.assertAlmostEqual(january['enjoyment'], 5.0)
+
+        self.assertEqual(web_report['headcount'], 1)
+        self.assertEqual(web_report['months'][0]['coverage'], 0.5)
+        self.assertEqual(web_report['months'][0]['enjoyment'], 1.0)
+
+    def test_command_outputs_json(self):
+        stdout = StringIO()
+        call_command('org_rollup_report', unit=self.unit.pk,
+                     start=datetime.date(2017, 1, 1), stdout=stdout)
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(report['months'], ['2017-01-01'])
+        self.assertEqual(report['units'][0]['headcount'], 2)
+
+
+class SkillSearchAvailabilityTests(PlanningTestCase):
+
+    def test_filters_by_free_capacity(self):
+        self.rate(self.alice, self.python, 'Enjoy')
+        self.rate(self.bob, self.python, 'Enjoy')
+        self.commit(self.alice, datetime.date(2017, 3, 1),
+                    datetime.date(2017, 3, 31), percentage=80)
+        criteria = [{'skill': self.python, 'min_enjoyment': 'Enjoy'}]
+        self.assertEqual(
+            find_resources(criteria, datetime.date(2017, 2, 1),
+                           datetime.date(2017, 4, 1), free=0.5),
+            [self.bob.pk])
+        self.assertEqual(
+            find_resources(criteria, datetime.date(2017, 4, 1), free=0.5),
+            [self.alice.pk, self.bob.pk])
+
+
+class OptimizerTests(PlanningTestCase):
+
+    def setUp(self):
+        self.reports = Project.objects.create(
+            name='Reports', sponsor=self.sponsor, status='active',
+            start=datetime.date(2017, 1, 16), end=datetime.date(2017, 12, 31))
+        self.rate(self.alice, self.python, 'Favorite')
+        self.rate(self.alice, self.excel, 'Enjoy')
+        self.rate(self.bob, self.python, 'Favorite')
+        self.rate(self.bob, self.excel, 'None')
+
+    def test_maximizes_total_enjoyment(self):
+        # taking alice for python first would leave bob on excel at 0
+        proposal = propose_assignments(
+            [(self.project, self.python, 160), (self.reports, self.excel, 160)],
+            datetime.date(2017, 2, 1))
+        self.assertEqual(
+            sorted((c.project_id, c.resource_id, c.start, c.end, c.percentage)
+                   for c in proposal.commitments),
+            sorted([
+                (self.project.pk, self.bob.pk, datetime.date(2017, 2, 1),
+                 datetime.date(2017, 2, 28), Decimal('100.00')),
+                (self.reports.pk, self.alice.pk, datetime.date(2017, 2, 1),
+                 datetime.date(2017, 2, 28), Decimal('100.00')),
+            ]))
+        self.assertEqual(proposal.unmet, {})
+        self.assertEqual(proposal.enjoyment, 160 * 9 + 160 * 4)
+
+    def test_runs_of_equal_rate_become_one_commitment(self):
+        # October and November 2017 both have 22 working days
+        proposal = propose_assignments(
+            [(self.project, self.python, 88)],
+            datetime.date(2017, 10, 1), datetime.date(2017, 12, 1),
+            resources=[self.alice])
+        self.assertEqual(
+            [(c.start, c.end, c.percentage) for c in proposal.commitments],
+            [(datetime.date(2017, 10, 1), datetime.date(2017, 11, 30),
+              Decimal('50.00')),
+             (datetime.date(2017, 12, 1), datetime.date(2017, 12, 31),
+              Decimal('52.38'))])
+        self.assertFalse(Commitment.objects.exists())
+
+    def test_respects_capacity_and_project_dates(self):
+        self.commit(self.bob, datetime.date(2017, 1, 1),
+                    datetime.date(2017, 1, 31), percentage=100)
+        proposal = propose_assignments(
+            [(self.reports, self.python, 176)], datetime.date(2017, 1, 1))
+        commitment, = proposal.commitments
+        self.assertEqual(commitment.resource_id, self.alice.pk)
+        self.assertEqual(commitment.start, datetime.date(2017, 1, 16))
+        # 12 of January's 22 working days are within the project
+        self.assertEqual(commitment.percentage, Decimal('100.00'))
+        self.assertEqual(proposal.unmet, {})
+
+        proposal = propose_assignments(
+            [(self.project, self.python, 300)], datetime.date(2017, 1, 1))
+        self.assertEqual(
+            proposal.unmet,
+            {(self.project.pk, self.python.pk, datetime.date(2017, 1, 1)):
+             300 - 176})
+        proposal.save()
+        self.assertAlmostEqual(
+            self.alice.coverage(datetime.date(2017, 1, 1)), 1.0)
+
+    def test_project_starting_mid_month_stays_within_capacity(self):
+        proposal = propose_assignments(
+            [(self.reports, self.python, 400)], datetime.date(2017, 1, 1),
+            datetime.date(2017, 3, 1), resources=[self.alice])
+        self.assertEqual(
+            [(c.start, c.end, c.percentage) for c in proposal.commitments],
+            [(datetime.date(2017, 1, 16), datetime.date(2017, 3, 31),
+              Decimal('100.00'))])
+        for commitment in proposal.commitments:
+            self.assertLessEqual(commitment.percentage, 100)
+        # 12 of January's 22 working days are within the project
+        self.assertEqual(
+            proposal.unmet[(self.reports.pk, self.python.pk,
+                            datetime.date(2017, 1, 1))],
+            round((400 - 176) * 12 / 22.0))
+        proposal.save()
+        self.assertAlmostEqual(
+            self.alice.coverage(datetime.date(2017, 1, 1)), 12 / 22.0)
+
+
+class ForecastTests(PlanningTestCase):
+
+    def setUp(self):
+        self.bid = Project.objects.create(
+            name='Bid', sponsor=self.sponsor, status='opportunity',
+            start=datetime.date(2017, 1, 1), end=datetime.date(2017, 12, 31))
+        self.sales = OrganizationalUnit.objects.create(
+            name='Sales', abbreviation='SAL')
+        self.carol = self.make_resource('carol', unit=self.sales)
+        self.commit(self.alice, datetime.date(2017, 1, 1),
+                    datetime.date(2017, 12, 31), percentage=100)
+        self.commit(self.bob, datetime.date(2017, 1, 1),
+                    datetime.date(2017, 12, 31), percentage=100,
+                    project=self.bid)
+
+    def test_weighted_demand_against_supply(self):
+        with self.assertNumQueries(2):
+            forecast = PipelineForecast(datetime.date(2017, 1, 1),
+                                        datetime.date(2017, 3, 1))
+        # alice's active project takes her off the unit's free capacity
+        self.assertEqual(list(forecast.supply[self.unit.pk]), [1.0] * 3)
+        self.assertEqual(list(forecast.demand[self.unit.pk]), [0.25] * 3)
+        self.assertEqual(forecast.gap(self.unit.pk, datetime.date(2017, 2, 1)),
+                         0.75)
+        self.assertEqual(forecast.gap(self.sales.pk, datetime.date(2017, 2, 1)),
+                         1.0)
+        report = forecast.report()
+        self.assertEqual([u['id'] for u in report['units']],
+                         [self.unit.pk, self.sales.pk])
+
+    def test_status_change_reweights_one_project(self):
+        forecast = PipelineForecast(datetime.date(2017, 1, 1))
+        self.bid.status = 'pending'
+        with self.assertNumQueries(2):
+            self.bid.save()
+        self.assertAlmostEqual(forecast.demand[self.unit.pk][0], 0.9)
+
+        self.commit(self.carol, datetime.date(2017, 1, 1),
+                    datetime.date(2017, 1, 31), percentage=50,
+                    project=self.bid)
+        self.assertAlmostEqual(forecast.demand[self.sales.pk][0], 0.45)
+        self.assertAlmostEqual(forecast.demand[self.unit.pk][0], 0.9)
+
+        # saves that cannot change the status skip the lookup
+        with self.assertNumQueries(1):
+            self.bid.save(update_fields=['end'])
+
+        # won: the work moves from demand to committed supply
+        self.bid.status = 'active'
+        self.bid.save()
+        self.assertAlmostEqual(forecast.demand[self.unit.pk][0], 0.0)
+        self.assertAlmostEqual(forecast.supply[self.unit.pk][0], 0.0)
+        self.assertAlmostEqual(forecast.gap(self.sales.pk,
+                                            datetime.date(2017, 1, 1)), 0.5)
+
+
+class BurnTests(PlanningTestCase):
+
+    def test_cost_and_funding_draw_down(self):
+        self.unit.hourly_rate = 50
+        self.unit.save()
+        self.alice.hourly_rate = 100
+        self.alice.save()
+        # january has 176 working hours, february 160 and march 184
+        self.commit(self.alice, datetime.date(2017, 1, 1),
+                    datetime.date(2017, 3, 31), percentage=50)
+        self.commit(self.bob, datetime.date(2017, 1, 1),
+                    datetime.date(2017, 1, 31), percentage=100)
+        january = BudgetIncrement.objects.create(
+            project=self.project, amount=20000,
+            start=datetime.date(2017, 1, 1), end=datetime.date(2017, 1, 31))
+        BudgetIncrement.objects.create(
+            project=self.project, amount=10000,
+            start=datetime.date(2017, 2, 1), end=datetime.date(2017, 12, 31))
+
+        with self.assertNumQueries(5):
+            burn = portfolio_burn()[self.project.pk]
+        # the months run through the last increment's expiry in december
+        self.assertEqual(list(burn.cost),
+                         [17600.0, 8000.0, 9200.0] + [0.0] * 9)
+        self.assertEqual(list(burn.cumulative())[:4],
+                         [17600.0, 25600.0, 34800.0, 34800.0])
+        self.assertEqual(burn.funded, 30000.0)
+        self.assertEqual(burn.expired,
+                         [(january.pk, datetime.date(2017, 1, 31), 2400.0)])
+        self.assertEqual(burn.exhausted, datetime.date(2017, 3, 1))
+        self.assertEqual(burn.shortfall, 7200.0)
+        self.assertEqual(burn.report()['exhausted'], '2017-03-01')
+
+    def test_unit_rates_are_inherited(self):
+        self.unit.hourly_rate = 75
+        self.unit.save()
+        web = OrganizationalUnit.objects.create(
+            name='Web', abbreviation='WEB', parent=self.unit)
+        self.assertEqual(unit_rates(), {self.unit.pk: 75.0, web.pk: 75.0})
+
+
+class ConflictTests(PlanningTestCase):
+
+    def test_flags_months_over_threshold(self):
+        self.commit(self.alice, datetime.date(2017, 1, 1),
+                    datetime.date(2017, 6, 30), percentage=80)
+        with self.assertLogs('planning.conflicts', 'WARNING'):
+            self.commit(self.alice, datetime.date(2017, 3, 1),
+                        datetime.date(2017, 4, 30), percentage=40)
+        self.commit(self.bob, datetime.date(2017, 1, 1),
+                    datetime.date(2017, 12, 31), percentage=100)
+        found = scan()
+        self.assertEqual(
+            [(c.resource_id, c.month) for c in found],
+            [(self.alice.pk, datetime.date(2017, 3, 1)),
+             (self.alice.pk, datetime.date(2017, 4, 1))])
+        self.assertAlmostEqual(found[0].total, 1.2)
+        self.assertEqual(
+            len(scan(threshold=0.9, start=datetime.date(2017, 6, 1))), 7)
+
+    def test_matches_coverage_matrix(self):
+        random = Random(7)
+        working_calendar = get_calendar()
+        with self.assertLogs('planning.conflicts', 'WARNING'):
+            for i in range(60):
+                start = datetime.date(2017, 1, 1) + datetime.timedelta(
+                    days=random.randint(0, 300))
+                end = min(start + datetime.timedelta(
+                    days=random.randint(0, 200)), datetime.date(2017, 12, 31))
+                if random.random() < 0.5:
+                    self.commit(random.choice([self.alice, self.bob]),
+                                start, end, percentage=random.randint(5, 60))
+                else:
+                    self.commit(random.choice([self.alice, self.bob]),
+                                start, end,
+                                hours=working_calendar.hours_between(
+                                    start, end) * random.random())
+        matrix = coverage_matrix(None, datetime.date(2017, 1, 1),
+                                 datetime.date(2017, 12, 1))
+        expected = [(r, m, v) for r, m, v in matrix.below(float('inf'))
+                    if v > 0.5]
+        found = scan(threshold=0.5)
+        self.assertEqual([(c.resource_id, c.month) for c in found],
+                         [(r, m) for r, m, _ in expected])
+        for conflict, (_, _, value) in zip(found, expected):
+            self.assertAlmostEqual(conflict.total, value)
+
+    def test_save_checks_only_the_changed_resource(self):
+        self.commit(self.alice, datetime.date(2017, 1, 1),
+                    datetime.date(2017, 12, 31), percentage=70)
+        with self.assertLogs('planning.conflicts', 'WARNING'):
+            commitment = self.commit(
+                self.alice, datetime.date(2017, 5, 1),
+                datetime.date(2017, 5, 31), percentage=50)
+        self.assertEqual([c.month for c in commitment.conflicts],
+                         [datetime.date(2017, 5, 1)])
+
+
+class LineageRollupTests(PlanningTestCase):
+
+    def test_totals_across_follow_ons(self):
+        follow_on = Project.objects.create(
+            name='Apollo II', sponsor=self.sponsor, status='active',
+            predecessor=self.project, start=datetime.date(2017, 1, 1),
+            end=datetime.date(2017, 12, 31))
+        for project, amount in ((self.project, 1000), (follow_on, 500)):
+            BudgetIncrement.objects.create(
+                project=project, amount=amount,
+                start=datetime.date(2017, 1, 1),
+                end=datetime.date(2017, 12, 31))
+        self.rate(self.alice, self.python, 'Enjoy')
+        self.rate(self.bob, self.python, 'Little')
+        self.project.skills.add(self.python)
+        follow_on.skills.add(self.python)
+        self.commit(self.alice, datetime.date(2017, 1, 1),
+                    datetime.date(2017, 1, 31), percentage=100)
+        self.commit(self.bob, datetime.date(2017, 2, 1),
+                    datetime.date(2017, 2, 28), percentage=100,
+                    project=follow_on)
+
+        with self.assertNumQueries(4):
+            report = lineage_rollup([follow_on])
+        rollup = report[0]
+        self.assertEqual(rollup['lineage'], [self.project.pk, follow_on.pk])
+        self.assertEqual(rollup['funding'], 1500.0)
+        self.assertEqual((rollup['commitments'], rollup['resources']), (2, 2))
+        self.assertAlmostEqual(rollup['coverage'], 2.0)
+        months = ProjectMonth.objects.filter(
+            project__in=[self.project, follow_on])
+        self.assertAlmostEqual(
+            rollup['hours'], sum(month.hours for month in months))
+        self.assertAlmostEqual(rollup['enjoyment'], sum(
+            month.hours * month.team_enjoyment for month in months) /
+            rollup['hours'])
+
+
+class SnapshotTests(PlanningTestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+        self.addCleanup(lambda: os.path.exists(self.path + '.lock') and
+                        os.remove(self.path + '.lock'))
+        self.rate(self.alice, self.python, 'Enjoy')
+        self.rate(self.bob, self.python, 'Little')
+        self.project.skills.add(self.python)
+        self.commit(self.alice, datetime.date(2017, 1, 11),
+                    datetime.date(2017, 6, 30), percentage=60)
+        with self.assertLogs('planning.conflicts', 'WARNING'):
+            self.commit(self.alice, datetime.date(2017, 3, 1),
+                        datetime.date(2017, 4, 15), percentage=50)
+        self.commit(self.bob, datetime.date(2017, 2, 1),
+                    datetime.date(2017, 8, 31), hours=400)
+
+    def test_matches_orm_calculations(self):
+        self.assertEqual(snapshot.build(self.path), 1)
+        mapped = snapshot.Snapshot(self.path)
+        start, end = datetime.date(2017, 1, 1), datetime.date(2017, 9, 1)
+        with self.assertNumQueries(0):
+            matrix = mapped.coverage_matrix(None, start, end)
+            scores = mapped.score_enjoyment(start, end)
+            conflicts = mapped.conflicts()
+        expected = coverage_matrix(None, start, end)
+        self.assertEqual(matrix.resource_ids, expected.resource_ids)
+        for row, expected_row in zip(matrix.values, expected.values):
+            for value, expected_value in zip(row, expected_row):
+                self.assertAlmostEqual(value, expected_value)
+        expected_scores = score_enjoyment(start, end)
+        for month in month_range(start, end):
+            self.assertEqual(scores.resource(self.bob.pk, month),
+                             expected_scores.resource(self.bob.pk, month))
+            self.assertEqual(scores.project(self.project.pk, month),
+                             expected_scores.project(self.project.pk, month))
+        self.assertEqual(conflicts, scan())
+
+        views = mapped.commitments(self.alice.pk)
+        self.assertEqual([(view.start, view.percentage, view.hours)
+                          for view in views],
+                         [(datetime.date(2017, 1, 11), 60.0, None),
+                          (datetime.date(2017, 3, 1), 50.0, None)])
+        with self.assertRaises(AttributeError):
+            views[0].extra = True
+
+    def test_remaps_after_rebuild(self):
+        with override_settings(PLANNING_SNAPSHOT=self.path):
+            snapshot.build()
+            first = snapshot.get_snapshot()
+            self.assertIs(snapshot.get_snapshot(), first)
+            count = len(first.commitments())
+            self.commit(self.bob, datetime.date(2017, 9, 1),
+                        datetime.date(2017, 9, 30), percentage=10)
+            self.rate(self.bob, self.excel, 'Enjoy')
+            # both writes share one queued rebuild
+            self.assertEqual(Job.objects.filter(
+                kind='build_planning_snapshot').count(), 1)
+            call_command('build_planning_snapshot', stdout=StringIO())
+            second = snapshot.get_snapshot()
+        self.assertEqual((first.generation, second.generation), (1, 2))
+        self.assertEqual(len(second.commitments()), count + 1)
+        # readers still holding the replaced mapping can keep using it
+        self.assertEqual(len(first.commitments()), count)
+
+
+class MetricCacheTests(PlanningTestCase):
+
+    def setUp(self):
+        caches['metrics'].clear()
+        metriccache.reset_stats()
+        self.rate(self.alice, self.python, 'Enjoy')
+        self.project.skills.add(self.python)
+        self.commitment = self.commit(
+            self.alice, datetime.date(2017, 1, 1),
+            datetime.date(2017, 12, 31), percentage=50)
+        self.month = datetime.date(2017, 3, 1)
+
+    def test_repeat_reads_skip_the_database(self):
+        self.assertEqual(self.alice.coverage(self.month), 0.5)
+        self.assertEqual(self.project.team_enjoyment(self.month), 4.0)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.alice.coverage(self.month), 0.5)
+            self.assertEqual(self.alice.coverage(
+                datetime.date(2017, 3, 15)), 0.5)
+            self.assertEqual(self.project.team_enjoyment(self.month), 4.0)
+        self.assertEqual(metriccache.stats()['hits'], 3)
+        self.assertEqual(metriccache.stats()['misses'], 2)
+
+    def test_writes_bump_versions(self):
+        self.assertEqual(self.alice.coverage(self.month), 0.5)
+        self.assertEqual(self.alice.enjoyment(self.month), 4.0)
+        self.assertIsNone(self.bob.enjoyment(self.month))
+        self.commitment.percentage = 80
+        self.commitment.save()
+        self.assertEqual(self.alice.coverage(self.month), 0.8)
+        self.assertEqual(self.alice.enjoyment(self.month), 4.0)
+
+        # queryset updates skip the signals, so the cached value stays
+        ResourceSkill.objects.filter(resource=self.alice).update(
+            enjoyment=self.enjoyment['Little'])
+        self.assertEqual(self.alice.enjoyment(self.month), 4.0)
+        ResourceSkill.objects.get(resource=self.alice).save()
+        self.assertEqual(self.alice.enjoyment(self.month), 1.0)
+        self.assertEqual(self.project.team_enjoyment(self.month), 1.0)
+        self.commitment.delete()
+        self.assertEqual(self.alice.coverage(self.month), 0.0)
+
+    def test_enjoyment_value_and_deferred_writes_invalidate(self):
+        self.assertEqual(self.alice.enjoyment(self.month), 4.0)
+        other = Project.objects.create(
+            name='Other', sponsor=self.sponsor, status='active',
+            start=datetime.date(2017, 1, 1), end=datetime.date(2017, 12, 31))
+        self.commit(self.bob, datetime.date(2017, 1, 1),
+                    datetime.date(2017, 12, 31), percentage=50,
+                    project=other)
+        untouched = ResourceMonth.objects.get(
+            resource=self.bob, month=self.month).pk
+        enjoy = self.enjoyment['Enjoy']
+        enjoy.value = 5
+        enjoy.save()
+        # only alice, who rated a skill with the level, and her project
+        # are refreshed
+        self.assertEqual(ResourceMonth.objects.get(
+            resource=self.bob, month=self.month).pk, untouched)
+        self.assertEqual(self.alice.enjoyment(self.month), 5.0)
+        self.assertEqual(ResourceMonth.objects.get(
+            resource=self.alice, month=self.month).enjoyment, 5.0)
+        self.assertEqual(ProjectMonth.objects.get(
+            project=self.project, month=self.month).team_enjoyment, 5.0)
+
+        self.assertEqual(self.alice.coverage(self.month), 0.5)
+        with override_settings(JOBS={'DEFER_ROLLUPS': True}):
+            self.commitment.percentage = 20
+            self.commitment.save()
+        # the metric is fresh even though the rollup refresh is queued
+        self.assertEqual(self.alice.coverage(self.month), 0.2)
+        self.assertEqual(ResourceMonth.objects.get(
+            resource=self.alice, month=self.month).coverage, 0.5)
+
+    @override_settings(CACHES={'metrics': {
+        'BACKEND': 'planning.metriccache.LRUMemoryCache',
+        'LOCATION': 'lru-eviction', 'OPTIONS': {'MAX_ENTRIES': 2}}})
+    def test_lru_eviction(self):
+        cache = caches['metrics']
+        cache.clear()
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')),
+                         (1, None, 3))
+        self.assertEqual(cache.evictions, 1)
+
+    def test_threads_share_entries_and_versions(self):
+        before = metriccache.version('shared')
+        caches['metrics'].set('shared-value', 1)
+        found = {}
+
+        def read():
+            # each thread gets its own cache backend instance
+            found['value'] = caches['metrics'].get('shared-value')
+            found['version'] = metriccache.version('shared')
+
+        metriccache.bump('shared')
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+        self.assertEqual(found['value'], 1)
+        self.assertNotEqual(found['version'], before)
+        self.assertEqual(found['version'], metriccache.version('shared'))
+
+
+class SyntheticOrgTests(TestCase):
+
+    def test_generates_consistent_data(self):
+        out = StringIO()
+        call_command('generate_synthetic_org', resources=60, projects=20,
+                     stdout=out)
+        self.assertIn('commitment\t180', out.getvalue())
+        self.assertEqual(Resource.objects.count(), 60)
+        for unit in OrganizationalUnit.objects.exclude(parent=None):
+            self.assertEqual(unit.path, unit.parent.path + '%s/' % unit.pk)
+        self.assertEqual(lineage_roots(Project.objects.all()), dict(
+            Project.objects.values_list('pk', 'root_id')))
+        for commitment in Commitment.objects.select_related('project'):
+            self.assertEqual(commitment_errors(
+                commitment.start, commitment.end, commitment.percentage,
+                commitment.hours, commitment.project.start,
+                commitment.project.end), [])
+        self.assertTrue(ResourceMonth.objects.exists())
+        # later saves carry on from the generated primary keys
+        OrganizationalUnit.objects.create(name='Extra', abbreviation='EXT')
+
+    def test_same_seed_same_organization(self):
+        def shape(org):
+            return list(Commitment.objects.filter(
+                resource__in=org.resource_ids).order_by('pk').values_list(
+                    'start', 'end', 'percentage', 'hours'))
+
+        first = SyntheticOrg(resources=20, seed=3, prefix='a').generate()
+        second = SyntheticOrg(resources=20, seed=3, prefix='b').generate()
+        self.assertEqual(shape(first), shape(second))
+
+    def test_short_schedules_stay_valid(self):
+        # a one month window squeezes projects against its last day
+        SyntheticOrg(resources=40, projects=30, months=1).generate(
+            refresh=False)
+        for commitment in Commitment.objects.select_related('project'):
+            self.assertEqual(commitment_errors(
+                commitment.start, commitment.end, commitment.percentage,
+                commitment.hours, commitment.project.start,
+                commitment.project.end), [])
+
+    def test_unit_abbreviations_are_unique(self):
+        SyntheticOrg(resources=1, units=1100, projects=1).generate(
+            refresh=False)
+        abbreviations = OrganizationalUnit.objects.values_list(
+            'abbreviation', flat=True)
+        self.assertEqual(len(set(abbreviations)), 1100)
+
+    def test_benchmark_leaves_database_untouched(self):
+        handle, path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        call_command('benchmark_planning', scales=[30], import_rows=10,
+                     output=path, stdout=StringIO())
+        with open(path) as handle:
+            results = json.load(handle)
+        self.assertEqual(results['scales']['30']['overlap']['queries'], 12)
+        self.assertEqual(results['scales']['30']['coverage_matrix'][
+            'queries'], 2)
+        self.assertFalse(Resource.objects.exists())
+
+
+class AllocationExportTests(PlanningTestCase):
+
+    def setUp(self):
+        self.commit(self.alice, datetime.date(2017, 1, 16),
+                    datetime.date(2017, 3, 31), percentage=50)
+        self.commit(self.alice, datetime.date(2017, 2, 1),
+                    datetime.date(2017, 2, 28), hours=40)
+        self.commit(self.bob, datetime.date(2017, 3, 1),
+                    datetime.date(2017, 3, 31), percentage=100)
+        self.staff = User.objects.create(username='finance', is_staff=True)
+
+    def grid(self, lines):
+        return list(csv.reader(lines))
+
+    def test_streams_one_row_per_resource_and_project(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('allocation-export'),
+                                   {'start': '2017-01', 'end': '2017-03'})
+        self.assertTrue(response.streaming)
+        with self.assertNumQueries(1):
+            grid = self.grid(line.decode('utf-8')
+                             for line in response.streaming_content)
+        self.assertEqual(grid[0][:5], ['resource', 'unit', 'project',
+                                       '2017-01 hours', '2017-01 %'])
+        alice, bob = grid[1:]
+        self.assertEqual(alice[:3], ['alice', 'ENG', 'Apollo'])
+        matrix = coverage_matrix([self.alice], datetime.date(2017, 1, 1),
+                                 datetime.date(2017, 3, 1))
+        self.assertEqual(alice[4::2], ['%.1f' % (value * 100)
+                                       for value in matrix.values[0]])
+        self.assertEqual(alice[5], '%.2f' % (
+            get_calendar().capacity(datetime.date(2017, 2, 1)) * 0.5 + 40))
+        self.assertEqual(bob[3:], ['0.00', '0.0', '0.00', '0.0',
+                                   '%.2f' % get_calendar().capacity(
+                                       datetime.date(2017, 3, 1)), '100.0'])
+
+        self.assertEqual(self.client.get(
+            reverse('allocation-export'), {'start': 'March'}).status_code,
+            400)
+        self.client.logout()
+        self.assertEqual(self.client.get(
+            reverse('allocation-export')).status_code, 302)
+
+    def test_command_matches_view(self):
+        out = StringIO()
+        call_command('export_allocations', start=datetime.date(2017, 1, 1),
+                     end=datetime.date(2017, 3, 1), stdout=out)
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('allocation-export'),
+                                   {'start': '2017-01', 'end': '2017-03'})
+        self.assertEqual(
+            out.getvalue(),
+            b''.join(response.streaming_content).decode('utf-8'))
+
+
+class ScenarioTests(PlanningTestCase):
+
+    def setUp(self):
+        self.project.skills.add(self.python)
+        self.rate(self.alice, self.python, 'Favorite')
+        self.rate(self.bob, self.python, 'Enjoy')
+        self.bid = Project.objects.create(
+            name='Bid', sponsor=self.sponsor, status='opportunity',
+            start=datetime.date(2017, 1, 1), end=datetime.date(2017, 12, 31))
+        self.full = self.commit(self.alice, datetime.date(2017, 1, 1),
+                                datetime.date(2017, 12, 31), percentage=100)
+        self.half = self.commit(self.bob, datetime.date(2017, 1, 1),
+                                datetime.date(2017, 12, 31), percentage=50)
+        self.june = datetime.date(2017, 6, 1)
+
+    def test_reassignment_evaluated_without_writes(self):
+        overlay = Overlay()
+        overlay.reassign(self.full, self.june, resource=self.bob)
+        result = ScenarioResult(overlay, datetime.date(2017, 1, 1),
+                                datetime.date(2017, 12, 1))
+        self.assertEqual(result.resources, set([self.alice.pk, self.bob.pk]))
+        self.assertEqual(result.projects, set([self.project.pk]))
+        self.assertAlmostEqual(result.coverage.get(self.alice.pk, self.june),
+                               0.0)
+        self.assertAlmostEqual(result.coverage.get(self.bob.pk, self.june),
+                               1.5)
+        self.assertAlmostEqual(result.coverage.get(self.bob.pk,
+                                                   datetime.date(2017, 5, 1)),
+                               0.5)
+        self.assertAlmostEqual(
+            result.team_enjoyment(self.project.pk, self.june), 4.0)
+        self.assertEqual([(c.resource_id, c.month) for c in
+                          result.conflicts()][:1], [(self.bob.pk, self.june)])
+        self.assertEqual(len(result.conflicts()), 7)
+
+        diff = result.diff()
+        self.assertEqual(
+            sorted((row['resource'], row['month']) for row in
+                   diff['resources'] if row['month'] == '2017-06-01'),
+            [(self.alice.pk, '2017-06-01'), (self.bob.pk, '2017-06-01')])
+        self.assertEqual(len(diff['projects']), 7)
+        json.dumps(diff)
+
+        # nothing was written
+        self.assertEqual(Commitment.objects.count(), 2)
+        self.assertEqual(ResourceMonth.objects.get(
+            resource=self.alice, month=self.june).coverage, 1.0)
+
+    def test_status_override_changes_expected_coverage(self):
+        carol = self.make_resource('carol')
+        self.commit(carol, datetime.date(2017, 1, 1),
+                    datetime.date(2017, 12, 31), percentage=100,
+                    project=self.bid)
+        overlay = Overlay()
+        overlay.set_status(self.bid, 'pending')
+        result = ScenarioResult(overlay, self.june)
+        self.assertEqual(result.resources, set([carol.pk]))
+        self.assertAlmostEqual(result.coverage.get(carol.pk, self.june), 1.0)
+        self.assertAlmostEqual(result.expected.get(carol.pk, self.june), 0.9)
+        self.assertEqual(result.resource(self.alice.pk, self.june)[0], 1.0)
+        self.assertEqual(Project.objects.get(pk=self.bid.pk).status,
+                         'opportunity')
+
+    def test_saved_and_committed(self):
+        overlay = Overlay()
+        overlay.reassign(self.full, self.june, project=self.bid)
+        overlay.remove(self.half)
+        key = overlay.add(self.bob, self.bid, datetime.date(2017, 3, 1),
+                          datetime.date(2017, 3, 31), hours=40)
+        overlay.modify(key, hours=Decimal('20'))
+        overlay.set_status(self.bid, 'pending')
+        scenario = Scenario(name='Move alice')
+        scenario.set_overlay(overlay)
+        scenario.save()
+
+        loaded = Scenario.objects.get(pk=scenario.pk).overlay()
+        self.assertEqual(loaded.to_dict(), overlay.to_dict())
+        deleted = []
+
+        def receiver(instance, **kwargs):
+            deleted.append(instance)
+        post_delete.connect(receiver, sender=Commitment)
+        self.addCleanup(post_delete.disconnect, receiver, sender=Commitment)
+        loaded.commit()
+        # dependants are refreshed once, not per deleted row
+        self.assertEqual(deleted, [])
+        self.assertEqual(
+            sorted(Commitment.objects.values_list(
+                'resource__user__username', 'project__name', 'start', 'end',
+                'hours')),
+            [('alice', 'Apollo', datetime.date(2017, 1, 1),
+              datetime.date(2017, 5, 31), None),
+             ('alice', 'Bid', self.june, datetime.date(2017, 12, 31), None),
+             ('bob', 'Bid', datetime.date(2017, 3, 1),
+              datetime.date(2017, 3, 31), Decimal('20'))])
+        self.assertTrue(Commitment.objects.filter(pk=self.full.pk).exists())
+        self.assertEqual(Project.objects.get(pk=self.bid.pk).status,
+                         'pending')
+        self.assertFalse(ResourceMonth.objects.filter(
+            resource=self.bob, month=self.june).exists())
+        self.assertEqual(ResourceMonth.objects.get(
+            resource=self.alice, month=self.june).coverage, 1.0)
+
+    def test_invalid_commit_rolls_back(self):
+        overlay = Overlay()
+        overlay.remove(self.half)
+        overlay.modify(self.full, end=datetime.date(2018, 6, 30))
+        with self.assertRaises(ValidationError):
+            overlay.commit()
+        self.assertEqual(Commitment.objects.count(), 2)
+
+    def test_commit_reports_deleted_rows(self):
+        overlay = Overlay()
+        overlay.modify(self.half, percentage=40)
+        overlay.set_status(self.bid, 'pending')
+        scenario = Scenario(name='Stale')
+        scenario.set_overlay(overlay)
+        scenario.save()
+        half = self.half.pk
+        self.half.delete()
+        with self.assertRaises(ValidationError) as raised:
+            scenario.overlay().commit()
+        self.assertEqual(raised.exception.messages,
+                         ['Commitment %s no longer exists.' % half])
+
+        overlay = Overlay()
+        overlay.add(self.bob, self.bid, datetime.date(2017, 3, 1),
+                    datetime.date(2017, 3, 31), percentage=10)
+        bid = self.bid.pk
+        self.bid.delete()
+        with self.assertRaises(ValidationError) as raised:
+            overlay.commit()
+        self.assertEqual(raised.exception.messages,
+                         ['Project %s no longer exists.' % bid])
+        self.assertEqual(Commitment.objects.count(), 1)
+
+    @override_settings(WORKING_CALENDAR={
+        'UNITS': {'OPS': {'HOURS_PER_DAY': 4}}})
+    def test_commit_validates_with_unit_calendars(self):
+        ops = OrganizationalUnit.objects.create(name='Ops', abbreviation='OPS')
+        carol = self.make_resource('carol', unit=ops)
+        overlay = Overlay()
+        # 176 hours fit January's default calendar but not a 4 hour day
+        overlay.add(carol, self.project, datetime.date(2017, 1, 1),
+                    datetime.date(2017, 1, 31), hours=176)
+        with self.assertRaises(ValidationError):
+            overlay.commit()
+
+
+@override_settings(JOBS={'PROCESSES': 0, 'COALESCE_SECONDS': 0,
+                         'DEFER_ROLLUPS': True})
+class JobTests(PlanningTestCase):
+
+    def test_identical_pending_jobs_queued_once(self):
+        job = jobs.enqueue('scan_overallocation',
+                           start=datetime.date(2017, 1, 1))
+        self.assertEqual(jobs.enqueue('scan_overallocation',
+                                      start=datetime.date(2017, 1, 1)), job)
+        self.assertNotEqual(jobs.enqueue('scan_overallocation'), job)
+        with self.assertRaises(ValueError):
+            jobs.enqueue('reticulate_splines')
+        # the database refuses a second pending copy outright
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Job.objects.create(kind=job.kind, key=job.key,
+                               pending_key=job.key, run_after=job.run_after)
+
+    @override_settings(JOBS={'PROCESSES': 0, 'STALE_SECONDS': 60,
+                             'MAX_ATTEMPTS': 2})
+    def test_abandoned_jobs_reclaimed_then_failed(self):
+        job = jobs.enqueue('scan_overallocation')
+        self.assertEqual(jobs.claim(1), [job.pk])
+        self.assertEqual(jobs.reclaim(), [])
+        long_ago = timezone.now() - datetime.timedelta(minutes=5)
+        Job.objects.filter(pk=job.pk).update(heartbeat=long_ago)
+        self.assertEqual(jobs.reclaim(), [job.pk])
+        # queued again, so an identical enqueue finds it
+        self.assertEqual(jobs.enqueue('scan_overallocation'), job)
+
+        jobs.claim(1)
+        Job.objects.filter(pk=job.pk).update(heartbeat=long_ago)
+        with self.assertLogs('planning.jobs', 'ERROR'):
+            self.assertEqual(jobs.reclaim(), [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_reclaimed_run_does_not_overwrite_the_new_one(self):
+        def reclaimed(job):
+            # another worker claims the job while this run is still going
+            Job.objects.filter(pk=job.pk).update(
+                attempts=F('attempts') + 1, started=timezone.now())
+            job.set_progress(0.5, 'Stale progress.')
+            return 'stale'
+        jobs.task('test_reclaimed')(reclaimed)
+        self.addCleanup(jobs.TASKS.pop, 'test_reclaimed')
+
+        job = jobs.enqueue('test_reclaimed')
+        self.assertEqual(jobs.Worker(processes=0).run(once=True),
+                         {job.pk: Job.DONE})
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress, job.result),
+                         (Job.RUNNING, 0.0, ''))
+
+    def test_commitment_edits_coalesced_per_resource(self):
+        for month in (3, 1, 6):
+            self.commit(self.alice, datetime.date(2017, month, 1),
+                        datetime.date(2017, month, 28), percentage=50)
+        self.assertFalse(ResourceMonth.objects.exists())
+        pending = Job.objects.get(kind='refresh_resource')
+        self.assertEqual(json.loads(pending.arguments), {
+            'pk': self.alice.pk, 'start': '2017-01-01', 'end': '2017-06-28'})
+        self.assertEqual(Job.objects.filter(kind='refresh_project').count(),
+                         1)
+
+        finished = jobs.Worker().run(once=True)
+        self.assertEqual(sorted(finished.values()), ['done', 'done'])
+        self.assertEqual(
+            list(ResourceMonth.objects.filter(resource=self.alice)
+                 .values_list('month', flat=True)),
+            [datetime.date(2017, month, 1) for month in (1, 3, 6)])
+        self.assertEqual(ProjectMonth.objects.count(), 3)
+        self.assertEqual(Job.objects.get(pk=pending.pk).progress, 1.0)
+
+    def test_worker_command_records_results_and_failures(self):
+        with self.assertLogs('planning.conflicts', 'WARNING'):
+            self.commit(self.alice, datetime.date(2017, 1, 1),
+                        datetime.date(2017, 1, 31), percentage=150)
+        Job.objects.all().delete()
+        out = StringIO()
+        call_command('scan_overallocation', background=True, stdout=out)
+        call_command('rebuild_monthly_metrics', background=True, stdout=out)
+        call_command('export_allocations', background=True,
+                     output=os.path.join(tempfile.gettempdir(), 'missing',
+                                         'grid.csv'), stdout=out)
+        self.assertEqual(Job.objects.filter(status='pending').count(), 3)
+
+        with self.assertLogs('planning.jobs', 'ERROR'):
+            call_command('run_worker', processes=0, once=True, stdout=out)
+        self.assertIn('Ran 3 jobs, 1 failed.', out.getvalue())
+        scan = Job.objects.get(kind='scan_overallocation')
+        self.assertEqual(json.loads(scan.result),
+                         [[self.alice.pk, '2017-01-01', 1.5]])
+        rebuild = Job.objects.get(kind='rebuild_rollups')
+        self.assertEqual((rebuild.status, rebuild.progress), ('done', 1.0))
+        self.assertEqual(ResourceMonth.objects.count(), 1)
+        failed = Job.objects.get(kind='export_allocations')
+        self.assertEqual(failed.status, 'failed')
+        self.assertIn('Traceback', failed.result)
+
+
+@override_settings(JOBS={'STALE_SECONDS': 0.3})
+class HeartbeatTests(TransactionTestCase):
+
+    def test_jobs_run_in_process_keep_their_heartbeat(self):
+        def slow(job):
+            time.sleep(0.5)
+        jobs.task('test_slow')(slow)
+        self.addCleanup(jobs.TASKS.pop, 'test_slow')
+
+        job = jobs.enqueue('test_slow')
+        jobs.claim(1)
+        started = Job.objects.get(pk=job.pk).heartbeat
+        self.assertEqual(jobs.run_job(job.pk, heartbeat=True), Job.DONE)
+        job.refresh_from_db()
+        self.assertGreater(job.heartbeat, started)
+
+
+class PlanHistoryTests(PlanningTestCase):
+
+    def setUp(self):
+        self.project.skills.add(self.python)
+        self.rate(self.alice, self.python, 'Favorite')
+        self.bid = Project.objects.create(
+            name='Bid', sponsor=self.sponsor, status='opportunity',
+            start=datetime.date(2017, 1, 1), end=datetime.date(2017, 12, 31))
+        self.first = self.commit(self.alice, datetime.date(2017, 7, 1),
+                                 datetime.date(2017, 9, 30), percentage=50)
+
+    @override_settings(PLAN_CHECKPOINT_RATIO=10)
+    def test_stores_deltas_and_rebuilds_past_states(self):
+        before = history.take_snapshot('baseline')
+        self.assertTrue(before.checkpoint)
+        self.first.percentage = 100
+        self.first.save()
+        self.commit(self.bob, datetime.date(2017, 7, 1),
+                    datetime.date(2017, 9, 30), percentage=100,
+                    project=self.bid)
+        revised = history.take_snapshot('revised')
+        self.assertEqual(revised.changes, 2)
+        self.assertIsNone(revised.checkpoint)
+        Commitment.objects.filter(pk=self.first.pk).delete()
+        Project.objects.filter(pk=self.bid.pk).update(status='active')
+        latest = history.take_snapshot()
+        self.assertEqual(sorted(PlanChange.objects.filter(
+            snapshot=latest).values_list('table', 'action')),
+            [('commitment', 'removed'), ('project', 'changed')])
+        self.assertEqual(history.take_snapshot().changes, 0)
+
+        self.assertEqual(history.state_at(before).tables['commitment'], {
+            self.first.pk: [self.alice.pk, self.project.pk, '2017-07-01',
+                            '2017-09-30', '50.00', None]})
+        self.assertEqual(
+            history.state_at(revised).tables['commitment'][self.first.pk][4],
+            '100.00')
+        self.assertEqual(history.state_at().tables,
+                         history.PlanState.current().tables)
+        self.assertIsNone(history.state_at(
+            before.taken - datetime.timedelta(seconds=1)))
+
+    def test_checkpoint_after_enough_change(self):
+        history.take_snapshot()
+        for month in range(1, 7):
+            self.commit(self.bob, datetime.date(2017, month, 1),
+                        datetime.date(2017, month, 28), percentage=10)
+        snapshot = history.take_snapshot()
+        self.assertTrue(snapshot.checkpoint)
+        with self.assertNumQueries(3):
+            state = history.state_at(snapshot)
+        self.assertEqual(len(state.tables['commitment']), 7)
+
+    @override_settings(JOBS={'PROCESSES': 0})
+    def test_background_checkpoint(self):
+        history.take_snapshot()
+        call_command('take_plan_snapshot', '--checkpoint', '--background',
+                     stdout=StringIO())
+        jobs.Worker().run(once=True)
+        self.assertTrue(PlanSnapshot.objects.latest('pk').checkpoint)
+
+    @override_settings(PLAN_CHECKPOINT_RATIO=10)
+    def test_unit_trend(self):
+        history.take_snapshot('draft')
+        self.first.percentage = 100
+        self.first.save()
+        self.commit(self.bob, datetime.date(2017, 7, 1),
+                    datetime.date(2017, 9, 30), percentage=100,
+                    project=self.bid)
+        history.take_snapshot('final')
+
+        out = StringIO()
+        call_command('plan_trend_report', str(self.unit.pk), '--start',
+                     '2017-07', '--end', '2017-09', stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['headcount'], 2)
+        self.assertEqual([s['label'] for s in report['snapshots']],
+                         ['draft', 'final'])
+        draft, final = report['snapshots']
+        self.assertEqual(draft['coverage'], [0.25] * 3)
+        self.assertEqual(draft['enjoyment'], [9.0] * 3)
+        self.assertEqual(final['coverage'], [1.0] * 3)
+        self.assertEqual(final['expected_coverage'], [0.625] * 3)
+
+
+class SearchTests(PlanningTestCase):
+
+    def setUp(self):
+        self.project.description = 'Lunar landing guidance software.'
+        self.project.save()
+        self.gemini = Project.objects.create(
+            name='Gemini', sponsor=self.sponsor, status='active',
+            description='Orbital rendezvous practice for Apollo.',
+            start=datetime.date(2017, 1, 1), end=datetime.date(2017, 12, 31))
+        self.agency = Sponsor.objects.create(
+            name='Agency', description='Aerospace research funding.')
+        self.python.description = 'Programming in Python.'
+        self.python.save()
+        self.level = SkillLevel.objects.create(
+            skill=self.python, rank=1, description='Writes small scripts.')
+
+    def found(self, text, **kwargs):
+        return [(result.kind, result.pk)
+                for result in search.search(text, **kwargs)]
+
+    def test_ranked_prefix_matches_across_models(self):
+        with self.assertNumQueries(1):
+            results = search.search('apol')
+        self.assertEqual([(r.kind, r.pk) for r in results],
+                         [('project', self.project.pk),
+                          ('project', self.gemini.pk)])
+        self.assertGreater(results[0].score, results[1].score)
+        self.assertIn('[Apollo]', results[1].snippet)
+        self.assertEqual(self.found('aero'), [('sponsor', self.agency.pk)])
+        self.assertEqual(sorted(self.found('pyth')),
+                         [('skill', self.python.pk),
+                          ('skilllevel', self.level.pk)])
+        self.assertEqual(self.found('lunar guid'),
+                         [('project', self.project.pk)])
+        self.assertEqual(self.found('apollo', kinds=['sponsor']), [])
+        self.assertEqual(self.found('  '), [])
+
+    def test_kept_in_sync(self):
+        self.gemini.description = 'Two person spacecraft.'
+        self.gemini.save()
+        self.assertEqual(self.found('rendezvous'), [])
+        self.assertEqual(self.found('spacecraft'),
+                         [('project', self.gemini.pk)])
+        self.agency.delete()
+        self.assertEqual(self.found('aerospace'), [])
+        self.python.name = 'Python 3'
+        self.python.save()
+        self.assertEqual(search.search('scripts')[0].title,
+                         'Python 3 level 1')
+
+    @override_settings(SEARCH_FTS=False)
+    def test_falls_back_to_substring_matching(self):
+        self.assertFalse(search.available())
+        self.assertEqual(self.found('apol'),
+                         [('project', self.project.pk),
+                          ('project', self.gemini.pk)])
+        self.assertEqual(self.found('writes scr'),
+                         [('skilllevel', self.level.pk)])
+        self.assertIsNone(search.rebuild())
+
+    def test_rebuild_command_and_view(self):
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 7 documents.', out.getvalue())
+        self.assertEqual(self.found('orbit'), [('project', self.gemini.pk)])
+
+        staff = User.objects.create(username='planner', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('search'),
+                                   {'q': 'aerospace', 'kind': 'sponsor'})
+        self.assertEqual(response.json()['results'][0]['pk'],
+                         self.agency.pk)
+        self.assertEqual(self.client.get(
+            reverse('search'), {'q': 'x', 'kind': 'unit'}).status_code, 400)
+
+
+class ApiTests(PlanningTestCase):
+
+    def setUp(self):
+        self.project.skills.add(self.python)
+        self.rate(self.alice, self.python, 'Enjoy')
+        self.commit(self.alice, datetime.date(2017, 1, 1),
+                    datetime.date(2017, 3, 31), percentage=50)
+        self.commit(self.bob, datetime.date(2017, 2, 1),
+                    datetime.date(2017, 2, 28), hours=40)
+        self.client.force_login(
+            User.objects.create(username='dashboard', is_staff=True))
+
+    def get(self, name, **parameters):
+        return self.client.get(reverse('api-%s' % name), parameters)
+
+    def test_keyset_pages_with_selected_fields(self):
+        response = self.get('resources', limit=1, fields='username,skills')
+        page = response.json()
+        self.assertEqual(page['results'], [{
+            'id': self.alice.pk, 'username': 'alice',
+            'skills': [{'skill': self.python.pk, 'level': None,
+                        'enjoyment': 4}]}])
+        page = self.client.get(page['next']).json()
+        self.assertEqual([r['username'] for r in page['results']], ['bob'])
+        self.assertIsNone(page['next'])
+
+        commitments = self.get('commitments', resource=self.bob.pk).json()
+        self.assertEqual(commitments['results'][0]['hours'], '40.00')
+        months = self.get('resource-months', resource=self.alice.pk,
+                          to='2017-02-01', fields='coverage').json()
+        self.assertEqual([row['coverage'] for row in months['results']],
+                         [0.5, 0.5])
+        self.assertEqual(self.get('projects', fields='skills')
+                         .json()['results'][0]['skills'], [self.python.pk])
+
+        self.assertEqual(self.get('projects', fields='owner').status_code,
+                         400)
+        self.assertEqual(self.get('commitments', resource='alice')
+                         .status_code, 400)
+        self.assertIn('commitments', self.client.get(
+            reverse('api-index')).json()['endpoints'])
+
+    def test_unchanged_polls_are_not_modified(self):
+        response = self.get('commitments')
+        etag = response['ETag']
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('api-commitments'),
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertNotEqual(self.get('commitments', limit=1)['ETag'], etag)
+
+        # bulk updates bypass save() but still count as changes
+        Commitment.objects.update(percentage=None, hours=10)
+        response = self.client.get(reverse('api-commitments'),
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_rating_levels_change_the_resources_etag(self):
+        etag = self.get('resources', fields='skills')['ETag']
+        enjoy = self.enjoyment['Enjoy']
+        enjoy.value = 5
+        enjoy.save()
+        response = self.client.get(reverse('api-resources'),
+                                   {'fields': 'skills'},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['skills'][0]
+                         ['enjoyment'], 5)
+
+
+class EnjoymentAlertTests(PlanningTestCase):
+
+    today = datetime.date(2017, 1, 15)
+
+    def setUp(self):
+        self.manager = User.objects.create(username='carol')
+        division = OrganizationalUnit.objects.create(
+            name='Division', abbreviation='DIV', primary_manager=self.manager)
+        self.unit.parent = division
+        self.unit.save()
+        self.project.skills.add(self.python)
+        self.rating = self.rate(self.alice, self.python, 'Little')
+        self.rate(self.bob, self.python, 'Enjoy')
+        for resource in (self.alice, self.bob):
+            self.commit(resource, datetime.date(2017, 1, 1),
+                        datetime.date(2017, 6, 30), percentage=50)
+
+    def test_scan_flags_runs_below_threshold_by_manager(self):
+        result = alerts.scan(today=self.today)
+        self.assertTrue(result.full)
+        alert = EnjoymentAlert.objects.get()
+        self.assertEqual((alert.resource_id, alert.start, alert.months,
+                          alert.lowest), (self.alice.pk,
+                                          datetime.date(2017, 1, 1), 6, 1.0))
+        report = alerts.report()
+        self.assertEqual(report['managers'][0]['username'], 'carol')
+        self.assertEqual([a['username'] for a in
+                          report['managers'][0]['alerts']], ['alice'])
+
+        # runs shorter than MONTHS are not flagged
+        self.assertEqual(alerts._longest_run([1, None, 1, 1, 3], 2.0),
+                         (2, 2))
+
+    def test_rescans_only_revisit_changed_resources(self):
+        alerts.scan(today=self.today)
+        self.assertEqual(alerts.scan(today=self.today).resources, 0)
+
+        self.rating.enjoyment = self.enjoyment['Favorite']
+        self.rating.save()
+        self.assertEqual(list(StaleEnjoyment.objects.values_list(
+            'resource_id', flat=True)), [self.alice.pk])
+        result = alerts.scan(today=self.today)
+        self.assertEqual((result.full, result.resources), (False, 1))
+        self.assertFalse(EnjoymentAlert.objects.exists())
+
+        # new parameters need everyone re-scored
+        self.assertTrue(alerts.scan(threshold=5.0, today=self.today).full)
+        self.assertEqual(EnjoymentAlert.objects.count(), 1)
+
+    def test_command_and_api(self):
+        out = StringIO()
+        call_command('scan_enjoyment', '--start', '2017-01', '--horizon',
+                     '3', stdout=out)
+        self.assertIn('1 alerts', out.getvalue())
+
+        self.client.force_login(
+            User.objects.create(username='dashboard', is_staff=True))
+        response = self.client.get(reverse('api-enjoyment-alerts'))
+        self.assertEqual(response.json()['scan']['horizon'], 3)
+        response = self.client.get(reverse('api-enjoyment-alerts'),
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
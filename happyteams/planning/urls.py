@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf.urls import url
+
+from . import api, views
+
+urlpatterns = [
+    url(r'^export/allocations\.csv$', views.allocation_export,
+        name='allocation-export'),
+    url(r'^search/$', views.search_documents, name='search'),
+    url(r'^api/$', api.index, name='api-index'),
+    url(r'^api/enjoyment-alerts/$', api.enjoyment_alerts,
+        name='api-enjoyment-alerts'),
+] + [
+    url(r'^api/%s/$' % name, api.endpoint_view(endpoint),
+        name='api-%s' % name)
+    for name, endpoint in api.ENDPOINTS.items()
+]
@@ -1,6 +1,68 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.shortcuts import render
+import datetime
 
-# Create your views here.
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import (HttpResponseBadRequest, JsonResponse,
+                         StreamingHttpResponse)
+
+from happyteams.instrumentation import query_budget
+
+from .export import allocation_rows, csv_lines
+from .search import KINDS, search
+
+
+def _month(value, default):
+    if not value:
+        return default
+    return datetime.datetime.strptime(value[:7], '%Y-%m').date()
+
+
+@staff_member_required
+@query_budget(2)
+def allocation_export(request):
+    """Stream the allocation grid from ``start`` through ``end`` (both
+    ``YYYY-MM``, defaulting to the current calendar year) as CSV.
+
+    The rows are produced while the response is sent, after the query
+    budget (which covers the session and user lookups) has been checked.
+    """
+    year = datetime.date.today().year
+    try:
+        start = _month(request.GET.get('start'), datetime.date(year, 1, 1))
+        end = _month(request.GET.get('end'), datetime.date(year, 12, 1))
+    except ValueError:
+        return HttpResponseBadRequest('Months must be formatted as YYYY-MM.')
+    if end < start:
+        return HttpResponseBadRequest('The end month is before the start.')
+
+    response = StreamingHttpResponse(
+        csv_lines(allocation_rows(start, end)), content_type='text/csv')
+    response['Content-Disposition'] = (
+        'attachment; filename="allocations-%s-%s.csv"' % (
+            start.strftime('%Y%m'), end.strftime('%Y%m')))
+    return response
+
+
+@staff_member_required
+@query_budget(3)
+def search_documents(request):
+    """Return the best matches for the words in ``q`` as JSON, optionally
+    only of the given ``kind``s and at most ``limit`` (up to 100).
+    """
+    kinds = request.GET.getlist('kind')
+    if set(kinds) - set(KINDS):
+        return HttpResponseBadRequest(
+            'Kinds must be among %s.' % ', '.join(KINDS))
+    try:
+        limit = min(100, max(1, int(request.GET.get('limit', 20))))
+    except ValueError:
+        return HttpResponseBadRequest('The limit must be a number.')
+
+    query = request.GET.get('q', '')
+    return JsonResponse({
+        'query': query,
+        'results': [result._asdict() for result in
+                    search(query, kinds or None, limit)],
+    })
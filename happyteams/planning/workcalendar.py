@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""Working days and hours per month.
+
+Each ``WorkingCalendar`` keeps, per month, a table of the cumulative number
+of working days by day of the month.  The number of working days (and so
+hours) between any two dates is then a couple of lookups per month spanned
+rather than a walk over every date.  Tables for the configured horizon are
+built when a calendar is created.
+
+Calendars are configured through the ``WORKING_CALENDAR`` setting::
+
+    WORKING_CALENDAR = {
+        'HOURS_PER_DAY': 8,
+        'WEEKEND': (5, 6),  # Monday is 0
+        'HOLIDAYS': ('2017-12-25',),
+        'HORIZON_YEARS': (2, 5),  # years before and after today
+        'UNITS': {
+            # per OrganizationalUnit.abbreviation overrides
+            'OPS': {'HOURS_PER_DAY': 10, 'WEEKEND': (4, 5, 6)},
+        },
+    }
+"""
+from __future__ import unicode_literals
+
+import calendar
+import datetime
+from array import array
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.lru_cache import lru_cache
+
+DEFAULTS = {
+    'HOURS_PER_DAY': 8,
+    'WEEKEND': (5, 6),
+    'HOLIDAYS': (),
+    'HORIZON_YEARS': (2, 5),
+}
+
+
+def _date(value):
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class WorkingCalendar(object):
+
+    def __init__(self, hours_per_day=8, weekend=(5, 6), holidays=()):
+        self.hours_per_day = float(hours_per_day)
+        self.weekend = frozenset(weekend)
+        self.holidays = frozenset(_date(holiday) for holiday in holidays)
+        self._months = {}
+
+    def _table(self, year, month):
+        # table[day] is the number of working days from the 1st through day
+        table = self._months.get((year, month))
+        if table is None:
+            weekday, length = calendar.monthrange(year, month)
+            table = array('H', [0])
+            count = 0
+            for day in range(1, length + 1):
+                if (weekday not in self.weekend and
+                        datetime.date(year, month, day) not in self.holidays):
+                    count += 1
+                table.append(count)
+                weekday = (weekday + 1) % 7
+            self._months[(year, month)] = table
+        return table
+
+    def precompute(self, first, last):
+        """Build the tables for every month from ``first`` through ``last``."""
+        year, month = first.year, first.month
+        while (year, month) <= (last.year, last.month):
+            self._table(year, month)
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+    def working_days(self, month, start=None, end=None):
+        """Return the working days in the month containing ``month``,
+        optionally limited to ``start``-``end`` (clipped to the month).
+        """
+        table = self._table(month.year, month.month)
+        first = 1
+        last = len(table) - 1
+        if start is not None and (start.year, start.month) == (
+                month.year, month.month):
+            first = start.day
+        if end is not None and (end.year, end.month) == (
+                month.year, month.month):
+            last = end.day
+        return table[last] - table[first - 1] if last >= first else 0
+
+    def working_days_between(self, start, end):
+        """Return the working days from ``start`` through ``end``."""
+        total = 0
+        year, month = start.year, start.month
+        while (year, month) <= (end.year, end.month):
+            total += self.working_days(
+                datetime.date(year, month, 1), start, end)
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return total
+
+    def capacity(self, month):
+        """Return the working hours in the month containing ``month``."""
+        return self.working_days(month) * self.hours_per_day
+
+    def hours_between(self, start, end):
+        """Return the working hours from ``start`` through ``end``."""
+        return self.working_days_between(start, end) * self.hours_per_day
+
+
+def _options(unit=None):
+    options = dict(DEFAULTS)
+    configured = getattr(settings, 'WORKING_CALENDAR', {})
+    options.update((key, value) for key, value in configured.items()
+                   if key != 'UNITS')
+    if unit is not None:
+        options.update(configured.get('UNITS', {}).get(unit, {}))
+    return options
+
+
+def unit_calendars():
+    """Return whether any unit overrides the default calendar."""
+    return bool(getattr(settings, 'WORKING_CALENDAR', {}).get('UNITS'))
+
+
+@lru_cache(maxsize=64)
+def get_calendar(unit=None):
+    """Return the (cached) calendar for a unit abbreviation, or the default
+    calendar when ``unit`` is ``None`` or has no overrides.
+    """
+    options = _options(unit)
+    if unit is not None and options == _options():
+        return get_calendar()
+    working_calendar = WorkingCalendar(
+        hours_per_day=options['HOURS_PER_DAY'],
+        weekend=options['WEEKEND'],
+        holidays=options['HOLIDAYS'])
+    before, after = options['HORIZON_YEARS']
+    today = datetime.date.today()
+    working_calendar.precompute(
+        datetime.date(today.year - before, 1, 1),
+        datetime.date(today.year + after, 12, 1))
+    return working_calendar
+
+
+@receiver(setting_changed)
+def reset_calendars(setting, **kwargs):
+    if setting == 'WORKING_CALENDAR':
+        get_calendar.cache_clear()
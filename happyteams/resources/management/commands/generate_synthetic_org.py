@@ -0,0 +1,56 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from planning.synthetic import SyntheticOrg
+
+def month(value):
+    return datetime.datetime.strptime(value[:7], '%Y-%m').date()
+
+class Command(BaseCommand):
+    help = ('Builds a deterministic synthetic organization (units, '
+            'resources, skills, projects, budget increments and '
+            'commitments) for load testing.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--resources', type=int, default=1000,
+            help='Number of resources to create.')
+        parser.add_argument('--units', type=int,
+            help='Number of organizational units (default: resources / 25).')
+        parser.add_argument('--skills', type=int, default=50,
+            help='Number of skills.')
+        parser.add_argument('--projects', type=int,
+            help='Number of projects (default: resources / 5).')
+        parser.add_argument('--commitments', type=int, default=3,
+            help='Commitments per resource.')
+        parser.add_argument('--start', type=month,
+            default=datetime.date(2017, 1, 1),
+            help='First month projects may run in, as YYYY-MM.')
+        parser.add_argument('--months', type=int, default=24,
+            help='Number of months projects may run in.')
+        parser.add_argument('--seed', type=int, default=0,
+            help='Random seed; the same seed gives the same organization.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+            help='Number of rows written per insert.')
+        parser.add_argument('--no-rollups', action='store_true',
+            help='Skip rebuilding the monthly metrics afterwards.')
+
+    def handle(self, *args, **options):
+        org = SyntheticOrg(
+            resources=options['resources'],
+            units=options['units'],
+            skills=options['skills'],
+            projects=options['projects'],
+            commitments=options['commitments'],
+            start=options['start'],
+            months=options['months'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+        ).generate(refresh=not options['no_rollups'])
+
+        for name, count in sorted(org.counts.items()):
+            self.stdout.write('%s\t%d' % (name, count))
+        self.stdout.write(
+            self.style.SUCCESS('Successfully generated a synthetic '
+                               'organization of %d resources.' %
+                               options['resources'])
+        )
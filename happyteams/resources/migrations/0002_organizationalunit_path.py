@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 21:46
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def populate_paths(apps, schema_editor):
+    OrganizationalUnit = apps.get_model('resources', 'OrganizationalUnit')
+    parents = dict(OrganizationalUnit.objects.values_list('pk', 'parent_id'))
+    paths = {}
+
+    def path(pk):
+        if pk not in paths:
+            parent = parents[pk]
+            paths[pk] = '%s%s/' % (path(parent) if parent else '', pk)
+        return paths[pk]
+
+    for pk in parents:
+        OrganizationalUnit.objects.filter(pk=pk).update(
+            path=path(pk), depth=path(pk).count('/') - 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organizationalunit',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='organizationalunit',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 21:54
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0002_organizationalunit_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organizationalunit',
+            name='hourly_rate',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Default hourly rate for resources in this unit (and any sub-unit without its own rate).', max_digits=8, null=True),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='hourly_rate',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text="Leave blank to use the unit's rate.", max_digits=8, null=True),
+        ),
+    ]
@@ -1,13 +1,22 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
 from django.contrib.auth.models import User
 
 import datetime
 
 
 class OrganizationalUnit(models.Model):
+    """A node in the organization's tree.  ``path`` holds the primary keys
+    from the root down to this unit (e.g. ``1/4/9/``) and ``depth`` the
+    number of units above it, so subtree and ancestor lookups are a single
+    query regardless of how deep the tree is.
+    """
+
     name = models.CharField(max_length=32)
     abbreviation = models.CharField(max_length=4)
     primary_manager = models.ForeignKey(User, null=True, blank=True,
@@ -15,20 +24,85 @@ class OrganizationalUnit(models.Model):
     secondary_manager = models.ForeignKey(User, null=True, blank=True,
         related_name='supports')
     parent = models.ForeignKey('self', null=True, blank=True)
+    hourly_rate = models.DecimalField(max_digits=8, decimal_places=2,
+        null=True, blank=True,
+        help_text='Default hourly rate for resources in this unit (and any '
+                  'sub-unit without its own rate).')
+    path = models.CharField(max_length=255, db_index=True, editable=False,
+        default='')
+    depth = models.PositiveIntegerField(default=0, editable=False)
+
+    def clean(self):
+        if (self.path and self.parent_id is not None and
+                self.parent.path.startswith(self.path)):
+            raise ValidationError(
+                'A unit cannot be moved under itself or one of its '
+                'sub-units.')
+
+    def save(self, *args, **kwargs):
+        self.clean()
+        with transaction.atomic():
+            old_path = self.path
+            if self.pk is None:
+                super(OrganizationalUnit, self).save(*args, **kwargs)
+                kwargs = {}
+            parent_path = self.parent.path if self.parent_id else ''
+            self.path = '%s%s/' % (parent_path, self.pk)
+            self.depth = self.path.count('/') - 1
+            super(OrganizationalUnit, self).save(*args, **kwargs)
+
+            if old_path and old_path != self.path:
+                # re-parented; rewrite the prefix of every descendant's path
+                OrganizationalUnit.objects.filter(
+                    path__startswith=old_path).exclude(pk=self.pk).update(
+                        path=Concat(Value(self.path),
+                                    Substr('path', len(old_path) + 1)),
+                        depth=F('depth') + (
+                            self.path.count('/') - old_path.count('/')))
+
+    def ancestors(self):
+        """Units above this one, from the root down."""
+        pks = self.path.split('/')[:-2]
+        return OrganizationalUnit.objects.filter(
+            pk__in=pks).order_by('depth')
+
+    def descendants(self, include_self=False):
+        """Every unit below this one, ordered depth first."""
+        units = OrganizationalUnit.objects.filter(
+            path__startswith=self.path).order_by('path')
+        if not include_self:
+            units = units.exclude(pk=self.pk)
+        return units
+
+    def resources_in_subtree(self):
+        """Resources in this unit or any unit below it."""
+        return Resource.objects.filter(unit__path__startswith=self.path)
 
 
 class Resource(models.Model):
     user = models.OneToOneField(User)
     unit = models.ForeignKey(OrganizationalUnit)
+    hourly_rate = models.DecimalField(max_digits=8, decimal_places=2,
+        null=True, blank=True,
+        help_text='Leave blank to use the unit\'s rate.')
 
     def coverage(self, month=datetime.date.today()):
         # calculate the coverage for the employee for the given month
-        return 1.0
+        from planning.coverage import coverage_matrix
+        from planning.metriccache import cached
+
+        return cached('resource', self.pk, 'coverage', month, lambda:
+            coverage_matrix([self.pk], month).get(self.pk, month))
 
     def enjoyment(self, month=datetime.date.today()):
         # based on the resources assignments for the given month, what is
         # their level of enjoyment in their work?
-        return 3.0
+        from planning.enjoyment import score_enjoyment
+        from planning.metriccache import cached
+
+        return cached('resource', self.pk, 'enjoyment', month, lambda:
+            score_enjoyment(month, resources=[self.pk]).resource(
+                self.pk, month))
 
 
 class Skill(models.Model):
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import skillindex
+from .models import Resource, ResourceSkill, SkillEnjoyment, SkillLevel
+
+
+@receiver(post_save, sender=Resource)
+@receiver(post_save, sender=ResourceSkill)
+@receiver(post_save, sender=SkillLevel)
+@receiver(post_save, sender=SkillEnjoyment)
+@receiver(post_delete, sender=Resource)
+@receiver(post_delete, sender=ResourceSkill)
+@receiver(post_delete, sender=SkillLevel)
+@receiver(post_delete, sender=SkillEnjoyment)
+def invalidate_skill_index(sender, instance, raw=False, **kwargs):
+    # deleting a resource sends post_delete for its ratings too
+    skillindex.invalidate()
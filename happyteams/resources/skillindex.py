@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""In-memory skill search.
+
+Every resource is given a bit position and, for each skill, the index keeps
+bitsets (plain Python integers) of the resources at or above each skill
+rank and each enjoyment value.  A multi-skill search is then a handful of
+dictionary lookups and bitwise ANDs, after which only the matching
+resources are checked for free capacity.
+
+The index is built once per process on first use.  Saving or deleting a
+``Resource``, ``ResourceSkill``, ``SkillLevel`` or ``SkillEnjoyment`` bumps a
+shared version (see ``resources.signals`` and
+``planning.metriccache.version``), and every process rebuilds its index when
+it sees the version change.  Queryset updates and ``bulk_create`` send no
+signals; code writing ratings that way calls ``invalidate`` itself.
+"""
+from __future__ import unicode_literals
+
+import numbers
+from bisect import bisect_left
+
+from planning import metriccache
+
+from .models import Resource, ResourceSkill, SkillEnjoyment
+
+VERSION = 'skillindex'
+
+# (shared version it was built at, SkillIndex)
+_index = None
+
+
+def _thresholds(values):
+    # {threshold: bits of everyone at or above threshold}
+    levels = sorted(set(value for value, _ in values))
+    return dict(
+        (level, _union(bit for value, bit in values if value >= level))
+        for level in levels)
+
+
+def _union(bits):
+    total = 0
+    for bit in bits:
+        total |= bit
+    return total
+
+
+def _at_least(thresholds, minimum):
+    levels = sorted(thresholds)
+    position = bisect_left(levels, minimum)
+    if position == len(levels):
+        return 0
+    return thresholds[levels[position]]
+
+
+class SkillIndex(object):
+
+    def __init__(self):
+        self.resource_ids = list(
+            Resource.objects.order_by('pk').values_list('pk', flat=True))
+        self.position = dict(
+            (pk, i) for i, pk in enumerate(self.resource_ids))
+        self.enjoyment_values = dict(
+            SkillEnjoyment.objects.values_list('slug', 'value'))
+
+        skills, ranks, enjoyments = {}, {}, {}
+        rows = ResourceSkill.objects.values_list(
+            'resource_id', 'skill_id', 'skill_level__rank',
+            'enjoyment__value')
+        for resource_id, skill_id, rank, enjoyment in rows.iterator():
+            bit = 1 << self.position[resource_id]
+            skills[skill_id] = skills.get(skill_id, 0) | bit
+            if rank is not None:
+                ranks.setdefault(skill_id, []).append((rank, bit))
+            if enjoyment is not None:
+                enjoyments.setdefault(skill_id, []).append((enjoyment, bit))
+
+        self.skills = skills
+        self.ranks = dict((skill_id, _thresholds(values))
+                          for skill_id, values in ranks.items())
+        self.enjoyments = dict((skill_id, _thresholds(values))
+                               for skill_id, values in enjoyments.items())
+
+    def match(self, skill, min_rank=None, min_enjoyment=None):
+        """Return the bitset of resources with ``skill`` at or above
+        ``min_rank`` and ``min_enjoyment`` (a value or a slug).  Raises
+        ``ValueError`` for an unknown enjoyment slug.
+        """
+        skill_id = getattr(skill, 'pk', skill)
+        bits = self.skills.get(skill_id, 0)
+        if min_rank is not None:
+            bits &= _at_least(self.ranks.get(skill_id, {}), min_rank)
+        if min_enjoyment is not None:
+            if not isinstance(min_enjoyment, numbers.Number):
+                try:
+                    min_enjoyment = self.enjoyment_values[min_enjoyment]
+                except KeyError:
+                    raise ValueError(
+                        'Unknown enjoyment level "%s".' % min_enjoyment)
+            bits &= _at_least(self.enjoyments.get(skill_id, {}),
+                              min_enjoyment)
+        return bits
+
+    def search(self, *criteria):
+        """Return the bitset of resources matching every criterion, each a
+        dict of ``match`` keyword arguments.
+        """
+        bits = (1 << len(self.resource_ids)) - 1
+        for criterion in criteria:
+            bits &= self.match(**criterion)
+            if not bits:
+                break
+        return bits
+
+    def ids(self, bits):
+        """Return the resource primary keys set in ``bits``."""
+        found = []
+        while bits:
+            lowest = bits & -bits
+            found.append(self.resource_ids[lowest.bit_length() - 1])
+            bits ^= lowest
+        return found
+
+
+def get_index():
+    """Return this process's index, building it if needed."""
+    global _index
+    # read before building, so a write committed meanwhile forces a rebuild
+    current = metriccache.version(VERSION)
+    if _index is None or _index[0] != current:
+        _index = (current, SkillIndex())
+    return _index[1]
+
+
+def invalidate():
+    """Make every process rebuild its index, now and once the current
+    transaction commits.
+    """
+    metriccache.bump(VERSION)
+
+
+def find_resources(criteria, start=None, end=None, free=0.0):
+    """Return the primary keys of resources matching every criterion.
+
+    When ``start`` is given only resources with at least ``free`` of each
+    month from ``start`` through ``end`` uncommitted are returned.
+    """
+    index = get_index()
+    resource_ids = index.ids(index.search(*criteria))
+    if start is None or not resource_ids:
+        return resource_ids
+
+    from planning.coverage import coverage_matrix
+
+    matrix = coverage_matrix(resource_ids, start, end)
+    return [pk for pk, row in zip(matrix.resource_ids, matrix.values)
+            if 1.0 - max(row) >= free]
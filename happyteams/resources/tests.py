@@ -1,6 +1,153 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.test import TestCase
 
-# Create your tests here.
+from planning import metriccache
+
+from . import skillindex
+from .models import (OrganizationalUnit, Resource, ResourceSkill, Skill,
+                     SkillEnjoyment, SkillLevel)
+from .skillindex import find_resources, get_index
+
+
+class OrganizationalUnitTreeTests(TestCase):
+
+    def setUp(self):
+        self.company = self.unit('Company')
+        self.engineering = self.unit('Engineering', self.company)
+        self.web = self.unit('Web', self.engineering)
+        self.data = self.unit('Data', self.engineering)
+        self.sales = self.unit('Sales', self.company)
+
+    def unit(self, name, parent=None):
+        return OrganizationalUnit.objects.create(
+            name=name, abbreviation=name[:4].upper(), parent=parent)
+
+    def test_paths_and_depth(self):
+        self.assertEqual(self.web.path, '%s/%s/%s/' % (
+            self.company.pk, self.engineering.pk, self.web.pk))
+        self.assertEqual(self.web.depth, 2)
+        self.assertEqual(self.company.depth, 0)
+
+    def test_single_query_lookups(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(list(self.web.ancestors()),
+                             [self.company, self.engineering])
+        with self.assertNumQueries(1):
+            self.assertEqual(list(self.company.descendants()),
+                             [self.engineering, self.web, self.data,
+                              self.sales])
+        resource = Resource.objects.create(
+            user=User.objects.create(username='alice'), unit=self.data)
+        with self.assertNumQueries(1):
+            self.assertEqual(list(self.engineering.resources_in_subtree()),
+                             [resource])
+        self.assertFalse(self.sales.resources_in_subtree().exists())
+
+    def test_reparent_moves_subtree(self):
+        self.engineering.parent = self.sales
+        self.engineering.save()
+        self.web.refresh_from_db()
+        self.assertEqual(self.web.path, '%s/%s/%s/%s/' % (
+            self.company.pk, self.sales.pk, self.engineering.pk, self.web.pk))
+        self.assertEqual(self.web.depth, 3)
+        self.assertEqual(list(self.sales.descendants()),
+                         [self.engineering, self.web, self.data])
+
+    def test_cannot_move_under_descendant(self):
+        self.engineering.parent = self.web
+        with self.assertRaises(ValidationError):
+            self.engineering.save()
+
+
+class SkillIndexTests(TestCase):
+
+    def setUp(self):
+        unit = OrganizationalUnit.objects.create(
+            name='Engineering', abbreviation='ENG')
+        self.python = Skill.objects.create(name='Python')
+        self.sql = Skill.objects.create(name='SQL')
+        self.levels = dict(
+            (rank, SkillLevel.objects.create(
+                skill=self.python, rank=rank, description=str(rank)))
+            for rank in (1, 2, 3, 4))
+        self.enjoy = SkillEnjoyment.objects.create(
+            slug='Enjoy', value=4, description='Enjoy')
+        self.little = SkillEnjoyment.objects.create(
+            slug='Little', value=1, description='Little')
+        self.resources = [
+            Resource.objects.create(
+                user=User.objects.create(username=name), unit=unit)
+            for name in ('alice', 'bob', 'carol')]
+        alice, bob, carol = self.resources
+        self.rate(alice, self.python, 4, self.enjoy)
+        self.rate(bob, self.python, 3, self.little)
+        self.rate(carol, self.python, 2, self.enjoy)
+        self.rate(alice, self.sql)
+        self.rate(bob, self.sql)
+
+    def rate(self, resource, skill, rank=None, enjoyment=None):
+        return ResourceSkill.objects.create(
+            resource=resource, skill=skill, enjoyment=enjoyment,
+            skill_level=self.levels[rank] if rank else None)
+
+    def ids(self, *names):
+        return [r.pk for r in self.resources if r.user.username in names]
+
+    def test_multi_criteria_search(self):
+        self.assertEqual(find_resources([
+            {'skill': self.python, 'min_rank': 3},
+            {'skill': self.sql},
+        ]), self.ids('alice', 'bob'))
+        self.assertEqual(find_resources([
+            {'skill': self.python, 'min_rank': 3, 'min_enjoyment': 'Enjoy'},
+            {'skill': self.sql},
+        ]), self.ids('alice'))
+        self.assertEqual(find_resources([
+            {'skill': self.python, 'min_enjoyment': 4},
+        ]), self.ids('alice', 'carol'))
+        self.assertEqual(find_resources([
+            {'skill': self.python, 'min_enjoyment': 3.5},
+        ]), self.ids('alice', 'carol'))
+        self.assertEqual(find_resources([
+            {'skill': self.python, 'min_enjoyment': Decimal('4')},
+        ]), self.ids('alice', 'carol'))
+        with self.assertRaises(ValueError):
+            find_resources([{'skill': self.python, 'min_enjoyment': 'Bliss'}])
+
+    def test_searches_do_not_query_once_built(self):
+        get_index()
+        with self.assertNumQueries(0):
+            find_resources([{'skill': self.python, 'min_rank': 2}])
+
+    def test_saving_a_resource_skill_invalidates(self):
+        index = get_index()
+        self.rate(self.resources[2], self.sql)
+        self.assertIsNot(get_index(), index)
+        self.assertEqual(find_resources([{'skill': self.sql}]),
+                         self.ids('alice', 'bob', 'carol'))
+
+    def test_other_writes_invalidate(self):
+        get_index()
+        self.little.value = 5
+        self.little.save()
+        self.assertEqual(find_resources([
+            {'skill': self.python, 'min_enjoyment': 5}]), self.ids('bob'))
+
+        dave = Resource.objects.create(
+            user=User.objects.create(username='dave'),
+            unit=self.resources[0].unit)
+        self.assertIn(dave.pk, get_index().resource_ids)
+        self.resources[1].delete()
+        self.assertEqual(find_resources([{'skill': self.sql}]),
+                         self.ids('alice'))
+
+        # a build from before another process's bump is not reused
+        index = get_index()
+        metriccache.bump(skillindex.VERSION)
+        self.assertIsNot(get_index(), index)